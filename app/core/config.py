@@ -1,4 +1,9 @@
 from dotenv import load_dotenv
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from typing_extensions import Annotated
+from pydantic import field_validator, model_validator
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
 import os
 
 load_dotenv()
@@ -13,40 +18,66 @@ DB_CONFIG = {
 
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 
-# Configuración para el servicio de mapas
-MAP_CONFIG = {
-    "sheetdb_url": os.getenv("API_SHEET_URL"),
-    "hotel_melia_lima_coords": (-12.0926987, -77.0552319),
-    "distancia_agrupamiento_km": 0.5,
-    "earth_radius_km": 6371.0
-}
+class Configuracion(BaseSettings):
+    """
+    Configuración del servicio de mapas, leída de variables de entorno (o .env)
+    y validada una sola vez al iniciar la aplicación
+    """
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    environment: str = "development"
+    cors_origins: Annotated[List[str], NoDecode] = []
+    google_maps_api_key: Optional[str] = None
+    api_sheet_url: Optional[str] = None
+    hotel_melia_lima_coords: Annotated[Optional[Tuple[float, float]], NoDecode] = (-12.0926987, -77.0552319)
+    hotel_melia_lima_direccion: Optional[str] = None
+
+    @field_validator("cors_origins", mode="before")
+    @classmethod
+    def _separar_origenes(cls, valor):
+        if isinstance(valor, str):
+            valor = [origen.strip() for origen in valor.split(",") if origen.strip()]
+        for origen in valor:
+            if not (origen.startswith("http://") or origen.startswith("https://")):
+                raise ValueError(
+                    f"Origen inválido en CORS_ORIGINS: {origen}. "
+                    "Los orígenes deben comenzar con http:// o https://"
+                )
+        return valor
+
+    @field_validator("hotel_melia_lima_coords", mode="before")
+    @classmethod
+    def _parsear_coordenadas(cls, valor):
+        if valor is None or isinstance(valor, (tuple, list)):
+            return valor
+        if not str(valor).strip():
+            return None
+        try:
+            lat, lon = map(float, str(valor).split(","))
+        except ValueError:
+            raise ValueError(f"HOTEL_MELIA_LIMA_COORDS debe tener el formato latitud,longitud: {valor}")
+        if abs(lat) > 90 or abs(lon) > 180:
+            raise ValueError(f"HOTEL_MELIA_LIMA_COORDS fuera de rango: {valor}")
+        return lat, lon
+
+    @model_validator(mode="after")
+    def _validar_origen(self):
+        if self.hotel_melia_lima_coords is None and not self.hotel_melia_lima_direccion:
+            raise ValueError("HOTEL_MELIA_LIMA_COORDS vacía: define las coordenadas o HOTEL_MELIA_LIMA_DIRECCION")
+        return self
+
+@lru_cache(maxsize=1)
+def obtener_configuracion() -> Configuracion:
+    """Configuración validada (se lee del entorno en la primera llamada)"""
+    return Configuracion()
 
 # Configuración de CORS desde variables de entorno
 def get_cors_origins():
     """Retorna los orígenes permitidos desde variables de entorno"""
-    cors_origins_env = os.getenv("CORS_ORIGINS")
-    
-    if not cors_origins_env:
+    origins = obtener_configuracion().cors_origins
+    if not origins:
         raise ValueError(
             "La variable de entorno CORS_ORIGINS debe estar configurada. "
             "Ejemplo: CORS_ORIGINS=https://make.powerapps.com,https://apps.powerapps.com"
         )
-    
-    origins = [origin.strip() for origin in cors_origins_env.split(",") if origin.strip()]
-    
-    if not origins:
-        raise ValueError(
-            "CORS_ORIGINS no puede estar vacío. "
-            "Debe contener al menos un origen válido."
-        )
-    
-    # Validar que los orígenes sean URLs válidas
-    for origin in origins:
-        if not (origin.startswith("http://") or origin.startswith("https://")):
-            raise ValueError(
-                f"Origen inválido en CORS_ORIGINS: {origin}. "
-                "Los orígenes deben comenzar con http:// o https://"
-            )
-    
     return origins
-
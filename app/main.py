@@ -1,8 +1,17 @@
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-import os
 import logging
+
+# Cargar variables de entorno antes de importar los módulos que leen sus constantes
+load_dotenv()
+
 from app.routers.mapa import router as mapa_router
+from app.routers.metricas import router as metricas_router
+from app.services.asincrono import detener_ejecutor
+from app.services.clientes import cerrar_clientes
+from app.services.precarga import dependencias_cargadas, iniciar_precarga
+from app.services.precomputo import gestor_mapa
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import get_cors_origins
 from fastapi.staticfiles import StaticFiles
@@ -13,10 +22,20 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-# Cargar variables de entorno
-load_dotenv()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cargar en segundo plano las dependencias pesadas y precalcular el mapa. Los clientes
+    # HTTP se crean y el origen se geocodifica en su primer uso (dentro de la construcción),
+    # así el arranque y /health no esperan a Google ni a la importación de numpy
+    iniciar_precarga()
+    gestor_mapa.iniciar()
+    yield
+    gestor_mapa.detener()
+    detener_ejecutor()
+    cerrar_clientes()
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Mapa de generacion de rutas - juego",
     version="1.0.0",
     description="Juego interactivo para generar rutas optimas",
@@ -41,14 +60,20 @@ app.add_middleware(
         "Authorization",
         "X-Requested-With",
     ],
-    expose_headers=["Content-Length", "Content-Range"],
+    expose_headers=["Content-Length", "Content-Range", "Server-Timing"],
     max_age=600,  # Cache preflight requests for 10 minutes
 )
 
 print("CORS Origins habilitados:", get_cors_origins())
 
 app.include_router(mapa_router)
+app.include_router(metricas_router)
 
 @app.get("/")
 def root():
-    return {"mensaje": "API Planificacion ODS - Ruta Optima funcionando"}
\ No newline at end of file
+    return {"mensaje": "API Planificacion ODS - Ruta Optima funcionando"}
+
+@app.get("/health")
+def health():
+    """Chequeo liviano para el balanceador: no toca SheetDB, Google ni las dependencias pesadas"""
+    return {"status": "ok", "dependencias_cargadas": dependencias_cargadas()}
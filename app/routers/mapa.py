@@ -1,7 +1,16 @@
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, HTTPException, Response, Query, Request
 from fastapi.responses import HTMLResponse
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
 import logging
-from app.services.mapa_rutas import generar_mapa_rutas, leer_archivo_html
+import time
+from app.services.asincrono import ejecutar_bloqueante
+from app.services.geocodificacion import cache_geocodificacion
+from app.services.hoja_sheetdb import sincronizador_hoja
+from app.core.config import obtener_configuracion
+from app.services.metricas import metricas, server_timing
+from app.services.opciones import DISTANCIA_AGRUPAMIENTO_KM
+from app.services.precomputo import OpcionesMapa, RenderMapa, gestor_mapa
 from app.services.exceptions import ServicioExternoError
 
 # Configurar logging
@@ -9,47 +18,55 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/mapa", tags=["Mapa de Rutas"])
 
-@router.get("/rutas", response_class=HTMLResponse)
-async def obtener_mapa_rutas():
+def _no_modificado(request: Request, etag: str, generado_en: float) -> bool:
+    """Indica si el cliente ya tiene esta versión del mapa (If-None-Match / If-Modified-Since)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [v.strip() for v in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(generado_en) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _respuesta_render(request: Request, render: RenderMapa, media_type: str, inicio: float) -> Response:
     """
-    Endpoint para generar y obtener el mapa de rutas optimizadas
-    
-    Este endpoint:
-    1. Obtiene datos desde Google Sheets
-    2. Convierte los registros en puntos de visita
-    3. Agrupa puntos geográficamente cercanos
-    4. Calcula rutas optimizadas usando Google Maps
-    5. Genera un mapa interactivo con todas las rutas
-    6. Retorna el archivo HTML del mapa
-    
-    Returns:
-        HTMLResponse: Contenido HTML del mapa interactivo
-        
-    Raises:
-        HTTPException: Si hay errores en el proceso de generación
+    Respuesta con ETag y Last-Modified (304 si el cliente ya tiene esta versión),
+    enviando la variante precomprimida que acepte el cliente. Server-Timing detalla
+    las etapas si el mapa se construyó para esta solicitud.
     """
+    if render.generado_en >= inicio:
+        timing = server_timing({**render.etapas, "total": time.time() - inicio})
+    else:
+        timing = server_timing({"total": time.time() - inicio}, cache="mapa precalculado")
+    headers = {
+        "ETag": render.etag,
+        "Last-Modified": formatdate(render.generado_en, usegmt=True),
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+        "Server-Timing": timing,
+    }
+    if _no_modificado(request, render.etag, render.generado_en):
+        return Response(status_code=304, headers=headers)
+    
+    contenido, codificacion = render.cuerpo(request.headers.get("accept-encoding", ""))
+    if codificacion:
+        headers["Content-Encoding"] = codificacion
+    return Response(content=contenido, status_code=200, headers=headers, media_type=media_type)
+
+async def _servir_mapa(request: Request, opciones: OpcionesMapa, fresh: bool, media_type: str) -> Response:
+    """Obtiene el render de las opciones y traduce los errores a respuestas HTTP"""
+    inicio = time.time()
     try:
-        logger.info("Iniciando generación de mapa de rutas...")
-        
-        # Generar el mapa de rutas
-        archivo_html = generar_mapa_rutas()
-        
-        # Leer el contenido del archivo HTML
-        contenido_html = leer_archivo_html(archivo_html)
-        
-        logger.info("Mapa de rutas generado y entregado exitosamente")
-        
-        # Retornar el contenido HTML
-        return HTMLResponse(
-            content=contenido_html,
-            status_code=200,
-            headers={
-                "Content-Type": "text/html; charset=utf-8",
-                "Cache-Control": "no-cache, no-store, must-revalidate",
-                "Pragma": "no-cache",
-                "Expires": "0"
-            }
-        )
+        render = await gestor_mapa.obtener_async(opciones, fresco=fresh)
+        respuesta = _respuesta_render(request, render, media_type, inicio)
+        metricas.observar("mapa_solicitud_segundos", time.time() - inicio, "Duración de las solicitudes de mapas",
+                          formato=opciones.formato, estado=str(respuesta.status_code))
+        logger.info(f"Mapa de rutas ({opciones.formato}) entregado exitosamente")
+        return respuesta
         
     except ServicioExternoError as e:
         logger.error(f"Error de servicio externo: {e}")
@@ -65,6 +82,116 @@ async def obtener_mapa_rutas():
             detail=f"Error interno del servidor: {str(e)}"
         )
 
+@router.get("/rutas", response_class=HTMLResponse)
+async def obtener_mapa_rutas(
+    request: Request,
+    incremental: Optional[bool] = Query(
+        None,
+        description="Recalcular solo los grupos afectados por cambios en la hoja (por defecto MAPA_INCREMENTAL)"
+    ),
+    optimizador: Optional[str] = Query(
+        None,
+        pattern="^(google|local|hibrido)$",
+        description="Orden de cada grupo: google, local (sin API) o hibrido (orden local, geometría de Google)"
+    ),
+    fresh: bool = Query(
+        False,
+        description="Esperar una reconstrucción en lugar de servir el último mapa generado"
+    ),
+    plan: str = Query(
+        "grupos",
+        pattern="^(grupos|flota)$",
+        description="grupos: un viaje por grupo cercano; flota: reparto entre los vehículos y depósitos de PLAN_FLOTA"
+    ),
+    ventana: Optional[str] = Query(
+        None,
+        pattern="^(ninguna|dia|turno|horas)$",
+        description="Agrupar por FechaHora antes que por cercanía: dia, turno (TURNOS_INICIO_H) o bloques de N horas "
+                    "(por defecto VENTANA_TIEMPO). Solo con plan=grupos; el mapa se calcula completo"
+    ),
+    horas: Optional[float] = Query(
+        None,
+        gt=0,
+        le=168,
+        description="Largo de la ventana con ventana=horas (por defecto VENTANA_HORAS)"
+    )
+):
+    """
+    Endpoint para obtener el mapa de rutas optimizadas
+    
+    Proceso de construcción del mapa:
+    1. Obtiene datos desde Google Sheets
+    2. Convierte los registros en puntos de visita
+    3. Agrupa puntos geográficamente cercanos
+    4. Calcula rutas optimizadas usando Google Maps
+    5. Genera un mapa interactivo con todas las rutas
+    
+    Con plan=flota los puntos se reparten entre los vehículos de varios depósitos
+    (capacidad y jornada) y se dibuja una ruta por vehículo.
+    
+    Con ventana=dia, turno u horas los grupos se forman por cercanía dentro de cada
+    ventana de FechaHora: las visitas de días o turnos distintos no comparten ruta.
+    
+    Este endpoint retorna al instante el último mapa generado (con ETag y
+    Last-Modified) y, si es viejo, lo revalida en segundo plano. Si aún no hay
+    mapa, o con fresh=1, espera la construcción sin bloquear el servidor; las
+    solicitudes simultáneas comparten una sola construcción.
+    
+    Returns:
+        HTMLResponse: Contenido HTML del mapa interactivo (304 si el cliente ya lo tiene)
+        
+    Raises:
+        HTTPException: Si hay errores en el proceso de generación
+    """
+    opciones = OpcionesMapa.desde_parametros(incremental, optimizador, plan=plan, ventana=ventana, horas=horas)
+    return await _servir_mapa(request, opciones, fresh, "text/html; charset=utf-8")
+
+@router.get("/rutas.geojson")
+async def obtener_geojson_rutas(
+    request: Request,
+    incremental: Optional[bool] = Query(
+        None,
+        description="Recalcular solo los grupos afectados por cambios en la hoja (por defecto MAPA_INCREMENTAL)"
+    ),
+    optimizador: Optional[str] = Query(
+        None,
+        pattern="^(google|local|hibrido)$",
+        description="Orden de cada grupo: google, local (sin API) o hibrido (orden local, geometría de Google)"
+    ),
+    fresh: bool = Query(
+        False,
+        description="Esperar una reconstrucción en lugar de servir los últimos datos generados"
+    ),
+    plan: str = Query(
+        "grupos",
+        pattern="^(grupos|flota)$",
+        description="grupos: un viaje por grupo cercano; flota: reparto entre los vehículos y depósitos de PLAN_FLOTA"
+    ),
+    ventana: Optional[str] = Query(
+        None,
+        pattern="^(ninguna|dia|turno|horas)$",
+        description="Agrupar por FechaHora antes que por cercanía: dia, turno (TURNOS_INICIO_H) o bloques de N horas "
+                    "(por defecto VENTANA_TIEMPO). Solo con plan=grupos; el mapa se calcula completo"
+    ),
+    horas: Optional[float] = Query(
+        None,
+        gt=0,
+        le=168,
+        description="Largo de la ventana con ventana=horas (por defecto VENTANA_HORAS)"
+    )
+):
+    """
+    Endpoint con los grupos, puntos en orden de visita y polilíneas codificadas como GeoJSON.
+    Lo consume el cliente estático /static/mapa_rutas.html, que dibuja el mapa en el navegador.
+    Mismo ciclo de construcción, ETag y compresión que /mapa/rutas.
+    
+    Returns:
+        Response: FeatureCollection (304 si el cliente ya la tiene)
+    """
+    opciones = OpcionesMapa.desde_parametros(incremental, optimizador, formato="geojson", plan=plan,
+                                             ventana=ventana, horas=horas)
+    return await _servir_mapa(request, opciones, fresh, "application/geo+json")
+
 @router.get("/status")
 async def estado_mapa_rutas():
     """
@@ -73,29 +200,32 @@ async def estado_mapa_rutas():
     Returns:
         dict: Estado del servicio y configuración
     """
+    from app.services.mapa_rutas import cache_rutas, verificar_sheetdb
+
     try:
-        import os
-        import requests
+        configuracion = obtener_configuracion()
         
         # Verificar configuración
         config_status = {
-            "google_maps_api_key": "configurada" if os.getenv('GOOGLE_MAPS_API_KEY') else "no configurada",
-            "sheetdb_url": os.getenv("API_SHEET_URL"),
-            "hotel_melia_lima_coords": "(-12.0926987, -77.0552319)",
-            "distancia_agrupamiento_km": 0.5
+            "environment": configuracion.environment,
+            "google_maps_api_key": "configurada" if configuracion.google_maps_api_key else "no configurada",
+            "sheetdb_url": configuracion.api_sheet_url,
+            "hotel_melia_lima_coords": configuracion.hotel_melia_lima_coords,
+            "hotel_melia_lima_direccion": configuracion.hotel_melia_lima_direccion,
+            "distancia_agrupamiento_km": DISTANCIA_AGRUPAMIENTO_KM
         }
         
-        # Verificar conectividad con SheetDB
-        try:
-            response = requests.get(os.getenv("API_SHEET_URL"), timeout=10)
-            sheetdb_status = "conectado" if response.status_code == 200 else f"error {response.status_code}"
-        except Exception as e:
-            sheetdb_status = f"error de conexión: {str(e)}"
+        # Verificar conectividad con SheetDB con el conteo de filas (fuera del event loop)
+        sheetdb_status = await ejecutar_bloqueante(verificar_sheetdb)
         
         return {
             "status": "operativo",
             "configuracion": config_status,
             "sheetdb_status": sheetdb_status,
+            "hoja": sincronizador_hoja.estado(),
+            "cache_rutas": cache_rutas.estadisticas(),
+            "cache_geocodificacion": cache_geocodificacion.estadisticas(),
+            "mapa": gestor_mapa.estado(),
             "mensaje": "Servicio de mapas disponible"
         }
         
@@ -0,0 +1,53 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+import logging
+from app.services.clientes import contadores_api
+from app.services.geocodificacion import cache_geocodificacion
+from app.services.hoja_sheetdb import sincronizador_hoja
+from app.services.metricas import metricas
+from app.services.precomputo import gestor_mapa
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["Métricas"])
+
+def _muestras_servicios():
+    """Contadores que ya llevan las caches, los clientes y el gestor, leídos al exportar"""
+    from app.services.mapa_rutas import cache_rutas
+
+    for api, cantidad in contadores_api().items():
+        yield "google_maps_solicitudes_total", "counter", "Solicitudes HTTP a Google Maps por API", {"api": api}, cantidad
+    for nombre, cache in (("rutas", cache_rutas), ("geocodificacion", cache_geocodificacion)):
+        estadisticas = cache.estadisticas()
+        for nivel in ("memoria", "disco"):
+            yield ("mapa_cache_aciertos_total", "counter", "Aciertos de las caches por nivel",
+                   {"cache": nombre, "nivel": nivel}, estadisticas[f"aciertos_{nivel}"])
+        yield "mapa_cache_fallos_total", "counter", "Fallos de las caches", {"cache": nombre}, estadisticas["fallos"]
+    hoja = sincronizador_hoja.estado()
+    for tipo in ("descargas_completas", "descargas_parciales", "sin_cambios"):
+        yield "sheetdb_sincronizaciones_total", "counter", "Sincronizaciones de la hoja por resultado", {"tipo": tipo}, hoja[tipo]
+    estado = gestor_mapa.estado()
+    yield "mapa_construcciones_en_curso", "gauge", "Construcciones del mapa en curso", {}, estado["en_curso"]
+    for mapa in estado["mapas"]:
+        # Una etiqueta por cada campo de OpcionesMapa: dos mapas distintos nunca comparten serie
+        etiquetas = {
+            "formato": mapa["formato"],
+            "plan": mapa["plan"],
+            "optimizador": mapa["optimizador"],
+            "incremental": str(mapa["incremental"]).lower(),
+            "ventana": mapa["ventana"],
+            "horas": f"{mapa['horas']:g}" if mapa["horas"] else "",
+        }
+        yield "mapa_edad_segundos", "gauge", "Edad de cada mapa en memoria", etiquetas, mapa["edad_s"]
+
+metricas.registrar_recolector(_muestras_servicios)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def exportar_metricas():
+    """
+    Métricas del proceso en el formato de texto de Prometheus: duración de cada
+    etapa de la construcción (hoja, ingesta, agrupamiento, rutas, render), tamaño de
+    la última construcción, llamadas a Google, caches y solicitudes servidas
+    """
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,212 @@
+import logging
+from typing import Optional
+
+import numpy as np
+
+from app.services.distancias import EARTH_RADIUS_KM
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+KM_POR_GRADO_LAT = np.pi * EARTH_RADIUS_KM / 180.0
+UMBRAL_GRILLA = 5000  # A partir de este número de puntos se usa la grilla
+MOTORES = ("auto", "balltree", "grilla")
+MUESTRA_CELDA = 32  # Puntos por celda comparados antes de una búsqueda exhaustiva
+
+def _etiquetas_canonicas(etiquetas: np.ndarray) -> np.ndarray:
+    """Renumera las etiquetas según el orden de aparición del primer punto de cada grupo"""
+    _, primeros, inversa = np.unique(etiquetas, return_index=True, return_inverse=True)
+    orden = np.argsort(np.argsort(primeros))
+    return orden[inversa]
+
+def agrupar_balltree(lat: np.ndarray, lon: np.ndarray, radio_km: float) -> np.ndarray:
+    """
+    DBSCAN con métrica haversine sobre coordenadas en radianes, indexado con BallTree
+    """
+    from sklearn.cluster import DBSCAN  # sklearn tarda ~1 s en importarse: solo al agrupar
+
+    coords = np.radians(np.column_stack([lat, lon]))
+    clustering = DBSCAN(
+        eps=radio_km / EARTH_RADIUS_KM,
+        min_samples=1,
+        metric="haversine",
+        algorithm="ball_tree"
+    ).fit(coords)
+    return _etiquetas_canonicas(clustering.labels_)
+
+def _expandir_pares(inicio_a: np.ndarray, n_a: np.ndarray, inicio_b: np.ndarray, n_b: np.ndarray):
+    """
+    Enumera todos los pares (i, j) entre los rangos [inicio_a, inicio_a + n_a) y
+    [inicio_b, inicio_b + n_b) de cada par de celdas; retorna también el índice del par de celdas
+    """
+    total = n_a * n_b
+    par = np.repeat(np.arange(len(total)), total)
+    desplaz = np.arange(total.sum()) - np.repeat(np.cumsum(total) - total, total)
+    i = inicio_a[par] + desplaz // n_b[par]
+    j = inicio_b[par] + desplaz % n_b[par]
+    return par, i, j
+
+def _celdas_conectadas(xyz: np.ndarray, cos_radio: float, inicio_a: np.ndarray, n_a: np.ndarray,
+                       inicio_b: np.ndarray, n_b: np.ndarray, max_pares: int) -> np.ndarray:
+    """
+    Indica para cada par de celdas si existe algún par de puntos a distancia menor o igual al radio.
+    Los puntos deben estar ordenados por celda; la distancia se compara con el producto escalar
+    de los vectores unitarios, equivalente a comparar la distancia haversine.
+    """
+    conectadas = np.zeros(len(n_a), dtype=bool)
+    total = n_a * n_b
+    acumulado = np.cumsum(total)
+    cortes = np.searchsorted(acumulado, np.arange(max_pares, acumulado[-1], max_pares), side="right")
+    for bloque in np.split(np.arange(len(n_a)), cortes):
+        if len(bloque) == 0:
+            continue
+        par, i, j = _expandir_pares(inicio_a[bloque], n_a[bloque], inicio_b[bloque], n_b[bloque])
+        cerca = np.einsum("ij,ij->i", xyz[i], xyz[j]) >= cos_radio
+        conectadas[bloque[np.unique(par[cerca])]] = True
+    return conectadas
+
+def agrupar_grilla(lat: np.ndarray, lon: np.ndarray, radio_km: float, max_pares: int = 2_000_000) -> np.ndarray:
+    """
+    Equivalente a DBSCAN con min_samples=1 usando una grilla de celdas de lado radio/√2.
+    Los puntos de una misma celda siempre quedan unidos, así que cada celda es un nodo;
+    solo se comparan puntos de celdas vecinas y se omiten las que ya están en el mismo grupo.
+    Los grupos son las componentes conexas del grafo de celdas.
+    """
+    n = len(lat)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+    xyz = np.column_stack([
+        np.cos(lat_rad) * np.cos(lon_rad),
+        np.cos(lat_rad) * np.sin(lon_rad),
+        np.sin(lat_rad),
+    ])
+    cos_radio = np.cos(radio_km / EARTH_RADIUS_KM)
+
+    # Celdas en grados con lado máximo radio/√2 en km (diagonal menor o igual al radio)
+    lado_km = radio_km / np.sqrt(2) * 0.999
+    cos_max = np.cos(np.radians(np.abs(lat).min()))
+    cos_min = max(np.cos(np.radians(np.abs(lat).max())), 1e-6)
+    alto = lado_km / KM_POR_GRADO_LAT
+    ancho = lado_km / (KM_POR_GRADO_LAT * cos_max)
+    ancho_min_km = lado_km * cos_min / cos_max
+
+    celda_y = np.floor(lat / alto).astype(np.int64)
+    celda_x = np.floor(lon / ancho).astype(np.int64)
+    celda_y -= celda_y.min()
+    celda_x -= celda_x.min()
+
+    # Vecindario: celdas a menos de un radio, recorridas de la más cercana a la más lejana
+    ky = int(np.ceil(radio_km / lado_km))
+    kx = int(np.ceil(radio_km / ancho_min_km))
+    desplazamientos = []
+    for dy in range(0, ky + 1):
+        for dx in range(-kx, kx + 1):
+            if dy == 0 and dx <= 0:
+                continue
+            distancia_min = np.hypot(max(abs(dx) - 1, 0) * ancho_min_km, max(dy - 1, 0) * lado_km)
+            if distancia_min <= radio_km:
+                desplazamientos.append((distancia_min, dy, dx))
+    desplazamientos.sort()
+
+    # Ordenar puntos por celda para ubicar el rango de cada celda
+    columnas = int(celda_x.max()) + 2 * kx + 1
+    claves = (celda_y + ky) * columnas + (celda_x + kx)
+    orden = np.argsort(claves, kind="stable")
+    xyz = xyz[orden]
+    celdas, inicio_celda, conteo_celda = np.unique(claves[orden], return_index=True, return_counts=True)
+    n_celdas = len(celdas)
+
+    aristas_a = [np.zeros(0, dtype=np.int64)]
+    aristas_b = [np.zeros(0, dtype=np.int64)]
+    componentes = np.arange(n_celdas)
+    for _, dy, dx in desplazamientos:
+        vecinas = celdas + dy * columnas + dx
+        pos = np.minimum(np.searchsorted(celdas, vecinas), n_celdas - 1)
+        existe = celdas[pos] == vecinas
+        a = np.nonzero(existe)[0]
+        b = pos[existe]
+
+        # Omitir pares de celdas que ya pertenecen al mismo grupo
+        pendiente = componentes[a] != componentes[b]
+        a, b = a[pendiente], b[pendiente]
+        if len(a) == 0:
+            continue
+
+        # Primero una muestra de cada celda; si no alcanza, la comparación completa
+        n_a, n_b = conteo_celda[a], conteo_celda[b]
+        conectadas = _celdas_conectadas(
+            xyz, cos_radio,
+            inicio_celda[a], np.minimum(n_a, MUESTRA_CELDA),
+            inicio_celda[b], np.minimum(n_b, MUESTRA_CELDA),
+            max_pares
+        )
+        resto = ~conectadas & ((n_a > MUESTRA_CELDA) | (n_b > MUESTRA_CELDA))
+        if resto.any():
+            conectadas[resto] = _celdas_conectadas(
+                xyz, cos_radio,
+                inicio_celda[a[resto]], n_a[resto],
+                inicio_celda[b[resto]], n_b[resto],
+                max_pares
+            )
+
+        if conectadas.any():
+            aristas_a.append(a[conectadas])
+            aristas_b.append(b[conectadas])
+            filas = np.concatenate(aristas_a)
+            cols = np.concatenate(aristas_b)
+            from scipy.sparse import coo_matrix
+            from scipy.sparse.csgraph import connected_components
+
+            grafo = coo_matrix((np.ones(len(filas), dtype=np.int8), (filas, cols)), shape=(n_celdas, n_celdas))
+            _, componentes = connected_components(grafo, directed=False)
+
+    # Etiqueta de cada punto: la componente de su celda
+    celda_de_punto = np.repeat(np.arange(n_celdas), conteo_celda)
+    etiquetas = np.empty(n, dtype=np.int64)
+    etiquetas[orden] = componentes[celda_de_punto]
+    return _etiquetas_canonicas(etiquetas)
+
+def agrupar_coordenadas(lat, lon, radio_km: float, motor: Optional[str] = "auto") -> np.ndarray:
+    """
+    Agrupa coordenadas (grados) en grupos cuyos puntos están encadenados a
+    distancias haversine menores o iguales a radio_km.
+    Retorna una etiqueta de grupo por punto, numeradas por orden de aparición.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if motor not in MOTORES:
+        raise ValueError(f"Motor de agrupamiento inválido: {motor}. Opciones: {', '.join(MOTORES)}")
+    if len(lat) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if motor == "auto":
+        motor = "grilla" if len(lat) >= UMBRAL_GRILLA else "balltree"
+
+    if motor == "grilla":
+        return agrupar_grilla(lat, lon, radio_km)
+    return agrupar_balltree(lat, lon, radio_km)
+
+def agrupar_por_ventanas(lat, lon, ventanas: np.ndarray, radio_km: float, motor: Optional[str] = "auto") -> np.ndarray:
+    """
+    Agrupa en el espacio dentro de cada ventana de tiempo: puntos de ventanas distintas
+    nunca comparten grupo. Las etiquetas se numeran ventana por ventana.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    ventanas = np.asarray(ventanas)
+    etiquetas = np.zeros(len(lat), dtype=np.int64)
+    if len(lat) == 0:
+        return etiquetas
+
+    orden = np.argsort(ventanas, kind="stable")
+    cortes = np.flatnonzero(np.diff(ventanas[orden])) + 1
+    siguiente = 0
+    for indices in np.split(orden, cortes):
+        locales = agrupar_coordenadas(lat[indices], lon[indices], radio_km, motor=motor)
+        etiquetas[indices] = locales + siguiente
+        siguiente += int(locales.max()) + 1
+    return etiquetas
@@ -0,0 +1,26 @@
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+API_MAX_HILOS = int(os.getenv("API_MAX_HILOS", "8"))  # Hilos para el trabajo bloqueante de los endpoints
+
+# Ejecutor acotado: el trabajo bloqueante no ocupa el event loop ni crece sin límite
+_ejecutor = ThreadPoolExecutor(max_workers=API_MAX_HILOS, thread_name_prefix="api-bloqueante")
+
+async def ejecutar_bloqueante(funcion: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Ejecuta una función bloqueante (red, disco, CPU) en el ejecutor acotado
+    y espera su resultado sin bloquear el event loop
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_ejecutor, functools.partial(funcion, *args, **kwargs))
+
+def detener_ejecutor():
+    _ejecutor.shutdown(wait=False, cancel_futures=True)
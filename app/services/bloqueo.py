@@ -0,0 +1,69 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Sin fcntl (Windows) el bloqueo solo rige dentro del proceso, como con un worker
+    fcntl = None
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+BLOQUEOS_DIR = os.getenv("BLOQUEOS_DIR", tempfile.gettempdir())  # Archivos de bloqueo compartidos por los workers
+BLOQUEO_ESPERA_S = 0.1  # Intervalo entre intentos de tomar el bloqueo
+
+class BloqueoArchivo:
+    """
+    Bloqueo exclusivo entre procesos (flock sobre un archivo) para que un solo
+    worker construya un mismo mapa a la vez. Los workers deben compartir BLOQUEOS_DIR.
+    """
+    def __init__(self, nombre: str, directorio: str = BLOQUEOS_DIR):
+        clave = hashlib.sha256(nombre.encode("utf-8")).hexdigest()[:16]
+        self.nombre = nombre
+        self.ruta = os.path.join(directorio, f"mapa_{clave}.lock")
+        self._archivo = None
+
+    def adquirir(self, timeout_s: Optional[float] = None) -> bool:
+        """
+        Espera el bloqueo hasta timeout_s (None: sin límite).
+        Retorna False si no se obtuvo a tiempo.
+        """
+        if fcntl is None:
+            return True
+        try:
+            archivo = open(self.ruta, "a+")
+        except OSError as e:
+            logger.warning(f"Sin bloqueo entre procesos para '{self.nombre}' ({self.ruta}): {e}")
+            return True
+        limite = None if timeout_s is None else time.monotonic() + timeout_s
+        while True:
+            try:
+                fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._archivo = archivo
+                return True
+            except BlockingIOError:
+                if limite is not None and time.monotonic() >= limite:
+                    archivo.close()
+                    return False
+                time.sleep(BLOQUEO_ESPERA_S)
+
+    def liberar(self):
+        if self._archivo is None:
+            return
+        try:
+            fcntl.flock(self._archivo.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._archivo.close()
+            self._archivo = None
+
+    def __enter__(self) -> "BloqueoArchivo":
+        self.adquirir()
+        return self
+
+    def __exit__(self, *exc):
+        self.liberar()
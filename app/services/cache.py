@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "cache_mapa.sqlite3")  # Vacío para desactivar el nivel en disco
+
+class CachePersistente:
+    """
+    Cache de dos niveles con expiración por TTL:
+    un LRU en memoria y una tabla SQLite en disco que sobrevive a reinicios.
+    Los valores deben ser serializables a JSON.
+    """
+    def __init__(self, nombre: str, ttl_s: float, max_memoria: int = 1024,
+                 ruta_db: Optional[str] = CACHE_DB_PATH):
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", nombre):
+            raise ValueError(f"Nombre de cache inválido: {nombre}")
+
+        self.nombre = nombre
+        self.ttl_s = ttl_s
+        self.max_memoria = max_memoria
+        self.ruta_db = ruta_db or None
+
+        self._memoria: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conexion: Optional[sqlite3.Connection] = None
+
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+
+        if self.ruta_db:
+            self._abrir_disco()
+
+    def _abrir_disco(self):
+        """Abre la base SQLite; si falla, la cache continúa solo en memoria"""
+        try:
+            conexion = sqlite3.connect(self.ruta_db, timeout=10, check_same_thread=False)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.nombre} "
+                "(clave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira_en REAL NOT NULL)"
+            )
+            conexion.commit()
+            self._conexion = conexion
+        except sqlite3.Error as e:
+            logger.warning(f"Cache '{self.nombre}' sin nivel en disco ({self.ruta_db}): {e}")
+            self._conexion = None
+
+    def _recordar(self, clave: str, valor: Any, expira_en: float):
+        self._memoria[clave] = (expira_en, valor)
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        """
+        Retorna el valor asociado a la clave o None si no existe o expiró
+        """
+        ahora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                expira_en, valor = entrada
+                if expira_en > ahora:
+                    self._memoria.move_to_end(clave)
+                    self.aciertos_memoria += 1
+                    return valor
+                del self._memoria[clave]
+
+            if self._conexion is not None:
+                try:
+                    fila = self._conexion.execute(
+                        f"SELECT valor, expira_en FROM {self.nombre} WHERE clave = ?", (clave,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"Error al leer cache '{self.nombre}': {e}")
+                    fila = None
+
+                if fila is not None and fila[1] > ahora:
+                    valor = json.loads(fila[0])
+                    self._recordar(clave, valor, fila[1])
+                    self.aciertos_disco += 1
+                    return valor
+
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave: str, valor: Any, ttl_s: Optional[float] = None):
+        """
+        Guarda el valor en memoria y en disco
+        """
+        expira_en = time.time() + (self.ttl_s if ttl_s is None else ttl_s)
+        with self._lock:
+            self._recordar(clave, valor, expira_en)
+            if self._conexion is not None:
+                try:
+                    self._conexion.execute(
+                        f"INSERT OR REPLACE INTO {self.nombre} (clave, valor, expira_en) VALUES (?, ?, ?)",
+                        (clave, json.dumps(valor, ensure_ascii=False), expira_en)
+                    )
+                    self._conexion.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Error al escribir cache '{self.nombre}': {e}")
+
+    def limpiar_expirados(self) -> int:
+        """
+        Elimina las entradas expiradas y retorna cuántas se borraron del disco
+        """
+        ahora = time.time()
+        with self._lock:
+            for clave in [c for c, (expira_en, _) in self._memoria.items() if expira_en <= ahora]:
+                del self._memoria[clave]
+            if self._conexion is None:
+                return 0
+            try:
+                cursor = self._conexion.execute(f"DELETE FROM {self.nombre} WHERE expira_en <= ?", (ahora,))
+                self._conexion.commit()
+                return cursor.rowcount
+            except sqlite3.Error as e:
+                logger.warning(f"Error al limpiar cache '{self.nombre}': {e}")
+                return 0
+
+    def vaciar(self):
+        """
+        Elimina todas las entradas, en memoria y en disco
+        """
+        with self._lock:
+            self._memoria.clear()
+            if self._conexion is None:
+                return
+            try:
+                self._conexion.execute(f"DELETE FROM {self.nombre}")
+                self._conexion.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Error al vaciar cache '{self.nombre}': {e}")
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """
+        Contadores de aciertos y fallos de la cache
+        """
+        with self._lock:
+            aciertos = self.aciertos_memoria + self.aciertos_disco
+            total = aciertos + self.fallos
+            return {
+                "aciertos_memoria": self.aciertos_memoria,
+                "aciertos_disco": self.aciertos_disco,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(aciertos / total, 3) if total else 0.0,
+                "entradas_memoria": len(self._memoria),
+                "disco": self.ruta_db if self._conexion is not None else None,
+            }
@@ -0,0 +1,82 @@
+from typing import List
+
+from branca.element import MacroElement
+from folium.plugins import FastMarkerCluster
+from jinja2 import Template
+
+# Capas de folium para los modos cluster y canvas. Están separadas de render_mapa
+# para que folium, branca y jinja2 se importen recién al dibujar el primer mapa.
+
+# Colores de folium (AwesomeMarkers) en CSS, para los modos dibujados en el navegador
+COLORES_CSS = {
+    'red': '#d63e2a', 'blue': '#38aadd', 'green': '#72b026', 'purple': '#d252b9',
+    'orange': '#f69730', 'darkred': '#a23336', 'lightred': '#ff8e7f', 'beige': '#ffcb92',
+    'darkblue': '#0a1172', 'darkgreen': '#728224', 'cadetblue': '#436978', 'darkpurple': '#5b396b',
+    'white': '#fbfbfb', 'pink': '#ff91ea', 'lightblue': '#8adaff', 'lightgreen': '#bbf970',
+    'gray': '#575757', 'black': '#303030', 'lightgray': '#a3a3a3',
+}
+
+# Popup armado en el navegador al abrirlo, a partir de la fila [lat, lon, color, dirección, fecha]
+_POPUP_JS = """
+    function (fila) {
+        var escapar = function (texto) {
+            var div = document.createElement('div');
+            div.textContent = texto == null ? '' : String(texto);
+            return div.innerHTML;
+        };
+        return function () {
+            return '<b>Punto de visita</b><br>Dirección: ' + escapar(fila[3]) + '<br>Fecha: ' + escapar(fila[4]);
+        };
+    }
+"""
+
+_CALLBACK_CLUSTER = """
+function (fila) {
+    var popup = (%s)(fila);
+    var icono = L.AwesomeMarkers.icon({icon: 'info-sign', markerColor: fila[2], prefix: 'glyphicon'});
+    return L.marker(new L.LatLng(fila[0], fila[1]), {icon: icono}).bindPopup(popup);
+}
+""" % _POPUP_JS.strip()
+
+class CapaPuntosCanvas(MacroElement):
+    """
+    Puntos de visita como circleMarker sobre un único canvas; los datos viajan
+    en un arreglo y el popup de cada punto se arma al abrirlo
+    """
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                var datos = {{ this.datos|tojson }};
+                var colores = {{ this.colores|tojson }};
+                var popup = {{ this.popup }};
+                var renderer = L.canvas({padding: 0.5});
+                var capa = L.featureGroup();
+                for (var i = 0; i < datos.length; i++) {
+                    var fila = datos[i];
+                    L.circleMarker([fila[0], fila[1]], {
+                        renderer: renderer, radius: 6, color: '#ffffff', weight: 1,
+                        fillColor: colores[fila[2]] || fila[2], fillOpacity: 0.9
+                    }).bindPopup(popup(fila)).addTo(capa);
+                }
+                capa.addTo({{ this._parent.get_name() }});
+                return capa;
+            })();
+        {% endmacro %}"""
+    )
+
+    def __init__(self, datos: List[list]):
+        super().__init__()
+        self._name = "CapaPuntosCanvas"
+        self.datos = datos
+        self.colores = COLORES_CSS
+        self.popup = _POPUP_JS.strip()
+
+def capa_puntos(filas: List[list], modo: str) -> MacroElement:
+    """
+    Capa con todos los puntos de visita para los modos cluster o canvas.
+    Cada fila es [lat, lon, color, dirección, fecha].
+    """
+    if modo == "cluster":
+        return FastMarkerCluster(filas, callback=_CALLBACK_CLUSTER, name="Puntos de visita")
+    return CapaPuntosCanvas(filas)
@@ -0,0 +1,120 @@
+import logging
+import os
+import threading
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, Optional
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:  # googlemaps y requests se importan al crear la primera sesión, no al iniciar
+    import googlemaps
+    import requests
+    from requests.adapters import HTTPAdapter
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+HTTP_POOL_CONEXIONES = int(os.getenv("HTTP_POOL_CONEXIONES", "16"))  # Conexiones keep-alive por host
+HTTP_REINTENTOS = int(os.getenv("HTTP_REINTENTOS", "3"))  # Reintentos ante 429 y 5xx
+HTTP_BACKOFF_S = float(os.getenv("HTTP_BACKOFF_S", "0.5"))  # Base del backoff exponencial
+GOOGLE_MAPS_QPS = int(os.getenv("GOOGLE_MAPS_QPS", "20"))  # Consultas por segundo a Google Maps
+ESTADOS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+_sesion_http: Optional["requests.Session"] = None
+_clientes_gmaps: Dict[str, "googlemaps.Client"] = {}
+_lock = threading.Lock()
+
+# Solicitudes HTTP a Google Maps por API (directions, geocode)
+_llamadas_api: Counter = Counter()
+_lock_llamadas = threading.Lock()
+
+def _contar_llamada(respuesta: "requests.Response", *args, **kwargs):
+    partes = urlsplit(respuesta.url).path.rstrip("/").split("/")
+    api = partes[-2] if len(partes) >= 2 else partes[-1]
+    with _lock_llamadas:
+        _llamadas_api[api] += 1
+
+def contadores_api() -> Dict[str, int]:
+    """Solicitudes hechas a cada API de Google Maps desde que inició el proceso"""
+    with _lock_llamadas:
+        return dict(_llamadas_api)
+
+def _adaptador(estados: tuple, pool: int) -> "HTTPAdapter":
+    """
+    Adaptador con pool de conexiones y reintentos con backoff exponencial y jitter.
+    Respeta Retry-After y, agotados los reintentos, retorna la última respuesta.
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.util import Retry
+
+    reintentos = Retry(
+        total=HTTP_REINTENTOS,
+        backoff_factor=HTTP_BACKOFF_S,
+        backoff_jitter=HTTP_BACKOFF_S,
+        status_forcelist=estados,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    return HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=reintentos)
+
+def obtener_sesion_http() -> "requests.Session":
+    """
+    Sesión HTTP compartida (keep-alive y pool de conexiones) para SheetDB
+    """
+    global _sesion_http
+    if _sesion_http is None:
+        import requests
+
+        with _lock:
+            if _sesion_http is None:
+                sesion = requests.Session()
+                adaptador = _adaptador(ESTADOS_REINTENTABLES, HTTP_POOL_CONEXIONES)
+                sesion.mount("https://", adaptador)
+                sesion.mount("http://", adaptador)
+                _sesion_http = sesion
+    return _sesion_http
+
+def obtener_cliente_gmaps(api_key: Optional[str] = None, timeout: Optional[float] = None,
+                          pool: int = HTTP_POOL_CONEXIONES) -> "googlemaps.Client":
+    """
+    Cliente de Google Maps compartido por API key: una sola sesión con pool de
+    conexiones y limitador de consultas por segundo (GOOGLE_MAPS_QPS).
+    googlemaps ya reintenta los 5xx y OVER_QUERY_LIMIT; aquí se agregan los 429.
+    Con timeout, los reintentos de una llamada tampoco superan ese tiempo (retry_timeout).
+    """
+    api_key = api_key or os.getenv('GOOGLE_MAPS_API_KEY')
+    cliente = _clientes_gmaps.get(api_key)
+    if cliente is None:
+        import googlemaps
+        import requests
+
+        with _lock:
+            cliente = _clientes_gmaps.get(api_key)
+            if cliente is None:
+                sesion = requests.Session()
+                sesion.mount("https://", _adaptador((429,), pool))
+                sesion.hooks["response"].append(_contar_llamada)
+                cliente = googlemaps.Client(
+                    key=api_key,
+                    timeout=timeout,
+                    retry_timeout=timeout or 60,
+                    queries_per_second=GOOGLE_MAPS_QPS,
+                    requests_session=sesion
+                )
+                _clientes_gmaps[api_key] = cliente
+                logger.info("Cliente de Google Maps creado")
+    return cliente
+
+def cerrar_clientes():
+    """Cierra las sesiones compartidas (al detener la aplicación)"""
+    global _sesion_http
+    with _lock:
+        if _sesion_http is not None:
+            _sesion_http.close()
+            _sesion_http = None
+        for cliente in _clientes_gmaps.values():
+            sesion = getattr(cliente, "session", None)
+            if sesion is not None:
+                sesion.close()
+        _clientes_gmaps.clear()
@@ -0,0 +1,81 @@
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+# Constantes
+EARTH_RADIUS_KM = 6371.0
+TAMANO_BLOQUE = 2048  # Filas por bloque en el modo por bloques
+
+def _a_radianes(valores, dtype) -> np.ndarray:
+    return np.radians(np.asarray(valores, dtype=dtype))
+
+def _haversine_radianes(lat1, lon1, cos_lat1, lat2, lon2, cos_lat2) -> np.ndarray:
+    """Fórmula de Haversine sobre arreglos en radianes, con cos(lat) ya calculado"""
+    a = np.sin((lat2 - lat1) * 0.5) ** 2 + cos_lat1 * cos_lat2 * np.sin((lon2 - lon1) * 0.5) ** 2
+    return (2 * EARTH_RADIUS_KM) * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+def haversine_km(lat1, lon1, lat2, lon2, dtype=np.float64) -> np.ndarray:
+    """
+    Distancia haversine en km elemento a elemento entre coordenadas en grados.
+    Acepta escalares o arreglos compatibles por broadcasting.
+    """
+    lat1, lon1 = _a_radianes(lat1, dtype), _a_radianes(lon1, dtype)
+    lat2, lon2 = _a_radianes(lat2, dtype), _a_radianes(lon2, dtype)
+    return _haversine_radianes(lat1, lon1, np.cos(lat1), lat2, lon2, np.cos(lat2))
+
+def distancias_desde(lat: float, lon: float, lats, lons, dtype=np.float64) -> np.ndarray:
+    """
+    Distancias en km desde un punto a cada uno de los puntos dados
+    """
+    return haversine_km(lat, lon, lats, lons, dtype=dtype)
+
+def bloques_matriz_distancias(lats, lons, lats_destino=None, lons_destino=None,
+                              dtype=np.float64, tamano_bloque: int = TAMANO_BLOQUE
+                              ) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Recorre la matriz de distancias en km por bloques de filas, sin construirla completa.
+    Genera tuplas (fila_inicial, bloque) donde bloque tiene forma (filas, len(destinos)).
+    Si no se indican destinos, la matriz es de todos contra todos.
+    """
+    lat_a, lon_a = _a_radianes(lats, dtype), _a_radianes(lons, dtype)
+    if lats_destino is None:
+        lat_b, lon_b = lat_a, lon_a
+    else:
+        lat_b, lon_b = _a_radianes(lats_destino, dtype), _a_radianes(lons_destino, dtype)
+    cos_a, cos_b = np.cos(lat_a), np.cos(lat_b)
+
+    for inicio in range(0, len(lat_a), tamano_bloque):
+        fin = inicio + tamano_bloque
+        yield inicio, _haversine_radianes(
+            lat_a[inicio:fin, None], lon_a[inicio:fin, None], cos_a[inicio:fin, None],
+            lat_b[None, :], lon_b[None, :], cos_b[None, :]
+        ).astype(dtype, copy=False)
+
+def matriz_distancias(lats, lons, lats_destino=None, lons_destino=None,
+                      dtype=np.float64, tamano_bloque: Optional[int] = TAMANO_BLOQUE) -> np.ndarray:
+    """
+    Matriz de distancias en km entre dos conjuntos de puntos (o de todos contra todos).
+    Se calcula por bloques de filas para acotar los temporales; con float32 la matriz ocupa la mitad.
+    """
+    n = len(lats)
+    m = n if lats_destino is None else len(lats_destino)
+    matriz = np.empty((n, m), dtype=dtype)
+    for inicio, bloque in bloques_matriz_distancias(lats, lons, lats_destino, lons_destino,
+                                                    dtype=dtype, tamano_bloque=tamano_bloque or max(n, 1)):
+        matriz[inicio:inicio + len(bloque)] = bloque
+    return matriz
+
+def vecinos_mas_cercanos(lats, lons, lats_destino, lons_destino,
+                         dtype=np.float64, tamano_bloque: int = TAMANO_BLOQUE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Para cada punto retorna el índice del destino más cercano y su distancia en km,
+    usando el modo por bloques para no materializar la matriz completa
+    """
+    indices = np.empty(len(lats), dtype=np.int64)
+    distancias = np.empty(len(lats), dtype=dtype)
+    for inicio, bloque in bloques_matriz_distancias(lats, lons, lats_destino, lons_destino,
+                                                    dtype=dtype, tamano_bloque=tamano_bloque):
+        fin = inicio + len(bloque)
+        indices[inicio:fin] = bloque.argmin(axis=1)
+        distancias[inicio:fin] = bloque[np.arange(len(bloque)), indices[inicio:fin]]
+    return indices, distancias
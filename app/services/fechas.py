@@ -0,0 +1,161 @@
+import logging
+import math
+import os
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+if TYPE_CHECKING:  # numpy se importa en las funciones vectorizadas: el gestor del mapa solo usa las constantes
+    import numpy as np
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+ZONA_HORARIA = os.getenv("ZONA_HORARIA", "America/Lima")  # Zona de las fechas sin zona y del día local
+FORMATOS_FECHA = (
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y",
+)  # Formatos de la hoja además de ISO 8601
+VENTANAS = ("ninguna", "dia", "turno", "horas")
+VENTANA_TIEMPO = os.getenv("VENTANA_TIEMPO", "ninguna")  # Ventana de tiempo por defecto del agrupamiento
+VENTANA_HORAS = float(os.getenv("VENTANA_HORAS", "4"))  # Largo de la ventana con ventana=horas
+TURNOS_INICIO_H = tuple(
+    float(h) for h in os.getenv("TURNOS_INICIO_H", "6,14,22").split(",")
+)  # Hora local de inicio de cada turno (el último puede cruzar la medianoche)
+SEGUNDOS_DIA = 86400
+_EPOCH = datetime(1970, 1, 1)
+
+def _zona(nombre: str) -> tzinfo:
+    try:
+        return ZoneInfo(nombre)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Zona horaria desconocida: {nombre}; se usa UTC")
+        return timezone.utc
+
+zona_local = _zona(ZONA_HORARIA)
+
+def _interpretar(texto: str) -> Optional[datetime]:
+    """FechaHora como datetime, con zona solo si el texto la trae"""
+    texto = texto.strip()
+    if not texto:
+        return None
+    try:
+        return datetime.fromisoformat(texto)
+    except ValueError:
+        for formato in FORMATOS_FECHA:
+            try:
+                return datetime.strptime(texto, formato)
+            except ValueError:
+                continue
+    return None
+
+def parsear_fecha_hora(valor) -> Optional[datetime]:
+    """
+    FechaHora de la hoja como datetime en la zona local. Acepta ISO 8601 (con o sin
+    zona, como el que envía seleccion_ubicacion.html) y día/mes/año; las fechas sin
+    zona se interpretan en ZONA_HORARIA. None si no se puede interpretar.
+    """
+    fecha = _interpretar(str(valor or ""))
+    if fecha is None:
+        return None
+    if fecha.tzinfo is None:
+        return fecha.replace(tzinfo=zona_local)
+    return fecha.astimezone(zona_local)
+
+def dia_local(valor) -> Optional[str]:
+    """Día (AAAA-MM-DD en la zona local) de una FechaHora, o None si no se puede interpretar"""
+    fecha = parsear_fecha_hora(valor)
+    return fecha.date().isoformat() if fecha else None
+
+def segundos_epoch(valores: List) -> "np.ndarray":
+    """
+    FechaHora de cada fila como segundos epoch (NaN si no se puede interpretar).
+    Cada texto distinto se interpreta una sola vez y el desfase de ZONA_HORARIA
+    de las fechas sin zona se calcula por hora distinta, no por fila.
+    """
+    import numpy as np
+
+    posiciones: Dict[str, int] = {}
+    inversa = np.fromiter(
+        (posiciones.setdefault(v if type(v) is str else str(v or ""), len(posiciones)) for v in valores),
+        dtype=np.intp, count=len(valores)
+    )
+    segundos = np.full(len(posiciones), np.nan)
+    sin_zona = np.zeros(len(posiciones), dtype=bool)
+    for texto, i in posiciones.items():
+        fecha = _interpretar(texto)
+        if fecha is None:
+            continue
+        if fecha.tzinfo is None:
+            segundos[i] = (fecha - _EPOCH).total_seconds()
+            sin_zona[i] = True
+        else:
+            segundos[i] = fecha.timestamp()
+
+    if sin_zona.any():
+        # Hora de pared local a epoch: se resta el desfase de la zona en esa hora
+        pared = segundos[sin_zona]
+        horas, indices = np.unique(np.floor_divide(pared, 3600), return_inverse=True)
+        desfases = np.fromiter(
+            (zona_local.utcoffset(_EPOCH + timedelta(hours=h)).total_seconds() for h in horas),
+            dtype=np.float64, count=len(horas)
+        )
+        segundos[sin_zona] = pared - desfases[indices.ravel()]
+    return segundos[inversa]
+
+def _segundos_locales(fecha_s: "np.ndarray") -> "np.ndarray":
+    """Segundos epoch más el desfase de la zona local (el desfase se calcula por hora distinta)"""
+    import numpy as np
+
+    horas, inversa = np.unique(np.floor_divide(fecha_s, 3600), return_inverse=True)
+    desfases = np.fromiter(
+        (datetime.fromtimestamp(h * 3600, zona_local).utcoffset().total_seconds() for h in horas),
+        dtype=np.float64, count=len(horas)
+    )
+    return fecha_s + desfases[inversa.ravel()]
+
+def ventanas_tiempo(fecha_s: "np.ndarray", ventana: str, horas: float = VENTANA_HORAS,
+                    turnos: Tuple[float, ...] = TURNOS_INICIO_H) -> "np.ndarray":
+    """
+    Número de ventana de tiempo de cada fecha (segundos epoch) según la hora local:
+    el día, el turno (turnos son las horas de inicio) o bloques de N horas que empiezan
+    en cada medianoche (si N no divide 24, el último bloque del día es más corto;
+    desde 24 horas, bloques de días completos). Las fechas no interpretadas (NaN) van a la ventana -1.
+    """
+    import numpy as np
+
+    if ventana not in VENTANAS:
+        raise ValueError(f"Ventana de tiempo inválida: {ventana}. Opciones: {', '.join(VENTANAS)}")
+    fecha_s = np.asarray(fecha_s, dtype=np.float64)
+    if ventana == "ninguna":
+        return np.zeros(len(fecha_s), dtype=np.int64)
+    if ventana == "horas" and horas <= 0:
+        raise ValueError(f"El largo de la ventana debe ser positivo: {horas}")
+
+    ventanas = np.full(len(fecha_s), -1, dtype=np.int64)
+    validas = ~np.isnan(fecha_s)
+    if not validas.any():
+        return ventanas
+    local = _segundos_locales(fecha_s[validas])
+    if ventana == "dia":
+        numeros = np.floor_divide(local, SEGUNDOS_DIA)
+    elif ventana == "horas":
+        dia = np.floor_divide(local, SEGUNDOS_DIA)
+        if horas >= 24:
+            numeros = np.floor_divide(dia, max(1, round(horas / 24)))
+        else:
+            # (día, bloque del día): los bloques no se corren de un día a otro
+            por_dia = math.ceil(24 / horas)
+            numeros = dia * por_dia + np.floor_divide(local - dia * SEGUNDOS_DIA, horas * 3600)
+    else:
+        inicios = np.sort(np.asarray(turnos, dtype=np.float64)) * 3600
+        dia = np.floor_divide(local, SEGUNDOS_DIA)
+        turno = np.searchsorted(inicios, local - dia * SEGUNDOS_DIA, side="right") - 1
+        # Antes del primer turno del día sigue el último turno del día anterior
+        dia = np.where(turno < 0, dia - 1, dia)
+        turno = np.where(turno < 0, len(inicios) - 1, turno)
+        numeros = dia * len(inicios) + turno
+    ventanas[validas] = numeros.astype(np.int64)
+    return ventanas
@@ -0,0 +1,86 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.services.cache import CachePersistente
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+GEOCODING_CACHE_TTL_S = float(os.getenv("GEOCODING_CACHE_TTL_S", str(30 * 86400)))  # Vigencia de una dirección resuelta
+GEOCODING_TTL_NEGATIVO_S = float(os.getenv("GEOCODING_TTL_NEGATIVO_S", "86400"))  # Vigencia de una dirección sin resultado
+GEOCODING_MAX_CONCURRENTES = int(os.getenv("GEOCODING_MAX_CONCURRENTES", "4"))  # Geocodificaciones simultáneas
+
+# Cache de direcciones geocodificadas (memoria + disco), incluidas las que no tienen resultado
+cache_geocodificacion = CachePersistente("geocodificacion", ttl_s=GEOCODING_CACHE_TTL_S)
+
+def normalizar_direccion(direccion: str) -> str:
+    """Clave de cache de una dirección: sin mayúsculas ni espacios repetidos"""
+    return re.sub(r"\s+", " ", str(direccion)).strip().lower()
+
+def _consultar_google(direccion: str, gmaps_client) -> Optional[Tuple[float, float]]:
+    geocode_result = gmaps_client.geocode(direccion)
+    if geocode_result and 'geometry' in geocode_result[0]:
+        location = geocode_result[0]['geometry']['location']
+        return (location['lat'], location['lng'])
+    return None
+
+def geocodificar(direccion: str, gmaps_client,
+                 cache: Optional[CachePersistente] = cache_geocodificacion) -> Optional[Tuple[float, float]]:
+    """
+    Coordenadas de una dirección, consultando antes la cache.
+    Las direcciones sin resultado se recuerdan por GEOCODING_TTL_NEGATIVO_S;
+    los errores de red o de la API no se guardan y se reintentan en la próxima llamada.
+    """
+    clave = normalizar_direccion(direccion)
+    if not clave:
+        return None
+
+    if cache is not None:
+        guardado = cache.obtener(clave)
+        if guardado is not None:
+            return tuple(guardado["coords"]) if guardado["coords"] else None
+
+    try:
+        coords = _consultar_google(direccion, gmaps_client)
+    except Exception as e:
+        logger.warning(f"Error al geocodificar '{direccion}': {e}")
+        return None
+
+    if cache is not None:
+        if coords:
+            cache.guardar(clave, {"coords": list(coords)})
+        else:
+            cache.guardar(clave, {"coords": None}, ttl_s=GEOCODING_TTL_NEGATIVO_S)
+    if not coords:
+        logger.warning(f"Dirección sin resultados de geocodificación: '{direccion}'")
+    return coords
+
+def geocodificar_lote(direcciones: List[str], gmaps_client,
+                      max_concurrentes: int = GEOCODING_MAX_CONCURRENTES,
+                      cache: Optional[CachePersistente] = cache_geocodificacion
+                      ) -> Dict[str, Optional[Tuple[float, float]]]:
+    """
+    Geocodifica varias direcciones (una vez cada una) con concurrencia limitada.
+    Retorna un diccionario dirección -> coordenadas o None.
+    """
+    # Una consulta por dirección normalizada
+    representantes: Dict[str, str] = {}
+    for direccion in direcciones:
+        clave = normalizar_direccion(direccion)
+        if clave:
+            representantes.setdefault(clave, direccion)
+    if not representantes:
+        return {}
+
+    unicas = list(representantes.values())
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrentes, len(unicas)))) as ejecutor:
+        resultados = list(ejecutor.map(lambda d: geocodificar(d, gmaps_client, cache), unicas))
+    por_clave = dict(zip(representantes, resultados))
+
+    resueltas = sum(1 for coords in resultados if coords)
+    logger.info(f"Geocodificación por lote: {resueltas} de {len(unicas)} direcciones resueltas")
+    return {d: por_clave[normalizar_direccion(d)] for d in direcciones if normalizar_direccion(d)}
@@ -0,0 +1,238 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from app.services.cache import CachePersistente
+from app.services.clientes import obtener_sesion_http
+
+if TYPE_CHECKING:  # requests se importa recién al crear la sesión HTTP
+    import requests
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+SHEETDB_URL = os.getenv("API_SHEET_URL")
+SHEETDB_TIMEOUT_S = float(os.getenv("SHEETDB_TIMEOUT_S", "30"))  # Tiempo límite por solicitud de datos
+SHEETDB_SONDA_TIMEOUT_S = float(os.getenv("SHEETDB_SONDA_TIMEOUT_S", "10"))  # Tiempo límite del conteo de filas
+SHEETDB_PAGINA = int(os.getenv("SHEETDB_PAGINA", "1000"))  # Filas por página (0: una sola solicitud)
+SHEETDB_MAX_CONCURRENTES = int(os.getenv("SHEETDB_MAX_CONCURRENTES", "4"))  # Páginas descargadas a la vez
+SHEETDB_REVALIDAR_S = float(os.getenv("SHEETDB_REVALIDAR_S", "300"))  # Descarga completa al menos cada tanto
+SHEETDB_FILAS_CONTROL = int(os.getenv("SHEETDB_FILAS_CONTROL", "3"))  # Últimas filas conocidas que se comparan antes de reutilizar el snapshot
+SHEETDB_SNAPSHOT_TTL_S = float(os.getenv("SHEETDB_SNAPSHOT_TTL_S", str(7 * 86400)))  # Vigencia del snapshot en disco
+
+@dataclass
+class SnapshotHoja:
+    """Copia local de la hoja y cuándo se sincronizó por última vez"""
+    datos: List[Dict]
+    etag: Optional[str]
+    completo_en: float
+    sincronizado_en: float
+
+    @property
+    def filas(self) -> int:
+        return len(self.datos)
+
+class SincronizadorHoja:
+    """
+    Mantiene un snapshot local de la hoja de SheetDB. Antes de descargar consulta
+    el conteo de filas (/count) y pide las últimas SHEETDB_FILAS_CONTROL filas conocidas
+    junto con las nuevas: si coinciden con el snapshot se usa el snapshot (más las filas
+    nuevas), y si no (filas eliminadas o editadas al final) se descarga la hoja completa
+    en páginas concurrentes (limit/offset). Cada SHEETDB_REVALIDAR_S se descarga completa
+    igualmente, para recoger las ediciones de filas anteriores que el control no ve.
+    """
+    def __init__(self, url: Optional[str] = SHEETDB_URL, pagina: int = SHEETDB_PAGINA,
+                 max_concurrentes: int = SHEETDB_MAX_CONCURRENTES,
+                 revalidar_s: float = SHEETDB_REVALIDAR_S,
+                 cache: Optional[CachePersistente] = None):
+        self.url = url
+        self.pagina = pagina
+        self.max_concurrentes = max_concurrentes
+        self.revalidar_s = revalidar_s
+        self.cache = cache
+
+        self._snapshot: Optional[SnapshotHoja] = None
+        self._con_conteo = True  # False si la API no ofrece /count
+        self._lock = threading.Lock()
+
+        self.descargas_completas = 0
+        self.descargas_parciales = 0
+        self.sin_cambios = 0
+
+    def _url(self, sufijo: str = "", **parametros) -> str:
+        """URL de la API con un sufijo de ruta y parámetros, conservando los de la URL configurada"""
+        if not self.url:
+            raise ValueError("API_SHEET_URL no está configurada")
+        partes = urlsplit(self.url)
+        consulta = parse_qsl(partes.query) + [(k, str(v)) for k, v in parametros.items()]
+        return urlunsplit(partes._replace(path=partes.path.rstrip("/") + sufijo, query=urlencode(consulta)))
+
+    def _clave_cache(self) -> str:
+        return hashlib.sha256(str(self.url).encode("utf-8")).hexdigest()
+
+    def _get(self, url: str, timeout_s: float, encabezados: Optional[Dict[str, str]] = None) -> "requests.Response":
+        return obtener_sesion_http().get(url, timeout=timeout_s, headers=encabezados)
+
+    def contar_filas(self, timeout_s: float = SHEETDB_SONDA_TIMEOUT_S) -> Optional[int]:
+        """
+        Filas de la hoja según /count, sin descargar los datos.
+        Retorna None si la API no ofrece el conteo (y no se vuelve a consultar) o si
+        la consulta falla (se vuelve a intentar en la próxima sincronización); con None
+        se hace la descarga completa condicional.
+        """
+        if not self._con_conteo:
+            return None
+        try:
+            response = self._get(self._url("/count"), timeout_s)
+        except Exception as e:
+            logger.warning(f"No se pudo consultar /count de SheetDB: {e}; se descarga la hoja completa")
+            return None
+        if response.status_code in (400, 404, 405):
+            logger.info("SheetDB no ofrece /count; se usan descargas completas condicionales")
+            self._con_conteo = False
+            return None
+        if response.status_code != 200:
+            logger.warning(f"/count de SheetDB respondió {response.status_code}; se descarga la hoja completa")
+            return None
+        try:
+            return int(response.json()["rows"])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def sondear(self, timeout_s: float = SHEETDB_SONDA_TIMEOUT_S) -> str:
+        """
+        Verifica la conectividad con una consulta liviana (conteo de filas o, si la API
+        no lo ofrece, una sola fila) y retorna un estado legible
+        """
+        try:
+            response = self._get(self._url("/count"), timeout_s)
+            if response.status_code in (400, 404, 405):
+                response = self._get(self._url(limit=1), timeout_s)
+            return "conectado" if response.status_code == 200 else f"error {response.status_code}"
+        except Exception as e:
+            return f"error de conexión: {str(e)}"
+
+    def _leer_json(self, response: "requests.Response") -> List[Dict]:
+        response.raise_for_status()
+        datos = response.json()
+        if not isinstance(datos, list):
+            raise ValueError(f"Respuesta inesperada de SheetDB: {type(datos).__name__}")
+        return datos
+
+    def _descargar_completa(self, etag: Optional[str]) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """
+        Hoja completa en una solicitud condicional: retorna (None, etag) si el servidor
+        responde 304 (sin cambios)
+        """
+        encabezados = {"If-None-Match": etag} if etag else None
+        response = self._get(self._url(), SHEETDB_TIMEOUT_S, encabezados)
+        if response.status_code == 304:
+            return None, etag
+        return self._leer_json(response), response.headers.get("ETag")
+
+    def _descargar_filas(self, desde: int, hasta: int) -> List[Dict]:
+        """Filas [desde, hasta) en páginas de limit/offset pedidas en paralelo (una sola si pagina es 0)"""
+        pagina = self.pagina or max(hasta - desde, 1)
+        inicios = list(range(desde, hasta, pagina))
+        if not inicios:
+            return []
+
+        def _pagina(inicio: int) -> List[Dict]:
+            limite = min(pagina, hasta - inicio)
+            return self._leer_json(self._get(self._url(limit=limite, offset=inicio), SHEETDB_TIMEOUT_S))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrentes, len(inicios))),
+                                thread_name_prefix="sheetdb") as ejecutor:
+            paginas = list(ejecutor.map(_pagina, inicios))
+        logger.info(f"Filas {desde}-{hasta} de SheetDB descargadas en {len(inicios)} páginas")
+        return [fila for pagina in paginas for fila in pagina]
+
+    def _cargar_persistido(self) -> Optional[SnapshotHoja]:
+        if self.cache is None:
+            return None
+        guardado = self.cache.obtener(self._clave_cache())
+        if guardado is None:
+            return None
+        logger.info(f"Snapshot de la hoja recuperado del disco: {len(guardado['datos'])} filas")
+        return SnapshotHoja(guardado["datos"], guardado.get("etag"), guardado["completo_en"], guardado["completo_en"])
+
+    def _guardar(self, snapshot: SnapshotHoja):
+        self._snapshot = snapshot
+        if self.cache is not None:
+            self.cache.guardar(self._clave_cache(), {
+                "datos": snapshot.datos,
+                "etag": snapshot.etag,
+                "completo_en": snapshot.completo_en,
+            })
+
+    def obtener(self) -> List[Dict]:
+        """
+        Datos de la hoja, sincronizando antes el snapshot con SheetDB.
+        La lista retornada se comparte entre llamadas y no debe modificarse.
+        """
+        with self._lock:
+            anterior = self._snapshot or self._cargar_persistido()
+            ahora = time.time()
+            vigente = anterior is not None and ahora - anterior.completo_en < self.revalidar_s
+            filas = self.contar_filas() if self.pagina > 0 or vigente else None
+
+            if vigente and filas is not None and filas >= anterior.filas:
+                # El conteo no basta (borrar una fila y agregar otra lo deja igual): las últimas
+                # filas conocidas se piden junto con las nuevas y deben seguir en su lugar
+                control = min(SHEETDB_FILAS_CONTROL, anterior.filas)
+                desde = anterior.filas - control
+                recientes = self._descargar_filas(desde, filas) if filas > desde else []
+                if len(recientes) == filas - desde and recientes[:control] == anterior.datos[desde:]:
+                    nuevas = recientes[control:]
+                    if not nuevas:
+                        self.sin_cambios += 1
+                        anterior.sincronizado_en = ahora
+                        self._snapshot = anterior
+                        logger.info(f"Hoja sin cambios ({filas} filas), se usa el snapshot local")
+                        return anterior.datos
+
+                    self.descargas_parciales += 1
+                    self._guardar(SnapshotHoja(anterior.datos + nuevas, anterior.etag, anterior.completo_en, ahora))
+                    logger.info(f"Snapshot de la hoja actualizado con {len(nuevas)} filas nuevas")
+                    return self._snapshot.datos
+                logger.info("Las últimas filas conocidas cambiaron (filas eliminadas o editadas): "
+                            "se descarga la hoja completa")
+
+            if self.pagina > 0 and filas is not None:
+                datos, etag = self._descargar_filas(0, filas), None
+            else:
+                datos, etag = self._descargar_completa(anterior.etag if anterior else None)
+                if datos is None:
+                    self.sin_cambios += 1
+                    anterior.completo_en = anterior.sincronizado_en = ahora
+                    self._guardar(anterior)
+                    logger.info("Hoja sin cambios según ETag, se usa el snapshot local")
+                    return anterior.datos
+
+            self.descargas_completas += 1
+            self._guardar(SnapshotHoja(datos, etag, ahora, ahora))
+            return datos
+
+    def estado(self) -> Dict[str, Any]:
+        """Tamaño y antigüedad del snapshot y contadores de sincronización"""
+        snapshot = self._snapshot
+        return {
+            "filas": snapshot.filas if snapshot else None,
+            "sincronizado_hace_s": round(time.time() - snapshot.sincronizado_en, 1) if snapshot else None,
+            "descarga_completa_hace_s": round(time.time() - snapshot.completo_en, 1) if snapshot else None,
+            "descargas_completas": self.descargas_completas,
+            "descargas_parciales": self.descargas_parciales,
+            "sin_cambios": self.sin_cambios,
+        }
+
+# Snapshot de la hoja compartido por el proceso (persistido junto a las demás caches)
+sincronizador_hoja = SincronizadorHoja(
+    cache=CachePersistente("hoja_sheetdb", ttl_s=SHEETDB_SNAPSHOT_TTL_S, max_memoria=1)
+)
@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import threading
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.distancias import EARTH_RADIUS_KM
+from app.services.metricas import etapa
+from app.services.opciones import DISTANCIA_AGRUPAMIENTO_KM
+from app.services.ingesta import CAMPOS_REQUERIDOS, colapsar_grupos
+from app.services.mapa_rutas import (
+    PuntoVisita,
+    agrupar_puntos_geograficamente,
+    ingerir_registros,
+    obtener_rutas_grupos,
+    puntos_desde_tabla,
+)
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def huellas_registros(datos: List[Dict]) -> List[str]:
+    """
+    Calcula una huella por registro a partir de los campos usados por el mapa.
+    Los registros repetidos se distinguen por su número de aparición.
+    """
+    huellas = []
+    apariciones: Dict[str, int] = {}
+    for registro in datos:
+        contenido = "\x1f".join(str(registro.get(campo, "")) for campo in CAMPOS_REQUERIDOS)
+        base = hashlib.sha1(contenido.encode("utf-8")).hexdigest()
+        n = apariciones.get(base, 0)
+        apariciones[base] = n + 1
+        huellas.append(f"{base}#{n}")
+    return huellas
+
+def _cercanos(nuevos: List[PuntoVisita], existentes: List[PuntoVisita]) -> np.ndarray:
+    """
+    Indica qué puntos existentes están dentro de la distancia de agrupamiento
+    de alguno de los puntos nuevos (misma métrica haversine que agrupar_puntos_geograficamente)
+    """
+    marcados = np.zeros(len(existentes), dtype=bool)
+    if not nuevos or not existentes:
+        return marcados
+
+    from sklearn.neighbors import BallTree
+
+    arbol = BallTree(np.radians([[p.lat, p.lon] for p in existentes]), metric="haversine")
+    vecinos = arbol.query_radius(
+        np.radians([[p.lat, p.lon] for p in nuevos]),
+        r=DISTANCIA_AGRUPAMIENTO_KM / EARTH_RADIUS_KM
+    )
+    for indices in vecinos:
+        marcados[indices] = True
+    return marcados
+
+class EstadoIncremental:
+    """
+    Snapshot de la última construcción del mapa: puntos por huella,
+    grupos como conjuntos de huellas y la ruta obtenida para cada grupo
+    """
+    def __init__(self):
+        self.puntos: Dict[str, PuntoVisita] = {}
+        self.grupos: List[FrozenSet[str]] = []
+        self.rutas: Dict[Tuple[str, FrozenSet[str]], Dict] = {}
+        self.paradas: Dict[FrozenSet[str], List[PuntoVisita]] = {}
+        self.descartados: set = set()
+        self.orden: Dict[str, int] = {}
+        self.colapsados = 0
+        self.lock = threading.Lock()
+
+    def reiniciar(self):
+        with self.lock:
+            self.puntos = {}
+            self.grupos = []
+            self.rutas = {}
+            self.paradas = {}
+            self.descartados = set()
+            self.orden = {}
+            self.colapsados = 0
+
+    def actualizar(self, datos: List[Dict], gmaps_client,
+                   optimizador: str = "google") -> List[Tuple[List[PuntoVisita], Optional[Dict]]]:
+        """
+        Aplica los cambios de la hoja sobre el snapshot y retorna los grupos con sus rutas.
+        Solo se reagrupan los grupos afectados por filas nuevas o eliminadas y solo
+        se calculan las rutas de grupos cuya composición cambió (por optimizador).
+        """
+        with self.lock:
+            huellas = huellas_registros(datos)
+            actuales = set(huellas)
+            anteriores = set(self.puntos) | self.descartados
+
+            # Convertir solo las filas nuevas, en bloque
+            nuevas = [(h, registro) for h, registro in zip(huellas, datos) if h not in anteriores]
+            with etapa("ingesta"):
+                tabla, _ = ingerir_registros([registro for _, registro in nuevas])
+            validas = [nuevas[i][0] for i in tabla.indices]
+            agregados: Dict[str, PuntoVisita] = dict(zip(validas, puntos_desde_tabla(tabla)))
+            descartados = (self.descartados & actuales) | ({h for h, _ in nuevas} - set(validas))
+            eliminados = set(self.puntos) - actuales
+            self.orden = {h: i for i, h in enumerate(huellas)}
+            self.descartados = descartados
+
+            if agregados or eliminados:
+                with etapa("agrupamiento"):
+                    self._reagrupar(agregados, eliminados)
+            else:
+                logger.info("Hoja sin cambios: se reutilizan los grupos del snapshot")
+
+            # Paradas de cada grupo, con los envíos repetidos unidos (los grupos ya separan lo lejano);
+            # solo se recalculan las de grupos nuevos
+            with etapa("duplicados"):
+                nuevos = [g for g in self.grupos if g not in self.paradas]
+                paradas = {g: self.paradas[g] for g in self.grupos if g in self.paradas}
+                paradas.update(zip(nuevos, colapsar_grupos([self._puntos_de(g) for g in nuevos])))
+            self.paradas = paradas
+            self.colapsados = sum(len(g) - len(puntos) for g, puntos in paradas.items())
+            if self.colapsados:
+                logger.info(f"Puntos repetidos unidos: {self.colapsados}")
+
+            # Obtener rutas solo para los grupos que no estaban en el snapshot
+            faltantes = [g for g in self.grupos if (optimizador, g) not in self.rutas]
+            if faltantes:
+                with etapa("rutas"):
+                    obtenidas = obtener_rutas_grupos(
+                        gmaps_client,
+                        [paradas[g] for g in faltantes],
+                        optimizador=optimizador
+                    )
+                for grupo, (_, ruta_data) in zip(faltantes, obtenidas):
+                    if ruta_data is not None:
+                        self.rutas[(optimizador, grupo)] = ruta_data
+            logger.info(f"Rutas reutilizadas: {len(self.grupos) - len(faltantes)}, calculadas: {len(faltantes)}")
+
+            vigentes_grupos = set(self.grupos)
+            self.rutas = {k: r for k, r in self.rutas.items() if k[1] in vigentes_grupos}
+
+            return [(paradas[g], self.rutas.get((optimizador, g))) for g in self.grupos]
+
+    def cantidad_puntos(self) -> int:
+        return len(self.puntos)
+
+    def _reagrupar(self, agregados: Dict[str, PuntoVisita], eliminados: set):
+        """
+        Reagrupa la vecindad de los puntos agregados y eliminados, conservando el resto de grupos
+        """
+        # Grupos afectados: contienen puntos eliminados o están cerca de puntos nuevos
+        vigentes = [(h, p) for h, p in self.puntos.items() if h not in eliminados]
+        cercanos = _cercanos(list(agregados.values()), [p for _, p in vigentes])
+        huellas_cercanas = {h for (h, _), marcado in zip(vigentes, cercanos) if marcado}
+
+        intactos = []
+        a_reagrupar: Dict[str, PuntoVisita] = dict(agregados)
+        for grupo in self.grupos:
+            if grupo & eliminados or grupo & huellas_cercanas:
+                a_reagrupar.update({h: self.puntos[h] for h in grupo if h not in eliminados})
+            else:
+                intactos.append(grupo)
+
+        # Reagrupar solo la vecindad afectada
+        huella_por_punto = {id(p): h for h, p in a_reagrupar.items()}
+        nuevos_grupos = [
+            frozenset(huella_por_punto[id(p)] for p in grupo)
+            for grupo in agrupar_puntos_geograficamente(list(a_reagrupar.values()))
+        ]
+
+        for huella in eliminados:
+            del self.puntos[huella]
+        self.puntos.update(agregados)
+        self.grupos = intactos + nuevos_grupos
+
+        logger.info(
+            f"Actualización incremental: {len(agregados)} filas nuevas, {len(eliminados)} eliminadas, "
+            f"{len(intactos)} grupos intactos, {len(nuevos_grupos)} grupos recalculados"
+        )
+
+    def _puntos_de(self, grupo: FrozenSet[str]) -> List[PuntoVisita]:
+        return [self.puntos[h] for h in sorted(grupo, key=self.orden.__getitem__)]
+
+# Snapshot compartido por las solicitudes al mapa
+estado_incremental = EstadoIncremental()
@@ -0,0 +1,211 @@
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.distancias import EARTH_RADIUS_KM
+from app.services.fechas import segundos_epoch
+from app.services.puntos import PuntosArray, PuntoVisita, internar
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+CAMPOS_REQUERIDOS = ['Latitud', 'Longitud', 'Dirección', 'FechaHora']
+MUESTRAS_POR_MOTIVO = 3  # Registros de ejemplo por motivo de rechazo en el log
+DEDUP_TOLERANCIA_M = float(os.getenv("DEDUP_TOLERANCIA_M", "10"))  # Distancia que une envíos repetidos (0 desactiva)
+SEPARADOR_DUPLICADOS = " | "  # Entre las direcciones y fechas de una parada que une varios envíos
+
+@dataclass
+class ReporteRechazos:
+    """Filas descartadas agrupadas por motivo, con algunas de ejemplo"""
+    total_filas: int = 0
+    por_motivo: Dict[str, int] = field(default_factory=dict)
+    muestras: Dict[str, List[Dict]] = field(default_factory=dict)
+
+    @property
+    def rechazadas(self) -> int:
+        return sum(self.por_motivo.values())
+
+    def registrar(self, motivo: str, mascara: np.ndarray, datos: List[Dict]):
+        cantidad = int(mascara.sum())
+        if cantidad:
+            self.por_motivo[motivo] = cantidad
+            self.muestras[motivo] = [datos[i] for i in np.flatnonzero(mascara)[:MUESTRAS_POR_MOTIVO]]
+
+    def registrar_log(self):
+        if not self.rechazadas:
+            return
+        detalle = ", ".join(f"{motivo}: {cantidad}" for motivo, cantidad in self.por_motivo.items())
+        logger.warning(f"Filas descartadas: {self.rechazadas} de {self.total_filas} ({detalle})")
+        for motivo, muestras in self.muestras.items():
+            logger.debug(f"Ejemplos de filas descartadas por {motivo}: {muestras}")
+
+def _columna_float(valores: list) -> np.ndarray:
+    """
+    Convierte una columna a float64; los valores no numéricos quedan como NaN.
+    La conversión completa se intenta primero y solo si falla se convierte valor por valor.
+    """
+    try:
+        return np.array(valores, dtype=np.float64)
+    except (ValueError, TypeError):
+        def _convertir(valor) -> float:
+            try:
+                return float(valor)
+            except (ValueError, TypeError):
+                return np.nan
+        return np.fromiter((_convertir(v) for v in valores), dtype=np.float64, count=len(valores))
+
+def columnas_coordenadas(datos: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """Latitud y Longitud de los registros como float64 (NaN si no son numéricas)"""
+    lat = _columna_float([registro.get('Latitud') for registro in datos])
+    lon = _columna_float([registro.get('Longitud') for registro in datos])
+    return lat, lon
+
+def coordenadas_validas(datos: List[Dict]) -> np.ndarray:
+    """Máscara de las filas con Latitud y Longitud numéricas y dentro de rango"""
+    lat, lon = columnas_coordenadas(datos)
+    with np.errstate(invalid="ignore"):
+        return (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+
+def ingerir_registros(datos: List[Dict]) -> Tuple[PuntosArray, ReporteRechazos]:
+    """
+    Valida los registros de SheetDB en bloque y retorna los puntos válidos en columnas,
+    junto con un reporte de las filas descartadas (campos faltantes, coordenadas
+    no numéricas o fuera de rango)
+    """
+    n = len(datos)
+    reporte = ReporteRechazos(total_filas=n)
+    requeridos = frozenset(CAMPOS_REQUERIDOS)
+    faltante = np.fromiter((not requeridos <= registro.keys() for registro in datos), dtype=bool, count=n)
+
+    lat, lon = columnas_coordenadas(datos)
+    with np.errstate(invalid="ignore"):
+        no_numerico = ~faltante & (np.isnan(lat) | np.isnan(lon))
+        fuera_de_rango = ~faltante & ~no_numerico & ((np.abs(lat) > 90) | (np.abs(lon) > 180))
+
+    reporte.registrar("campos faltantes", faltante, datos)
+    reporte.registrar("coordenadas no numéricas", no_numerico, datos)
+    reporte.registrar("coordenadas fuera de rango", fuera_de_rango, datos)
+    reporte.registrar_log()
+
+    indices = np.flatnonzero(~(faltante | no_numerico | fuera_de_rango))
+    fechas = internar([datos[i]['FechaHora'] for i in indices])
+    tabla = PuntosArray(
+        lat=lat[indices],
+        lon=lon[indices],
+        direccion=internar([datos[i]['Dirección'] for i in indices]),
+        fecha=fechas,
+        indices=indices,
+        fecha_s=segundos_epoch(fechas),
+    )
+    logger.info(f"Puntos válidos convertidos: {len(tabla)} de {n}")
+    return tabla, reporte
+
+def _paradas_por_semilla(lat: np.ndarray, lon: np.ndarray, tolerancia_m: float,
+                         claves: Optional[np.ndarray]) -> np.ndarray:
+    """
+    Índice del punto semilla de cada punto. Los pares a tolerancia_m o menos salen de un
+    KD-tree sobre coordenadas en metros (proyección local, exacta a esta escala).
+    """
+    from scipy.spatial import cKDTree
+
+    lat_r, lon_r = np.radians(lat), np.radians(lon)
+    metros = np.column_stack((lon_r * np.cos(lat_r), lat_r)) * (EARTH_RADIUS_KM * 1000)
+    pares = cKDTree(metros).query_pairs(r=tolerancia_m, output_type="ndarray")
+    if claves is not None and len(pares):
+        claves = np.asarray(claves)
+        pares = pares[claves[pares[:, 0]] == claves[pares[:, 1]]]
+
+    semilla = np.arange(len(lat))
+    if not len(pares):
+        return semilla
+    # Pares (i, j) con i < j, agrupados por i: una semilla solo toma puntos posteriores,
+    # porque los anteriores a ella ya son semillas o fueron tomados
+    pares = pares[np.lexsort((pares[:, 1], pares[:, 0]))]
+    cortes = np.flatnonzero(np.diff(pares[:, 0])) + 1
+    tomado = np.zeros(len(lat), dtype=bool)
+    for grupo in np.split(pares, cortes):
+        i = grupo[0, 0]
+        if tomado[i]:
+            continue
+        libres = grupo[:, 1][~tomado[grupo[:, 1]]]
+        semilla[libres] = i
+        tomado[libres] = True
+    return semilla
+
+def colapsar_duplicados(tabla: PuntosArray, tolerancia_m: float = DEDUP_TOLERANCIA_M,
+                        claves: Optional[np.ndarray] = None) -> Tuple[PuntosArray, int]:
+    """
+    Une los envíos repetidos o casi repetidos en una sola parada. Se recorren los puntos
+    en orden: cada punto aún libre abre una parada y toma los puntos libres a tolerancia_m
+    o menos de él con la misma clave, como la ventana de tiempo. Sin cierre transitivo:
+    una fila de envíos a pocos metros uno del otro no se une en una sola parada.
+    La parada conserva las coordenadas del primer envío y todas sus direcciones y fechas distintas.
+    Retorna la tabla resultante y cuántos puntos se unieron a otro.
+    """
+    n = len(tabla)
+    if tolerancia_m <= 0 or n < 2:
+        return tabla, 0
+
+    semilla = _paradas_por_semilla(tabla.lat, tabla.lon, tolerancia_m, claves)
+    # Cada parada queda en la posición de su primer envío (la semilla)
+    primeros = np.flatnonzero(semilla == np.arange(n))
+    if len(primeros) == n:
+        return tabla, 0
+    posicion = np.empty(n, dtype=np.intp)
+    posicion[primeros] = np.arange(len(primeros))
+    parada_de_punto = posicion[semilla]
+    conteo = np.bincount(parada_de_punto, minlength=len(primeros))
+
+    direccion = [tabla.direccion[i] for i in primeros]
+    fecha = [tabla.fecha[i] for i in primeros]
+    textos: Dict[int, Tuple[Dict, Dict]] = {}
+    for i in np.flatnonzero(conteo[parada_de_punto] > 1).tolist():
+        direcciones, fechas = textos.setdefault(int(parada_de_punto[i]), ({}, {}))
+        direcciones[str(tabla.direccion[i])] = None
+        fechas[str(tabla.fecha[i])] = None
+    for p, (direcciones, fechas) in textos.items():
+        direccion[p] = SEPARADOR_DUPLICADOS.join(direcciones)
+        fecha[p] = SEPARADOR_DUPLICADOS.join(fechas)
+
+    colapsada = PuntosArray(
+        lat=tabla.lat[primeros],
+        lon=tabla.lon[primeros],
+        direccion=direccion,
+        fecha=fecha,
+        indices=tabla.indices[primeros],
+        fecha_s=tabla.fecha_s[primeros] if tabla.fecha_s is not None else None,
+    )
+    return colapsada, n - len(primeros)
+
+def colapsar_grupos(grupos: List[List[PuntoVisita]],
+                    tolerancia_m: float = DEDUP_TOLERANCIA_M) -> List[List[PuntoVisita]]:
+    """
+    colapsar_duplicados para grupos ya formados de PuntoVisita, en una sola pasada:
+    solo se unen puntos del mismo grupo
+    """
+    if tolerancia_m <= 0 or not grupos:
+        return grupos
+    claves = np.repeat(np.arange(len(grupos)), [len(grupo) for grupo in grupos])
+    tabla, colapsados = colapsar_duplicados(
+        PuntosArray.desde_puntos([p for grupo in grupos for p in grupo]), tolerancia_m, claves
+    )
+    if not colapsados:
+        return grupos
+    # Las paradas quedan en el orden de su primer envío, es decir, grupo por grupo
+    cortes = np.searchsorted(claves[tabla.indices], np.arange(1, len(grupos)))
+    return [list(tabla.vista(indices)) for indices in np.split(np.arange(len(tabla)), cortes)]
+
+def indices_por_grupo(etiquetas: np.ndarray) -> List[np.ndarray]:
+    """
+    Índices de los puntos de cada grupo, con los grupos en orden de etiqueta
+    y los puntos en su orden original
+    """
+    if len(etiquetas) == 0:
+        return []
+    orden = np.argsort(etiquetas, kind="stable")
+    cortes = np.flatnonzero(np.diff(etiquetas[orden])) + 1
+    return np.split(orden, cortes)
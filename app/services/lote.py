@@ -0,0 +1,252 @@
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.cache import CACHE_DB_PATH
+from app.services.clientes import contadores_api
+from app.services.distancias import matriz_distancias
+from app.services.fechas import dia_local
+from app.services.geocodificacion import cache_geocodificacion
+from app.services.ingesta import columnas_coordenadas
+from app.services.metricas import etapa, medir_etapas
+from app.services.mapa_rutas import (
+    cache_rutas,
+    calcular_rutas,
+    construir_geojson,
+    crear_mapa_interactivo,
+    obtener_coordenadas_origen,
+)
+from app.services.planificador import cargar_flota
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+LOTE_PROCESOS = int(os.getenv("LOTE_PROCESOS", "0"))  # Procesos del lote (0: uno por núcleo)
+REGIONES = ("ninguna", "deposito")  # Partición adicional al día: ninguna o depósito más cercano
+FORMATOS_LOTE = ("html", "geojson")
+SIN_FECHA = "sin-fecha"
+SIN_COORDENADAS = "sin-coordenadas"
+TODAS = "todas"
+
+@dataclass
+class TareaLote:
+    """Una partición (día y región) con todo lo necesario para procesarla en otro proceso"""
+    dia: str
+    region: str
+    datos: List[Dict]
+    salida: str
+    optimizador: Optional[str] = None
+    plan: str = "grupos"
+    formatos: Tuple[str, ...] = ("html",)
+
+    @property
+    def nombre(self) -> str:
+        return f"rutas_{self.dia}" + ("" if self.region == TODAS else f"_{slug(self.region)}")
+
+@dataclass
+class ResultadoLote:
+    """Resumen de una partición: tiempos, salidas, llamadas a Google y uso de caches"""
+    dia: str
+    region: str
+    filas: int
+    rutas: int = 0
+    puntos: int = 0
+    archivos: List[str] = field(default_factory=list)
+    duracion_s: float = 0.0
+    etapas: Dict[str, float] = field(default_factory=dict)
+    llamadas_api: Dict[str, int] = field(default_factory=dict)
+    cache_rutas: Dict[str, int] = field(default_factory=dict)
+    cache_geocodificacion: Dict[str, int] = field(default_factory=dict)
+    proceso: int = 0
+    error: Optional[str] = None
+
+def slug(texto: str) -> str:
+    """Texto apto para nombres de archivo: sin tildes, en minúsculas y con guiones"""
+    ascii_ = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", ascii_.lower()).strip("-") or "sin-nombre"
+
+def _regiones_por_deposito(datos: List[Dict]) -> List[str]:
+    """Depósito más cercano de cada fila (PLAN_FLOTA); las filas sin coordenadas van aparte"""
+    flota = cargar_flota(obtener_coordenadas_origen())
+    lat, lon = columnas_coordenadas(datos)
+    with np.errstate(invalid="ignore"):
+        validas = (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+    regiones = np.full(len(datos), SIN_COORDENADAS, dtype=object)
+    if validas.any():
+        distancias = matriz_distancias(lat[validas], lon[validas],
+                                       [d.lat for d in flota.depositos], [d.lon for d in flota.depositos])
+        nombres = np.array([d.nombre for d in flota.depositos], dtype=object)
+        regiones[validas] = nombres[distancias.argmin(axis=1)]
+    return regiones.tolist()
+
+def particionar(datos: List[Dict], region: str = "ninguna", columna_region: Optional[str] = None,
+                desde: Optional[str] = None, hasta: Optional[str] = None) -> Dict[Tuple[str, str], List[Dict]]:
+    """
+    Agrupa las filas por día local de FechaHora y, opcionalmente, por región: el valor
+    de una columna de la hoja o el depósito más cercano. desde/hasta (AAAA-MM-DD,
+    inclusivos) filtran los días; con filtro se omiten las filas sin fecha.
+    """
+    if region not in REGIONES:
+        raise ValueError(f"Región inválida: {region}. Opciones: {', '.join(REGIONES)}")
+
+    if columna_region:
+        regiones = [str(registro.get(columna_region) or "").strip() or "sin-region" for registro in datos]
+    elif region == "deposito":
+        regiones = _regiones_por_deposito(datos)
+    else:
+        regiones = [TODAS] * len(datos)
+
+    particiones: Dict[Tuple[str, str], List[Dict]] = {}
+    for registro, region_fila in zip(datos, regiones):
+        dia = dia_local(registro.get('FechaHora'))
+        if dia is None:
+            if desde or hasta:
+                continue
+            dia = SIN_FECHA
+        elif (desde and dia < desde) or (hasta and dia > hasta):
+            continue
+        particiones.setdefault((dia, region_fila), []).append(registro)
+    return particiones
+
+def _escribir(ruta: str, texto: str):
+    """Escritura atómica: nunca queda un archivo a medio escribir"""
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(texto)
+    os.replace(temporal, ruta)
+
+def _diferencia(antes: Dict, despues: Dict, claves: Tuple[str, ...]) -> Dict[str, int]:
+    return {clave: despues.get(clave, 0) - antes.get(clave, 0) for clave in claves}
+
+def procesar_particion(tarea: TareaLote) -> ResultadoLote:
+    """
+    Agrupa, calcula rutas y dibuja una partición (se ejecuta en un proceso del pool).
+    Los errores quedan en el resultado para no detener el resto del lote.
+    """
+    claves_cache = ("aciertos_memoria", "aciertos_disco", "fallos")
+    llamadas_antes = contadores_api()
+    rutas_antes = cache_rutas.estadisticas()
+    geocodificacion_antes = cache_geocodificacion.estadisticas()
+    resultado = ResultadoLote(dia=tarea.dia, region=tarea.region, filas=len(tarea.datos), proceso=os.getpid())
+    inicio = time.monotonic()
+
+    with medir_etapas() as etapas:
+        try:
+            # Cada partición es independiente: sin estado incremental compartido
+            grupos_rutas, origenes = calcular_rutas(False, tarea.optimizador, tarea.datos, tarea.plan)
+            resultado.rutas = len(grupos_rutas)
+            resultado.puntos = sum(len(grupo) for grupo, _ in grupos_rutas)
+            base = os.path.join(tarea.salida, tarea.nombre)
+            if "html" in tarea.formatos:
+                with etapa("render"):
+                    html = crear_mapa_interactivo(grupos_rutas, origenes=origenes)
+                _escribir(base + ".html", html)
+                resultado.archivos.append(base + ".html")
+            if "geojson" in tarea.formatos:
+                with etapa("render"):
+                    geojson = json.dumps(construir_geojson(grupos_rutas, origenes=origenes),
+                                         ensure_ascii=False, separators=(",", ":"))
+                _escribir(base + ".geojson", geojson)
+                resultado.archivos.append(base + ".geojson")
+        except Exception as e:
+            logger.error(f"Error en la partición {tarea.nombre}: {e}")
+            resultado.error = str(e)
+
+    resultado.etapas = {nombre: round(segundos, 3) for nombre, segundos in etapas.items()}
+    resultado.duracion_s = round(time.monotonic() - inicio, 3)
+    llamadas = contadores_api()
+    resultado.llamadas_api = {
+        api: cantidad - llamadas_antes.get(api, 0)
+        for api, cantidad in llamadas.items() if cantidad > llamadas_antes.get(api, 0)
+    }
+    resultado.cache_rutas = _diferencia(rutas_antes, cache_rutas.estadisticas(), claves_cache)
+    resultado.cache_geocodificacion = _diferencia(
+        geocodificacion_antes, cache_geocodificacion.estadisticas(), claves_cache
+    )
+    return resultado
+
+def _iniciar_proceso(nivel_log: int):
+    """Los procesos nuevos (spawn) no heredan la configuración de logging"""
+    logging.basicConfig(level=nivel_log, format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s')
+
+def _sumar(resultados: List[ResultadoLote], atributo: str) -> Dict[str, int]:
+    total: Dict[str, int] = {}
+    for resultado in resultados:
+        for clave, valor in getattr(resultado, atributo).items():
+            total[clave] = total.get(clave, 0) + valor
+    return total
+
+def ejecutar_lote(datos: List[Dict], salida: str, procesos: int = LOTE_PROCESOS,
+                  optimizador: Optional[str] = None, plan: str = "grupos",
+                  formatos: Tuple[str, ...] = ("html",), region: str = "ninguna",
+                  columna_region: Optional[str] = None, desde: Optional[str] = None,
+                  hasta: Optional[str] = None) -> Dict:
+    """
+    Genera los mapas de cada día (y región) en un pool de procesos y escribe
+    resumen_lote.json en la salida. Los procesos comparten las caches de rutas y
+    de geocodificación a través de la base SQLite (CACHE_DB_PATH).
+    """
+    formatos = tuple(formatos)
+    invalidos = [f for f in formatos if f not in FORMATOS_LOTE]
+    if invalidos:
+        raise ValueError(f"Formatos inválidos: {', '.join(invalidos)}. Opciones: {', '.join(FORMATOS_LOTE)}")
+    if not CACHE_DB_PATH:
+        logger.warning("CACHE_DB_PATH está vacío: cada proceso del lote tendrá su propia cache en memoria")
+
+    inicio = time.monotonic()
+    particiones = particionar(datos, region, columna_region, desde, hasta)
+    os.makedirs(salida, exist_ok=True)
+    # Las particiones grandes primero, para repartir mejor la carga entre procesos
+    tareas = [
+        TareaLote(dia, region_particion, filas, salida, optimizador, plan, formatos)
+        for (dia, region_particion), filas in sorted(particiones.items(), key=lambda p: -len(p[1]))
+    ]
+    procesos = max(1, min(procesos or os.cpu_count() or 1, len(tareas) or 1))
+    logger.info(f"Lote: {len(datos)} filas en {len(tareas)} particiones con {procesos} procesos")
+
+    resultados: List[ResultadoLote] = []
+    if procesos == 1:
+        resultados = [procesar_particion(tarea) for tarea in tareas]
+    else:
+        # spawn: cada proceso abre sus propias conexiones (SQLite y HTTP no se comparten entre fork)
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto, initializer=_iniciar_proceso,
+                                 initargs=(logging.getLogger().getEffectiveLevel(),)) as ejecutor:
+            futuros = [ejecutor.submit(procesar_particion, tarea) for tarea in tareas]
+            for futuro in as_completed(futuros):
+                resultado = futuro.result()
+                resultados.append(resultado)
+                estado = f"error: {resultado.error}" if resultado.error else f"{resultado.rutas} rutas"
+                logger.info(f"Partición {resultado.dia}/{resultado.region} lista en {resultado.duracion_s:.2f}s ({estado})")
+
+    resultados.sort(key=lambda r: (r.dia, r.region))
+    resumen = {
+        "particiones": len(resultados),
+        "errores": sum(1 for r in resultados if r.error),
+        "filas": sum(r.filas for r in resultados),
+        "rutas": sum(r.rutas for r in resultados),
+        "procesos": procesos,
+        "duracion_s": round(time.monotonic() - inicio, 3),
+        "suma_duraciones_s": round(sum(r.duracion_s for r in resultados), 3),
+        "etapas_s": {nombre: round(segundos, 3) for nombre, segundos in _sumar(resultados, "etapas").items()},
+        "llamadas_api": _sumar(resultados, "llamadas_api"),
+        "cache_rutas": _sumar(resultados, "cache_rutas"),
+        "cache_geocodificacion": _sumar(resultados, "cache_geocodificacion"),
+        "detalle": [asdict(r) for r in resultados],
+    }
+    _escribir(os.path.join(salida, "resumen_lote.json"), json.dumps(resumen, ensure_ascii=False, indent=2))
+    logger.info(
+        f"Lote terminado: {resumen['particiones']} particiones ({resumen['errores']} con error) "
+        f"en {resumen['duracion_s']:.2f}s"
+    )
+    return resumen
@@ -1,61 +1,103 @@
 import requests
 import numpy as np
-import folium
-import googlemaps
-from sklearn.cluster import DBSCAN
-from math import radians, cos, sin, asin, sqrt
 import os
+import time
+import json
+import hashlib
 import logging
-from typing import List, Dict, Tuple, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Tuple, Optional, Sequence
 from datetime import datetime
+from app.core.config import obtener_configuracion
 from app.services.exceptions import ServicioExternoError
+from app.services.cache import CachePersistente
+from app.services.clientes import obtener_cliente_gmaps
+from app.services.agrupamiento import agrupar_coordenadas, agrupar_por_ventanas
+from app.services.distancias import haversine_km
+from app.services.fechas import VENTANA_HORAS, VENTANA_TIEMPO, VENTANAS, segundos_epoch, ventanas_tiempo
+from app.services.geocodificacion import geocodificar, geocodificar_lote
+from app.services.hoja_sheetdb import sincronizador_hoja
+from app.services.ingesta import (
+    DEDUP_TOLERANCIA_M,
+    colapsar_duplicados,
+    coordenadas_validas,
+    indices_por_grupo,
+    ingerir_registros,
+)
+from app.services.metricas import etapa, metricas, resumir
+from app.services.opciones import (
+    DISTANCIA_AGRUPAMIENTO_KM,
+    MAPA_INCREMENTAL,
+    OPTIMIZADOR_RUTAS,
+    OPTIMIZADORES,
+    PLANES,
+)
+from app.services.optimizador_rutas import ordenar_ruta_local
+from app.services.planificador import Deposito, PlanRutas, cargar_flota, planificar_rutas
+from app.services.puntos import GrupoPuntos, PuntosArray, PuntoVisita, como_grupo
+from app.services.render_mapa import (
+    MAPA_SIMPLIFICAR_ZOOM,
+    resolver_modo_render,
+    simplificar_polilinea,
+    tolerancia_para_zoom,
+)
 import polyline  # <--- Aseguramos la importación
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
 # Constantes
-SHEETDB_URL = os.getenv("API_SHEET_URL")
-HOTEL_MELIA_LIMA_COORDS = tuple(map(float, os.getenv("HOTEL_MELIA_LIMA_COORDS").split(',')))  # Latitud, Longitud
-HOTEL_MELIA_LIMA_DIRECCION = os.getenv("HOTEL_MELIA_LIMA_DIRECCION")  # Dirección textual opcional
-DISTANCIA_AGRUPAMIENTO_KM = 0.5
-EARTH_RADIUS_KM = 6371.0
-
-class PuntoVisita:
-    """Clase para representar un punto de visita"""
-    def __init__(self, lat: float, lon: float, direccion: str, fecha: str):
-        self.lat = lat
-        self.lon = lon
-        self.direccion = direccion
-        self.fecha = fecha
+MOTOR_AGRUPAMIENTO = os.getenv("MOTOR_AGRUPAMIENTO", "auto")  # auto, balltree o grilla
+DIRECTIONS_MAX_CONCURRENTES = int(os.getenv("DIRECTIONS_MAX_CONCURRENTES", "8"))  # Solicitudes simultáneas a Directions
+DIRECTIONS_TIMEOUT_S = float(os.getenv("DIRECTIONS_TIMEOUT_S", "20"))  # Tiempo límite por llamada
+RUTAS_CACHE_TTL_S = float(os.getenv("RUTAS_CACHE_TTL_S", "86400"))  # Vigencia de una ruta en cache
+RUTAS_CACHE_PRECISION = int(os.getenv("RUTAS_CACHE_PRECISION", "5"))  # Decimales de coordenadas en la clave
+RUTAS_CACHE_MAX_MEMORIA = int(os.getenv("RUTAS_CACHE_MAX_MEMORIA", "1024"))  # Entradas en el LRU en memoria
+MODO_TRANSPORTE = "driving"
+OPTIMIZADOR_PRESUPUESTO_S = float(os.getenv("OPTIMIZADOR_PRESUPUESTO_S", "1.0"))  # Mejora local por grupo
+PASADAS_ORDEN_TRAMOS = 0  # Mejoras del orden previo a los tramos (0: solo vecino más cercano); sin límite de tiempo, así los tramos y sus claves de cache se repiten
+MAX_WAYPOINTS_GOOGLE = 25  # Límite de waypoints por solicitud de Directions
+GEOCODIFICAR_FILAS = os.getenv("GEOCODIFICAR_FILAS", "true").lower() in ("1", "true", "si", "yes")
+MAPA_ARCHIVO_DIR = os.getenv("MAPA_ARCHIVO_DIR", "")  # Directorio para archivar cada mapa (vacío: no se guarda)
+
+# Colores para diferenciar rutas
+COLORES_RUTAS = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'lightred',
+                 'beige', 'darkblue', 'darkgreen', 'cadetblue', 'darkpurple',
+                 'white', 'pink', 'lightblue', 'lightgreen', 'gray', 'black',
+                 'lightgray']
+
+# Límite global de llamadas simultáneas a Directions (grupos y tramos comparten el cupo)
+_cupo_directions = threading.BoundedSemaphore(DIRECTIONS_MAX_CONCURRENTES)
+
+# Cache de respuestas de Google Directions (memoria + disco)
+cache_rutas = CachePersistente(
+    "rutas_directions",
+    ttl_s=RUTAS_CACHE_TTL_S,
+    max_memoria=RUTAS_CACHE_MAX_MEMORIA
+)
+
+# Coordenadas del origen, resueltas una sola vez por proceso
+_origen_resuelto: Optional[Tuple[float, float]] = None
+_origen_lock = threading.Lock()
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
-    Calcula la distancia entre dos puntos usando la fórmula de Haversine
+    Calcula la distancia entre dos puntos usando la fórmula de Haversine.
+    Para muchos puntos a la vez usar app.services.distancias.
     """
-    # Convertir a radianes
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    
-    # Diferencia de coordenadas
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    
-    # Fórmula de Haversine
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    
-    return EARTH_RADIUS_KM * c
+    return float(haversine_km(lat1, lon1, lat2, lon2))
 
 def obtener_datos_google_sheets() -> List[Dict]:
     """
-    Obtiene datos desde la API de Google Sheets
+    Obtiene datos de Google Sheets desde el snapshot local, sincronizado antes con SheetDB
+    (solo se descargan las filas nuevas, o la hoja completa si cambió de otra forma)
     """
     try:
         logger.info("Obteniendo datos desde Google Sheets...")
-        response = requests.get(SHEETDB_URL, timeout=30)
-        response.raise_for_status()
-        
-        data = response.json()
+        with etapa("sheetdb"):
+            data = sincronizador_hoja.obtener()
+        metricas.fijar("mapa_filas_hoja", len(data), "Filas de la hoja en la última lectura")
         logger.info(f"Datos obtenidos exitosamente: {len(data)} registros")
         return data
         
@@ -66,146 +108,529 @@ def obtener_datos_google_sheets() -> List[Dict]:
         logger.error(f"Error inesperado al obtener datos: {e}")
         raise ServicioExternoError(f"Error inesperado al obtener datos: {e}")
 
+def verificar_sheetdb(timeout_s: float = 10) -> str:
+    """
+    Verifica la conectividad con SheetDB sin descargar la hoja y retorna un estado legible
+    """
+    return sincronizador_hoja.sondear(timeout_s)
+
+def completar_coordenadas(datos: List[Dict], gmaps_client) -> List[Dict]:
+    """
+    Geocodifica (por lote y con cache) las filas que tienen Dirección pero no
+    coordenadas válidas, para no descartarlas. Retorna los datos con esas filas
+    completadas; las demás filas se conservan sin copiar.
+    """
+    if gmaps_client is None:
+        return datos
+
+    validas = coordenadas_validas(datos)
+    pendientes = [
+        i for i, registro in enumerate(datos)
+        if not validas[i] and str(registro.get('Dirección') or '').strip()
+    ]
+    if not pendientes:
+        return datos
+
+    coordenadas = geocodificar_lote([datos[i]['Dirección'] for i in pendientes], gmaps_client)
+    completados = list(datos)
+    recuperadas = 0
+    for i in pendientes:
+        coords = coordenadas.get(datos[i]['Dirección'])
+        if coords:
+            completados[i] = {**datos[i], 'Latitud': coords[0], 'Longitud': coords[1]}
+            recuperadas += 1
+    logger.info(f"Filas sin coordenadas recuperadas por geocodificación: {recuperadas} de {len(pendientes)}")
+    return completados
+
+def puntos_desde_tabla(tabla: PuntosArray, indices: Optional[np.ndarray] = None) -> List[PuntoVisita]:
+    """
+    Crea los PuntoVisita de las filas indicadas de la tabla (todas si no se indican)
+    """
+    return list(tabla.vista(indices))
+
 def validar_y_convertir_puntos(datos: List[Dict]) -> List[PuntoVisita]:
     """
     Valida y convierte los registros en objetos PuntoVisita
     """
-    puntos_validos = []
-    
-    for registro in datos:
-        try:
-            # Validar que existan los campos requeridos
-            if not all(campo in registro for campo in ['Latitud', 'Longitud', 'Dirección', 'FechaHora']):
-                logger.warning(f"Registro incompleto, saltando: {registro}")
-                continue
-            
-            # Convertir coordenadas a float
-            lat = float(registro['Latitud'])
-            lon = float(registro['Longitud'])
-            
-            # Validar rango de coordenadas
-            if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
-                logger.warning(f"Coordenadas fuera de rango válido: lat={lat}, lon={lon}")
-                continue
-            
-            # Crear punto válido
-            punto = PuntoVisita(
-                lat=lat,
-                lon=lon,
-                direccion=registro['Dirección'],
-                fecha=registro['FechaHora']
-            )
-            puntos_validos.append(punto)
-            
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Error al convertir registro: {registro}, error: {e}")
-            continue
+    tabla, _ = ingerir_registros(datos)
+    return puntos_desde_tabla(tabla)
+
+def colapsar_tabla(tabla: PuntosArray, ventana: str = "ninguna",
+                   horas: float = VENTANA_HORAS) -> Tuple[PuntosArray, int]:
+    """
+    Une los envíos repetidos a menos de DEDUP_TOLERANCIA_M en una sola parada,
+    sin mezclar puntos de ventanas de tiempo distintas
+    """
+    claves = None
+    if ventana != "ninguna":
+        fecha_s = tabla.fecha_s if tabla.fecha_s is not None else segundos_epoch(tabla.fecha)
+        claves = ventanas_tiempo(fecha_s, ventana, horas)
+    colapsada, colapsados = colapsar_duplicados(tabla, DEDUP_TOLERANCIA_M, claves)
+    if colapsados:
+        logger.info(f"Puntos repetidos unidos: {colapsados} (tolerancia {DEDUP_TOLERANCIA_M:g} m), "
+                    f"quedan {len(colapsada)} paradas")
+    return colapsada, colapsados
+
+def agrupar_tabla(tabla: PuntosArray, ventana: str = "ninguna", horas: float = VENTANA_HORAS) -> List[GrupoPuntos]:
+    """
+    Agrupa las coordenadas de la tabla sin crear objetos por punto.
+    Con una ventana de tiempo (dia, turno u horas) se agrupa en el espacio
+    dentro de cada ventana de FechaHora, así las visitas de días o turnos
+    distintos no comparten ruta.
+    Guarda la etiqueta de cada punto en la tabla y retorna cada grupo
+    como vista de índices sobre ella.
+    """
+    if not len(tabla):
+        return []
     
-    logger.info(f"Puntos válidos convertidos: {len(puntos_validos)} de {len(datos)}")
-    return puntos_validos
+    if ventana == "ninguna":
+        tabla.etiquetas = agrupar_coordenadas(tabla.lat, tabla.lon, DISTANCIA_AGRUPAMIENTO_KM, motor=MOTOR_AGRUPAMIENTO)
+    else:
+        fecha_s = tabla.fecha_s if tabla.fecha_s is not None else segundos_epoch(tabla.fecha)
+        ventanas = ventanas_tiempo(fecha_s, ventana, horas)
+        tabla.etiquetas = agrupar_por_ventanas(tabla.lat, tabla.lon, ventanas, DISTANCIA_AGRUPAMIENTO_KM,
+                                               motor=MOTOR_AGRUPAMIENTO)
+        sin_fecha = int((ventanas < 0).sum())
+        logger.info(f"Ventana de tiempo '{ventana}': {len(np.unique(ventanas))} ventanas"
+                    + (f" ({sin_fecha} puntos sin FechaHora válida)" if sin_fecha else ""))
+    grupos = [tabla.vista(indices) for indices in indices_por_grupo(tabla.etiquetas)]
+    logger.info(f"Puntos agrupados en {len(grupos)} grupos")
+    return grupos
 
 def agrupar_puntos_geograficamente(puntos: List[PuntoVisita]) -> List[List[PuntoVisita]]:
     """
-    Agrupa puntos geográficamente cercanos usando DBSCAN
+    Agrupa puntos geográficamente cercanos: DBSCAN con distancia haversine
+    (BallTree) o su equivalente por grilla para volúmenes grandes
     """
     if not puntos:
         return []
     
-    # Preparar datos para DBSCAN
-    coords = np.array([[p.lat, p.lon] for p in puntos])
-    
-    # Convertir distancia de km a grados (aproximadamente)
-    # 1 grado ≈ 111 km en el ecuador
-    eps_grados = DISTANCIA_AGRUPAMIENTO_KM / 111.0
-    
-    # Aplicar DBSCAN
-    clustering = DBSCAN(eps=eps_grados, min_samples=1).fit(coords)
+    # Agrupar por distancia haversine en km
+    etiquetas = agrupar_coordenadas(
+        [p.lat for p in puntos],
+        [p.lon for p in puntos],
+        DISTANCIA_AGRUPAMIENTO_KM,
+        motor=MOTOR_AGRUPAMIENTO
+    )
     
     # Agrupar puntos por cluster
-    grupos = {}
-    for i, label in enumerate(clustering.labels_):
-        if label not in grupos:
-            grupos[label] = []
-        grupos[label].append(puntos[i])
-    
-    grupos_lista = list(grupos.values())
+    grupos_lista = [[puntos[i] for i in indices] for indices in indices_por_grupo(etiquetas)]
     logger.info(f"Puntos agrupados en {len(grupos_lista)} grupos")
     
     return grupos_lista
 
 def geocode_address(address, gmaps_client):
-    geocode_result = gmaps_client.geocode(address)
-    if geocode_result and 'geometry' in geocode_result[0]:
-        location = geocode_result[0]['geometry']['location']
-        return (location['lat'], location['lng'])
-    return None
+    # Con cache persistente (incluye direcciones sin resultado)
+    return geocodificar(address, gmaps_client)
 
-def obtener_ruta_optimizada_grupo(gmaps_client, grupo: List[PuntoVisita]) -> Optional[Dict]:
+def clave_ruta(origen: str, waypoints: List[Tuple[float, float]], destino: Tuple[float, float],
+               modo: str = MODO_TRANSPORTE, precision: int = RUTAS_CACHE_PRECISION,
+               optimizar: bool = True) -> str:
     """
-    Obtiene la ruta optimizada para un grupo de puntos usando Google Maps,
-    siempre partiendo del origen fijo (HOTEL MELIA LIMA) y pasando por los puntos agrupados.
-    El origen puede ser una dirección textual si está definida en la variable de entorno HOTEL_MELIA_LIMA_DIRECCION.
+    Genera la clave canónica de una solicitud de Directions: origen, waypoints
+    redondeados (ordenados si Google los optimiza), destino y modo de transporte
     """
-    try:
-        if len(grupo) == 0:
-            logger.info("Grupo vacío, no se genera ruta.")
-            return None
+    def _redondear(coord: Tuple[float, float]) -> List[float]:
+        return [round(coord[0], precision), round(coord[1], precision)]
 
-        # Origen: dirección textual si está definida, si no, coordenadas
-        if HOTEL_MELIA_LIMA_DIRECCION:
-            origen = HOTEL_MELIA_LIMA_DIRECCION
-        else:
-            origen = f"{HOTEL_MELIA_LIMA_COORDS[0]},{HOTEL_MELIA_LIMA_COORDS[1]}"
-        # Destino: último punto del grupo
-        destino = f"{grupo[-1].lat},{grupo[-1].lon}"
-        # Waypoints: todos los puntos menos el último (si hay más de uno)
-        waypoints = [f"{p.lat},{p.lon}" for p in grupo[:-1]] if len(grupo) > 1 else None
+    waypoints_redondeados = [_redondear(w) for w in waypoints]
+    contenido = {
+        "origen": origen,
+        "waypoints": sorted(waypoints_redondeados) if optimizar else waypoints_redondeados,
+        "destino": _redondear(destino),
+        "modo": modo,
+        "optimizar": optimizar,
+    }
+    serializado = json.dumps(contenido, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+def _coordenadas_configuradas() -> Tuple[float, float]:
+    """Coordenadas fijas del origen (HOTEL_MELIA_LIMA_COORDS)"""
+    coords = obtener_configuracion().hotel_melia_lima_coords
+    if coords is None:
+        raise ServicioExternoError("HOTEL_MELIA_LIMA_COORDS no está configurada y no se pudo geocodificar el origen")
+    return coords
 
+def _origen_directions() -> str:
+    """Origen: dirección textual si está definida, si no, coordenadas"""
+    direccion = obtener_configuracion().hotel_melia_lima_direccion
+    if direccion:
+        return direccion
+    lat, lon = _coordenadas_configuradas()
+    return f"{lat},{lon}"
+
+def _solicitar_directions(gmaps_client, origen: str, intermedios: List[PuntoVisita], destino: PuntoVisita,
+                          optimizar: bool, cache: Optional[CachePersistente]) -> Optional[Dict]:
+    """
+    Solicita una ruta a Google Directions, consultando antes la cache
+    """
+    clave = clave_ruta(
+        origen,
+        [(p.lat, p.lon) for p in intermedios],
+        (destino.lat, destino.lon),
+        optimizar=optimizar
+    )
+    ruta = cache.obtener(clave) if cache is not None else None
+    if ruta is not None:
+        logger.info(f"Ruta tomada de cache para {len(intermedios) + 1} puntos")
+        return ruta
+
+    waypoints = [f"{p.lat},{p.lon}" for p in intermedios] if intermedios else None
+    # El cupo se espera con tiempo límite: si lo ocupan llamadas abandonadas por una
+    # construcción anterior, la solicitud falla y el grupo se dibuja con líneas rectas
+    # (obtener_ruta_optimizada_grupo / obtener_rutas_flota) en lugar de quedar esperando
+    if not _cupo_directions.acquire(timeout=DIRECTIONS_TIMEOUT_S):
+        logger.warning(f"Sin cupo para Google Directions tras {DIRECTIONS_TIMEOUT_S}s: "
+                       "las llamadas anteriores siguen en curso")
+        return None
+    try:
         directions_result = gmaps_client.directions(
             origin=origen,
-            destination=destino,
+            destination=f"{destino.lat},{destino.lon}",
             waypoints=waypoints,
-            optimize_waypoints=True if waypoints else False,
-            mode="driving"
+            optimize_waypoints=True if (waypoints and optimizar) else False,
+            mode=MODO_TRANSPORTE
         )
+    finally:
+        _cupo_directions.release()
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Respuesta Google Maps ({len(intermedios) + 1} puntos): {resumir(directions_result)}")
+
+    if not directions_result:
+        logger.warning(f"No se pudo obtener ruta para {len(intermedios) + 1} puntos")
+        return None
+
+    ruta = directions_result[0]
+    if cache is not None:
+        cache.guardar(clave, ruta)
+    return ruta
+
+def _unir_tramos(tramos: List[Dict]) -> Dict:
+    """
+    Une las rutas de tramos consecutivos en una sola ruta con una única overview_polyline
+    """
+    puntos = []
+    legs = []
+    for tramo in tramos:
+        decodificados = polyline.decode(tramo['overview_polyline']['points']) if 'overview_polyline' in tramo else []
+        if puntos and decodificados and puntos[-1] == decodificados[0]:
+            decodificados = decodificados[1:]
+        puntos.extend(decodificados)
+        legs.extend(tramo.get('legs', []))
+    return {'overview_polyline': {'points': polyline.encode(puntos)}, 'legs': legs, 'tramos': len(tramos)}
+
+def dividir_en_tramos(puntos: Sequence[PuntoVisita], max_waypoints: int = MAX_WAYPOINTS_GOOGLE) -> List[Sequence[PuntoVisita]]:
+    """
+    Divide un recorrido ordenado en tramos consecutivos que respetan el límite de waypoints
+    (cada tramo lleva hasta max_waypoints intermedios más su destino)
+    """
+    tamano = max_waypoints + 1
+    return [puntos[i:i + tamano] for i in range(0, len(puntos), tamano)]
+
+def _clave_orden_canonico(punto: PuntoVisita) -> Tuple[float, float, float, float]:
+    return (round(punto.lat, RUTAS_CACHE_PRECISION), round(punto.lon, RUTAS_CACHE_PRECISION), punto.lat, punto.lon)
+
+def _ruta_tramo(gmaps_client, origen: str, puntos: GrupoPuntos, optimizar: bool,
+                cache: Optional[CachePersistente]) -> Optional[Tuple[Dict, np.ndarray]]:
+    """
+    Ruta de un tramo con destino fijo en su último punto. Si Google optimiza, los intermedios
+    se envían en orden canónico para que waypoint_order sea válido también desde la cache.
+    Retorna la ruta y las posiciones de los puntos del tramo en el orden de visita.
+    """
+    n = len(puntos)
+    intermedios = np.arange(n - 1)
+    if optimizar:
+        claves = [_clave_orden_canonico(p) for p in puntos[:-1]]
+        intermedios = np.array(sorted(intermedios.tolist(), key=claves.__getitem__), dtype=np.intp)
+    ruta = _solicitar_directions(gmaps_client, origen, puntos.reordenar(intermedios), puntos[-1], optimizar, cache)
+    if ruta is None:
+        return None
+
+    # Reordenar los puntos según el orden optimizado (si hay waypoints)
+    if optimizar and 'waypoint_order' in ruta and len(intermedios):
+        intermedios = intermedios[ruta['waypoint_order']]
+    return ruta, np.append(intermedios, n - 1)
 
-        logger.info(f"Respuesta Google Maps grupo ({len(grupo)} puntos): {directions_result}")
+def _ruta_por_tramos(gmaps_client, origen: str, puntos: GrupoPuntos, optimizar: bool,
+                     cache: Optional[CachePersistente]) -> Optional[Tuple[Dict, GrupoPuntos]]:
+    """
+    Calcula la ruta de un recorrido en tramos que respetan el límite de waypoints de Google.
+    Cada tramo parte del último punto del anterior, así que todos se piden en paralelo;
+    luego se unen las polilíneas y el orden de visita en una sola ruta continua.
+    """
+    tramos = dividir_en_tramos(puntos)
+    if len(tramos) == 1:
+        resultado = _ruta_tramo(gmaps_client, origen, puntos, optimizar, cache)
+        return None if resultado is None else (resultado[0], puntos.reordenar(resultado[1]))
+
+    origenes = [origen] + [f"{t[-1].lat},{t[-1].lon}" for t in tramos[:-1]]
+    with ThreadPoolExecutor(max_workers=min(len(tramos), DIRECTIONS_MAX_CONCURRENTES),
+                            thread_name_prefix="directions-tramo") as ejecutor:
+        resultados = list(ejecutor.map(
+            lambda args: _ruta_tramo(gmaps_client, args[0], args[1], optimizar, cache),
+            zip(origenes, tramos)
+        ))
+
+    if any(r is None for r in resultados):
+        logger.warning(f"Falló {sum(r is None for r in resultados)} de {len(tramos)} tramos del recorrido")
+        return None
+
+    ruta = _unir_tramos([r for r, _ in resultados])
+    inicios = np.cumsum([0] + [len(t) for t in tramos[:-1]])
+    orden = np.concatenate([inicio + orden_tramo for inicio, (_, orden_tramo) in zip(inicios, resultados)])
 
-        if not directions_result:
-            logger.warning(f"No se pudo obtener ruta para grupo con {len(grupo)} puntos")
+    # waypoint_order de la ruta unida: índices sobre puntos[:-1], como en una sola solicitud
+    ruta['waypoint_order'] = orden[:-1].tolist()
+    logger.info(f"Recorrido de {len(puntos)} puntos resuelto en {len(tramos)} tramos")
+    return ruta, puntos.reordenar(orden)
+
+def _ruta_recta(puntos_ordenados: Sequence[PuntoVisita], origen: Optional[Tuple[float, float]] = None) -> Dict:
+    """
+    Ruta sin Google: líneas rectas desde el origen siguiendo el orden calculado localmente
+    """
+    coords = [tuple(origen or obtener_coordenadas_origen())] + [(p.lat, p.lon) for p in puntos_ordenados]
+    return {'overview_polyline': {'points': polyline.encode(coords)}, 'legs': [], 'optimizador': 'local'}
+
+def ordenar_grupo_local(grupo: Sequence[PuntoVisita],
+                        presupuesto_s: float = OPTIMIZADOR_PRESUPUESTO_S,
+                        max_pasadas: Optional[int] = None) -> GrupoPuntos:
+    """
+    Ordena el grupo desde el origen con el optimizador local (vecino más cercano + 2-opt + Or-opt)
+    """
+    grupo = como_grupo(grupo)
+    orden = ordenar_ruta_local(obtener_coordenadas_origen(), grupo.lat, grupo.lon,
+                               presupuesto_s=presupuesto_s, max_pasadas=max_pasadas)
+    return grupo.reordenar(orden)
+
+def obtener_ruta_optimizada_grupo(gmaps_client, grupo: Sequence[PuntoVisita],
+                                  cache: Optional[CachePersistente] = cache_rutas,
+                                  optimizador: Optional[str] = None) -> Optional[Dict]:
+    """
+    Obtiene la ruta optimizada para un grupo de puntos,
+    siempre partiendo del origen fijo (HOTEL MELIA LIMA) y pasando por los puntos agrupados.
+    El origen puede ser una dirección textual si está definida en la variable de entorno HOTEL_MELIA_LIMA_DIRECCION.
+    Las respuestas de Google se guardan en cache para no repetir la llamada si el grupo no cambia.
+
+    Optimizadores:
+    - google: Google ordena los waypoints (optimize_waypoints=True); si Google no responde,
+      líneas rectas en orden local
+    - local: orden calculado localmente, sin llamadas a Google (líneas rectas)
+    - hibrido: orden calculado localmente, Google solo aporta la geometría de la ruta
+
+    Los grupos que superan el límite de waypoints se dividen en tramos consecutivos
+    que se piden en paralelo y se unen en una sola ruta. El grupo ordenado es una
+    vista sobre los mismos puntos (las listas de PuntoVisita se pasan a columnas).
+    """
+    if optimizador is None:
+        optimizador = OPTIMIZADOR_RUTAS
+
+    try:
+        if len(grupo) == 0:
+            logger.info("Grupo vacío, no se genera ruta.")
             return None
-        else:
-            logger.info(f"Ruta obtenida para grupo con {len(grupo)} puntos: {directions_result[0]}")
 
-        # Reordenar los puntos según el orden optimizado (si hay waypoints)
-        ruta = directions_result[0]
-        if 'waypoint_order' in ruta and len(grupo) > 1:
-            orden = ruta['waypoint_order']
-            grupo_ordenado = [grupo[:-1][i] for i in orden] + [grupo[-1]]
-        else:
-            grupo_ordenado = grupo
+        grupo = como_grupo(grupo)
+        origen = _origen_directions()
+
+        if optimizador == "google":
+            if len(grupo) - 1 > MAX_WAYPOINTS_GOOGLE:
+                # Orden local previo para repartir los puntos en tramos compactos; Google optimiza
+                # el orden dentro de cada tramo. Se limita por pasadas y no por tiempo para que
+                # un grupo sin cambios dé los mismos tramos y se reutilicen sus rutas de la cache
+                puntos = ordenar_grupo_local(grupo, max_pasadas=PASADAS_ORDEN_TRAMOS)
+            else:
+                # Destino: último punto del grupo; waypoints: el resto
+                puntos = grupo
+            resultado = _ruta_por_tramos(gmaps_client, origen, puntos, True, cache)
+            if resultado is not None:
+                ruta, grupo_ordenado = resultado
+                return {'ruta': ruta, 'grupo_ordenado': grupo_ordenado}
+            # Sin respuesta de Google (o sin cupo): el grupo se dibuja recto en orden local
+            logger.warning(f"Sin ruta de Google para grupo con {len(grupo)} puntos; se usan líneas rectas")
+            grupo_ordenado = puntos if puntos is not grupo else ordenar_grupo_local(grupo)
+            return {'ruta': _ruta_recta(grupo_ordenado), 'grupo_ordenado': grupo_ordenado}
 
+        grupo_ordenado = ordenar_grupo_local(grupo)
+        ruta = None
+        if optimizador == "hibrido":
+            resultado = _ruta_por_tramos(gmaps_client, origen, grupo_ordenado, False, cache)
+            if resultado is None:
+                logger.warning(f"Sin geometría de Google para grupo con {len(grupo)} puntos; se usan líneas rectas")
+            else:
+                ruta = resultado[0]
+        if ruta is None:
+            ruta = _ruta_recta(grupo_ordenado)
         return {'ruta': ruta, 'grupo_ordenado': grupo_ordenado}
 
     except Exception as e:
         logger.error(f"Error al obtener ruta optimizada para grupo: {e}")
         return None
 
-def crear_mapa_interactivo(grupos_rutas: List[Tuple[List[PuntoVisita], Optional[Dict]]]) -> str:
+def obtener_rutas_grupos(gmaps_client, grupos: List[Sequence[PuntoVisita]],
+                         max_concurrentes: int = DIRECTIONS_MAX_CONCURRENTES,
+                         timeout_s: float = DIRECTIONS_TIMEOUT_S,
+                         cache: Optional[CachePersistente] = cache_rutas,
+                         optimizador: Optional[str] = None) -> List[Tuple[Sequence[PuntoVisita], Optional[Dict]]]:
     """
-    Crea un mapa interactivo con todas las rutas
+    Obtiene las rutas optimizadas de todos los grupos en paralelo, con un máximo de
+    solicitudes simultáneas y un tiempo límite por llamada a Directions (un grupo con
+    varios tramos tiene timeout_s por tramo). El resultado conserva el orden de los grupos;
+    los grupos sin ruta llevan None.
+
+    Un grupo vencido se abandona, pero sus llamadas en curso no se pueden interrumpir:
+    siguen hasta que el cliente de Google las corta (timeout por intento y retry_timeout
+    para los reintentos, ambos DIRECTIONS_TIMEOUT_S) y hasta entonces ocupan su cupo.
+    Las construcciones siguientes esperan ese cupo como máximo DIRECTIONS_TIMEOUT_S.
     """
-    # Inicializar cliente Google Maps
-    api_key = os.getenv('GOOGLE_MAPS_API_KEY')
-    gmaps_client = googlemaps.Client(key=api_key)
+    if not grupos:
+        return []
 
-    # Determinar coordenadas del origen
-    if HOTEL_MELIA_LIMA_DIRECCION:
-        origen_coords = geocode_address(HOTEL_MELIA_LIMA_DIRECCION, gmaps_client)
+    rutas: List[Optional[Dict]] = [None] * len(grupos)
+    fallidos: List[int] = []
+    inicios: Dict[int, float] = {}
+
+    limites = [timeout_s * len(dividir_en_tramos(grupo)) for grupo in grupos]
+
+    def _tarea(indice: int) -> Optional[Dict]:
+        inicios[indice] = time.monotonic()
+        return obtener_ruta_optimizada_grupo(gmaps_client, grupos[indice], cache=cache, optimizador=optimizador)
+
+    ejecutor = ThreadPoolExecutor(
+        max_workers=max(1, min(max_concurrentes, len(grupos))),
+        thread_name_prefix="directions"
+    )
+    try:
+        futuros = {ejecutor.submit(_tarea, i): i for i in range(len(grupos))}
+        pendientes = set(futuros)
+        while pendientes:
+            listos, pendientes = wait(pendientes, timeout=0.1, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                indice = futuros[futuro]
+                try:
+                    rutas[indice] = futuro.result()
+                except Exception as e:
+                    logger.error(f"Error al obtener ruta para grupo {indice + 1}: {e}")
+                if rutas[indice] is None:
+                    fallidos.append(indice)
+
+            # Abandonar las llamadas que superaron el tiempo límite
+            ahora = time.monotonic()
+            vencidos = {
+                f for f in pendientes
+                if futuros[f] in inicios and ahora - inicios[futuros[f]] > limites[futuros[f]]
+            }
+            for futuro in vencidos:
+                logger.warning(f"Tiempo límite de {limites[futuros[futuro]]:g}s agotado para grupo "
+                               f"{futuros[futuro] + 1}; sus llamadas en curso terminan en segundo plano")
+                fallidos.append(futuros[futuro])
+            pendientes -= vencidos
+    finally:
+        ejecutor.shutdown(wait=False, cancel_futures=True)
+
+    if fallidos:
+        logger.warning(
+            f"No se obtuvo ruta para {len(fallidos)} de {len(grupos)} grupos: "
+            f"{sorted(i + 1 for i in fallidos)}"
+        )
+
+    return list(zip(grupos, rutas))
+
+def obtener_rutas_flota(gmaps_client, plan: PlanRutas, optimizador: str = "local",
+                        cache: Optional[CachePersistente] = cache_rutas) -> List[Tuple[GrupoPuntos, Optional[Dict]]]:
+    """
+    Geometría de la ruta de cada vehículo del plan, en el orden ya calculado por el planificador.
+    Con el optimizador local son líneas rectas desde su depósito; con google o hibrido
+    Google aporta la geometría (sin reordenar) y, si falla, se usan líneas rectas.
+    """
+    def _ruta(ruta_vehiculo) -> Tuple[GrupoPuntos, Optional[Dict]]:
+        deposito = ruta_vehiculo.deposito
+        puntos = ruta_vehiculo.puntos
+        ruta = None
+        if optimizador != "local" and gmaps_client is not None:
+            resultado = _ruta_por_tramos(gmaps_client, f"{deposito.lat},{deposito.lon}", puntos, False, cache)
+            if resultado is None:
+                logger.warning(f"Sin geometría de Google para {ruta_vehiculo.vehiculo.nombre}; se usan líneas rectas")
+            else:
+                ruta = resultado[0]
+        if ruta is None:
+            ruta = _ruta_recta(puntos, (deposito.lat, deposito.lon))
+        etiqueta = f"{ruta_vehiculo.vehiculo.nombre} ({deposito.nombre})"
+        return puntos, {'ruta': ruta, 'grupo_ordenado': puntos, 'etiqueta': etiqueta}
+
+    if not plan.rutas:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(DIRECTIONS_MAX_CONCURRENTES, len(plan.rutas))),
+                            thread_name_prefix="directions-flota") as ejecutor:
+        return list(ejecutor.map(_ruta, plan.rutas))
+
+def obtener_coordenadas_origen() -> Tuple[float, float]:
+    """
+    Coordenadas del origen: la dirección geocodificada si está configurada, si no las coordenadas fijas.
+    Se resuelven una vez por proceso, en el primer uso (la primera construcción); si la geocodificación
+    falla se usan las coordenadas fijas y se reintenta en la próxima llamada.
+    """
+    global _origen_resuelto
+    if _origen_resuelto is not None:
+        return _origen_resuelto
+
+    with _origen_lock:
+        if _origen_resuelto is not None:
+            return _origen_resuelto
+
+        api_key = os.getenv('GOOGLE_MAPS_API_KEY')
+        direccion = obtener_configuracion().hotel_melia_lima_direccion
+        if not (direccion and api_key):
+            _origen_resuelto = _coordenadas_configuradas()
+            return _origen_resuelto
+
+        gmaps_client = obtener_cliente_gmaps(api_key, timeout=DIRECTIONS_TIMEOUT_S)
+        origen_coords = geocode_address(direccion, gmaps_client)
         if not origen_coords:
-            origen_coords = HOTEL_MELIA_LIMA_COORDS
-    else:
-        origen_coords = HOTEL_MELIA_LIMA_COORDS
+            logger.warning("No se pudo geocodificar el origen; se usan HOTEL_MELIA_LIMA_COORDS")
+            return _coordenadas_configuradas()
+        _origen_resuelto = origen_coords
+        logger.info(f"Origen resuelto: {direccion} -> {origen_coords}")
+        return _origen_resuelto
+
+def _grupo_y_ruta(grupo: List[PuntoVisita], ruta_data: Optional[Dict]) -> Tuple[List[PuntoVisita], Optional[Dict]]:
+    """Puntos en orden de visita y respuesta de Directions (si la hay) de un grupo"""
+    if ruta_data and isinstance(ruta_data, dict) and 'grupo_ordenado' in ruta_data:
+        return ruta_data['grupo_ordenado'], ruta_data['ruta']
+    return grupo, ruta_data
+
+def _etiqueta_grupo(i: int, ruta_data: Optional[Dict]) -> str:
+    """Nombre de la ruta en el mapa: el vehículo en un plan de flota, si no el número de grupo"""
+    if isinstance(ruta_data, dict) and ruta_data.get('etiqueta'):
+        return ruta_data['etiqueta']
+    return f"Grupo {i + 1}"
+
+def _origenes_mapa(origenes: Optional[List[Deposito]]) -> List[Deposito]:
+    """Puntos de salida a dibujar: los depósitos del plan o el origen fijo"""
+    if origenes:
+        return origenes
+    lat, lon = obtener_coordenadas_origen()
+    return [Deposito("HOTEL MELIA LIMA", lat, lon, obtener_configuracion().hotel_melia_lima_direccion or "Av. Salaverry 2599, San Isidro, Lima, Perú")]
+
+def crear_mapa_interactivo(grupos_rutas: List[Tuple[List[PuntoVisita], Optional[Dict]]],
+                           modo_render: Optional[str] = None,
+                           origenes: Optional[List[Deposito]] = None) -> str:
+    """
+    Crea un mapa interactivo con todas las rutas y retorna su HTML.
+    Con muchos puntos (modo cluster o canvas) los puntos viajan en un arreglo de datos
+    y se dibujan en el navegador; las polilíneas se simplifican antes de incluirlas.
+    Los origenes (depósitos de un plan de flota) reemplazan al origen fijo.
+    """
+    # folium se carga al dibujar el primer mapa (o en el precalentamiento), no al importar el módulo
+    import folium
+    from app.services.capas_folium import capa_puntos
+
+    # Determinar coordenadas del origen
+    origenes = _origenes_mapa(origenes)
+    origen_coords = (origenes[0].lat, origenes[0].lon)
+    modo = resolver_modo_render(modo_render, sum(len(grupo) for grupo, _ in grupos_rutas))
+    tolerancia_m = tolerancia_para_zoom(origen_coords[0], MAPA_SIMPLIFICAR_ZOOM) if MAPA_SIMPLIFICAR_ZOOM else 0
+    filas_puntos = []
 
     # Crear mapa centrado en el origen real
     mapa = folium.Map(
@@ -214,31 +639,26 @@ def crear_mapa_interactivo(grupos_rutas: List[Tuple[List[PuntoVisita], Optional[
         tiles='OpenStreetMap'
     )
     
-    # Colores para diferenciar rutas
-    colores = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'lightred', 
-               'beige', 'darkblue', 'darkgreen', 'cadetblue', 'darkpurple', 
-               'white', 'pink', 'lightblue', 'lightgreen', 'gray', 'black', 
-               'lightgray']
-    
-    # Agregar punto de salida (HOTEL MELIA LIMA) destacado
-    folium.Marker(
-        origen_coords,
-        popup='<b style="color:#0a1172;font-size:16px;">★ ORIGEN: HOTEL MELIA LIMA</b><br><span style="color:#0a1172;">Av. Salaverry 2599, San Isidro, Lima, Perú</span>',
-        icon=folium.Icon(color='darkblue', icon='star')
-    ).add_to(mapa)
+    # Agregar puntos de salida (HOTEL MELIA LIMA o depósitos) destacados
+    for origen in origenes:
+        folium.Marker(
+            [origen.lat, origen.lon],
+            popup=f'<b style="color:#0a1172;font-size:16px;">★ ORIGEN: {origen.nombre}</b><br><span style="color:#0a1172;">{origen.direccion or ""}</span>',
+            icon=folium.Icon(color='darkblue', icon='star')
+        ).add_to(mapa)
     
     # Procesar cada grupo
     for i, (grupo, ruta_data) in enumerate(grupos_rutas):
-        color = colores[i % len(colores)]
+        color = COLORES_RUTAS[i % len(COLORES_RUTAS)]
+        etiqueta = _etiqueta_grupo(i, ruta_data)
         # Usar grupo_ordenado si está disponible
-        if ruta_data and isinstance(ruta_data, dict) and 'grupo_ordenado' in ruta_data:
-            grupo = ruta_data['grupo_ordenado']
-            ruta = ruta_data['ruta']
-        else:
-            ruta = ruta_data
+        grupo, ruta = _grupo_y_ruta(grupo, ruta_data)
         
         # Agregar puntos del grupo
         for punto in grupo:
+            if modo != "marcadores":
+                filas_puntos.append([punto.lat, punto.lon, color, punto.direccion, punto.fecha])
+                continue
             folium.Marker(
                 [punto.lat, punto.lon],
                 popup=f'<b>Punto de visita</b><br>Dirección: {punto.direccion}<br>Fecha: {punto.fecha}',
@@ -247,79 +667,276 @@ def crear_mapa_interactivo(grupos_rutas: List[Tuple[List[PuntoVisita], Optional[
         
         # Log de depuración para ver la respuesta de Google Maps
         if ruta:
-            logger.info(f"Ruta para grupo {i+1}: {ruta}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Ruta para grupo {i+1}: {resumir(ruta)}")
             if 'overview_polyline' not in ruta:
                 logger.warning(f"NO HAY overview_polyline para grupo {i+1}. Claves disponibles: {list(ruta.keys())}")
         # Agregar ruta si existe
         if ruta and 'overview_polyline' in ruta:
             try:
-                polyline_points = polyline.decode(ruta['overview_polyline']['points'])
+                polyline_points = simplificar_polilinea(
+                    polyline.decode(ruta['overview_polyline']['points']),
+                    tolerancia_m
+                )
                 folium.PolyLine(
                     locations=polyline_points,
                     weight=3,
                     color=color,
                     opacity=0.8,
-                    popup=f'Ruta Grupo {i+1}'
+                    popup=f'Ruta {etiqueta}'
                 ).add_to(mapa)
             except Exception as e:
                 logger.error(f"Error al dibujar ruta para grupo {i+1}: {e}")
     
-    # Guardar mapa
-    archivo_html = "rutas_hotel_melia_lima.html"
-    mapa.save(archivo_html)
-    logger.info(f"Mapa guardado como {archivo_html}")
+    # Puntos de visita como un solo arreglo de datos (cluster o canvas)
+    if filas_puntos:
+        capa_puntos(filas_puntos, modo).add_to(mapa)
+    
+    # Renderizar en memoria (equivalente a mapa.save sin pasar por disco)
+    html = mapa.get_root().render()
+    logger.info(f"Mapa renderizado en memoria ({len(html) / 1024:.0f} KB, modo {modo})")
     
+    return html
+
+def construir_geojson(grupos_rutas: List[Tuple[List[PuntoVisita], Optional[Dict]]],
+                      origenes: Optional[List[Deposito]] = None) -> Dict:
+    """
+    Representa los grupos como GeoJSON para dibujarlos en el cliente: los orígenes, un Point
+    por punto de visita (grupo y orden de visita) y una Feature por ruta con la polilínea
+    codificada tal como la entrega Google (geometry null, se decodifica en el navegador)
+    """
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [origen.lon, origen.lat]},
+            "properties": {"tipo": "origen", "nombre": origen.nombre, "direccion": origen.direccion},
+        }
+        for origen in _origenes_mapa(origenes)
+    ]
+
+    for i, (grupo, ruta_data) in enumerate(grupos_rutas):
+        color = COLORES_RUTAS[i % len(COLORES_RUTAS)]
+        etiqueta = _etiqueta_grupo(i, ruta_data)
+        grupo, ruta = _grupo_y_ruta(grupo, ruta_data)
+
+        for orden, punto in enumerate(grupo):
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [punto.lon, punto.lat]},
+                "properties": {
+                    "tipo": "visita", "grupo": i, "orden": orden, "color": color,
+                    "direccion": punto.direccion, "fecha": punto.fecha,
+                },
+            })
+
+        if ruta and 'overview_polyline' in ruta:
+            features.append({
+                "type": "Feature",
+                "geometry": None,
+                "properties": {
+                    "tipo": "ruta", "grupo": i, "etiqueta": etiqueta, "color": color,
+                    "polyline": ruta['overview_polyline']['points'],
+                },
+            })
+
+    return {"type": "FeatureCollection", "features": features}
+
+def archivar_mapa_html(html: str, directorio: str = MAPA_ARCHIVO_DIR) -> str:
+    """
+    Guarda una copia del mapa en un archivo propio de esta construcción
+    (escritura atómica: nunca se lee un archivo a medio escribir)
+    """
+    os.makedirs(directorio, exist_ok=True)
+    nombre = f"rutas_hotel_melia_lima_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.html"
+    archivo_html = os.path.join(directorio, nombre)
+    temporal = archivo_html + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(html)
+    os.replace(temporal, archivo_html)
+    logger.info(f"Mapa archivado como {archivo_html}")
     return archivo_html
 
-def generar_mapa_rutas() -> str:
+def _cliente_para(optimizador: str):
+    """Cliente de Google Maps compartido; el optimizador local puede trabajar sin API key"""
+    api_key = os.getenv('GOOGLE_MAPS_API_KEY')
+    if api_key:
+        return obtener_cliente_gmaps(api_key, timeout=DIRECTIONS_TIMEOUT_S)
+    if optimizador == "local":
+        return None
+    raise ServicioExternoError("GOOGLE_MAPS_API_KEY no está configurada")
+
+def _registrar_puntos(validos: int, rechazados: int, rutas: int, colapsados: int = 0):
+    """Tamaño de la última construcción para /metrics"""
+    metricas.fijar("mapa_puntos", validos, "Puntos válidos de la última construcción")
+    metricas.fijar("mapa_puntos_colapsados", colapsados, "Puntos repetidos unidos a otra parada en la última construcción")
+    metricas.fijar("mapa_filas_rechazadas", rechazados, "Filas descartadas en la última construcción")
+    metricas.fijar("mapa_rutas", rutas, "Grupos o vehículos de la última construcción")
+
+def calcular_grupos_rutas(incremental: Optional[bool] = None, optimizador: Optional[str] = None,
+                          datos: Optional[List[Dict]] = None, ventana: Optional[str] = None,
+                          horas: Optional[float] = None) -> List[Tuple[List[PuntoVisita], Optional[Dict]]]:
     """
-    Función principal que ejecuta todo el proceso de generación de rutas
+    Ejecuta el proceso de datos a rutas: obtiene la hoja, agrupa los puntos
+    y calcula la ruta de cada grupo.
+    En modo incremental solo se recalculan los grupos afectados por filas
+    nuevas o eliminadas desde la construcción anterior.
+    El optimizador (google, local o hibrido) decide cómo se ordena cada grupo.
+    La ventana de tiempo (dia, turno u horas) separa los grupos por FechaHora;
+    con ventana el mapa se calcula completo (el snapshot incremental es solo espacial).
+    Si se reciben los datos de la hoja ya descargados no se vuelven a pedir.
     """
+    if incremental is None:
+        incremental = MAPA_INCREMENTAL
+    if optimizador is None:
+        optimizador = OPTIMIZADOR_RUTAS
+    if optimizador not in OPTIMIZADORES:
+        raise ValueError(f"Optimizador inválido: {optimizador}. Opciones: {', '.join(OPTIMIZADORES)}")
+    ventana = ventana or VENTANA_TIEMPO
+    if ventana not in VENTANAS:
+        raise ValueError(f"Ventana de tiempo inválida: {ventana}. Opciones: {', '.join(VENTANAS)}")
+    if ventana != "ninguna":
+        incremental = False
+
     try:
         # 1. Obtener datos de Google Sheets
-        datos = obtener_datos_google_sheets()
+        if datos is None:
+            datos = obtener_datos_google_sheets()
         
-        # 2. Convertir a puntos válidos
-        puntos = validar_y_convertir_puntos(datos)
+        # 2. Inicializar cliente de Google Maps (el optimizador local no lo necesita)
+        gmaps_client = _cliente_para(optimizador)
         
-        if not puntos:
-            raise ServicioExternoError("No se encontraron puntos válidos en los datos")
-        
-        # 3. Agrupar puntos geográficamente
-        grupos = agrupar_puntos_geograficamente(puntos)
-        
-        # 4. Inicializar cliente de Google Maps
-        api_key = os.getenv('GOOGLE_MAPS_API_KEY')
-        if not api_key:
-            raise ServicioExternoError("GOOGLE_MAPS_API_KEY no está configurada")
+        # Recuperar filas con dirección pero sin coordenadas válidas
+        if GEOCODIFICAR_FILAS:
+            with etapa("geocodificacion"):
+                datos = completar_coordenadas(datos, gmaps_client)
         
-        gmaps_client = googlemaps.Client(key=api_key)
+        if incremental:
+            # 3-5. Convertir, agrupar y obtener rutas solo de lo que cambió
+            from app.services.incremental import estado_incremental
+            grupos_rutas = estado_incremental.actualizar(datos, gmaps_client, optimizador)
+            
+            if not estado_incremental.cantidad_puntos():
+                raise ServicioExternoError("No se encontraron puntos válidos en los datos")
+            _registrar_puntos(estado_incremental.cantidad_puntos(), len(estado_incremental.descartados),
+                              len(grupos_rutas), estado_incremental.colapsados)
+        else:
+            # 3. Validar en bloque (columnas NumPy, rechazos agregados)
+            with etapa("ingesta"):
+                tabla, reporte = ingerir_registros(datos)
+            
+            if not len(tabla):
+                raise ServicioExternoError("No se encontraron puntos válidos en los datos")
+            validos = len(tabla)
+            
+            # Unir envíos repetidos en una sola parada
+            with etapa("duplicados"):
+                tabla, colapsados = colapsar_tabla(tabla, ventana, horas or VENTANA_HORAS)
+            
+            # 4. Agrupar coordenadas; cada grupo es una vista de índices sobre la tabla
+            with etapa("agrupamiento"):
+                grupos = agrupar_tabla(tabla, ventana, horas or VENTANA_HORAS)
+            
+            # 5. Obtener rutas optimizadas para cada grupo (en paralelo)
+            with etapa("rutas"):
+                grupos_rutas = obtener_rutas_grupos(gmaps_client, grupos, optimizador=optimizador)
+            _registrar_puntos(validos, reporte.rechazadas, len(grupos_rutas), colapsados)
         
-        # 5. Obtener rutas optimizadas para cada grupo
-        grupos_rutas = []
-        for grupo in grupos:
-            ruta_data = obtener_ruta_optimizada_grupo(gmaps_client, grupo)
-            grupos_rutas.append((grupo, ruta_data))
+        return grupos_rutas
         
+    except Exception as e:
+        logger.error(f"Error en el proceso de generación de rutas: {e}")
+        raise ServicioExternoError(f"Error en el proceso de generación de rutas: {e}")
+
+def calcular_plan_flota(optimizador: Optional[str] = None, datos: Optional[List[Dict]] = None
+                        ) -> Tuple[List[Tuple[GrupoPuntos, Optional[Dict]]], List[Deposito]]:
+    """
+    Reparte los puntos de la hoja entre los vehículos de la flota (PLAN_FLOTA) y
+    retorna la ruta de cada vehículo junto con los depósitos, listos para dibujar.
+    El orden de cada ruta lo decide el planificador; el optimizador solo indica si
+    la geometría se pide a Google (google o hibrido) o son líneas rectas (local).
+    """
+    if optimizador is None:
+        optimizador = OPTIMIZADOR_RUTAS
+    if optimizador not in OPTIMIZADORES:
+        raise ValueError(f"Optimizador inválido: {optimizador}. Opciones: {', '.join(OPTIMIZADORES)}")
+
+    try:
+        if datos is None:
+            datos = obtener_datos_google_sheets()
+        gmaps_client = _cliente_para(optimizador)
+        if GEOCODIFICAR_FILAS:
+            with etapa("geocodificacion"):
+                datos = completar_coordenadas(datos, gmaps_client)
+
+        with etapa("ingesta"):
+            tabla, reporte = ingerir_registros(datos)
+        if not len(tabla):
+            raise ServicioExternoError("No se encontraron puntos válidos en los datos")
+        validos = len(tabla)
+        with etapa("duplicados"):
+            tabla, colapsados = colapsar_tabla(tabla)
+
+        flota = cargar_flota(obtener_coordenadas_origen())
+        with etapa("planificacion"):
+            plan = planificar_rutas(tabla, flota)
+        with etapa("rutas"):
+            grupos_rutas = obtener_rutas_flota(gmaps_client, plan, optimizador)
+        _registrar_puntos(validos, reporte.rechazadas, len(plan.rutas), colapsados)
+        if len(plan.sin_asignar):
+            # Se dibujan sin ruta para que se vean los puntos que la flota no cubre
+            logger.warning(f"{len(plan.sin_asignar)} puntos no caben en la flota y quedan sin asignar")
+            sin_asignar = tabla.vista(plan.sin_asignar)
+            grupos_rutas.append((sin_asignar, {'ruta': None, 'grupo_ordenado': sin_asignar, 'etiqueta': "Sin asignar"}))
+        return grupos_rutas, flota.depositos
+
+    except Exception as e:
+        logger.error(f"Error en la planificación de la flota: {e}")
+        raise ServicioExternoError(f"Error en la planificación de la flota: {e}")
+
+def calcular_rutas(incremental: Optional[bool] = None, optimizador: Optional[str] = None,
+                   datos: Optional[List[Dict]] = None, plan: str = "grupos",
+                   ventana: Optional[str] = None, horas: Optional[float] = None
+                   ) -> Tuple[List[Tuple[Sequence[PuntoVisita], Optional[Dict]]], Optional[List[Deposito]]]:
+    """
+    Rutas a dibujar y sus orígenes (None: el origen fijo) según el tipo de plan.
+    La ventana de tiempo solo aplica a los grupos; la flota ya reparte por jornada.
+    """
+    if plan not in PLANES:
+        raise ValueError(f"Plan inválido: {plan}. Opciones: {', '.join(PLANES)}")
+    if plan == "flota":
+        return calcular_plan_flota(optimizador, datos)
+    return calcular_grupos_rutas(incremental, optimizador, datos, ventana, horas), None
+
+def generar_mapa_rutas(incremental: Optional[bool] = None, optimizador: Optional[str] = None,
+                       datos: Optional[List[Dict]] = None, plan: str = "grupos",
+                       ventana: Optional[str] = None, horas: Optional[float] = None) -> str:
+    """
+    Función principal que ejecuta todo el proceso de generación de rutas.
+    Retorna el HTML del mapa; si MAPA_ARCHIVO_DIR está definido también se archiva.
+    Con plan="flota" las rutas son las de los vehículos de la flota en lugar de una por grupo.
+    """
+    grupos_rutas, origenes = calcular_rutas(incremental, optimizador, datos, plan, ventana, horas)
+    
+    try:
         # 6. Crear mapa interactivo
-        archivo_html = crear_mapa_interactivo(grupos_rutas)
+        with etapa("render"):
+            html = crear_mapa_interactivo(grupos_rutas, origenes=origenes)
+        if MAPA_ARCHIVO_DIR:
+            archivar_mapa_html(html)
         
         logger.info("Proceso de generación de rutas completado exitosamente")
-        return archivo_html
+        return html
         
     except Exception as e:
         logger.error(f"Error en el proceso de generación de rutas: {e}")
         raise ServicioExternoError(f"Error en el proceso de generación de rutas: {e}")
 
-def leer_archivo_html(archivo_html: str) -> str:
+def generar_geojson_rutas(incremental: Optional[bool] = None, optimizador: Optional[str] = None,
+                          datos: Optional[List[Dict]] = None, plan: str = "grupos",
+                          ventana: Optional[str] = None, horas: Optional[float] = None) -> Dict:
     """
-    Lee el contenido del archivo HTML generado
+    Igual que generar_mapa_rutas pero retorna los grupos y rutas como GeoJSON, sin folium
     """
-    try:
-        with open(archivo_html, 'r', encoding='utf-8') as f:
-            contenido = f.read()
-        return contenido
-    except FileNotFoundError:
-        raise ServicioExternoError(f"Archivo {archivo_html} no encontrado")
-    except Exception as e:
-        raise ServicioExternoError(f"Error al leer archivo HTML: {e}") 
\ No newline at end of file
+    grupos_rutas, origenes = calcular_rutas(incremental, optimizador, datos, plan, ventana, horas)
+    with etapa("render"):
+        return construir_geojson(grupos_rutas, origenes=origenes)
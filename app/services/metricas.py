@@ -0,0 +1,183 @@
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+METRICAS_BUCKETS_S = tuple(
+    float(b) for b in os.getenv("METRICAS_BUCKETS_S", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60").split(",")
+)  # Límites (segundos) de los histogramas de latencia
+LOG_MAX_CARACTERES = int(os.getenv("LOG_MAX_CARACTERES", "500"))  # Largo máximo de los payloads en el log
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+# Valores calculados al momento de exportar: (nombre, tipo, ayuda, etiquetas, valor)
+MuestraRecolectada = Tuple[str, str, str, Dict[str, str], float]
+
+def resumir(valor, max_caracteres: int = LOG_MAX_CARACTERES) -> str:
+    """Texto de un payload para el log, truncado a max_caracteres"""
+    texto = str(valor)
+    if len(texto) <= max_caracteres:
+        return texto
+    return f"{texto[:max_caracteres]}... ({len(texto)} caracteres)"
+
+@dataclass
+class Histograma:
+    limites: Tuple[float, ...]
+    conteos: List[int] = field(default_factory=list)
+    suma: float = 0.0
+    total: int = 0
+
+    def __post_init__(self):
+        self.conteos = [0] * len(self.limites)
+
+    def observar(self, valor: float):
+        for i, limite in enumerate(self.limites):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+        self.suma += valor
+        self.total += 1
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _formato_etiquetas(etiquetas: Iterable[Tuple[str, str]]) -> str:
+    pares = ",".join(f'{k}="{_escapar(str(v))}"' for k, v in etiquetas)
+    return "{" + pares + "}" if pares else ""
+
+def _formato_valor(valor: float) -> str:
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+class RegistroMetricas:
+    """
+    Contadores, valores actuales (gauges) e histogramas del proceso, exportados
+    en el formato de texto de Prometheus. Los valores que ya llevan otros
+    componentes (caches, llamadas a Google) se leen al exportar mediante recolectores.
+    """
+    def __init__(self, limites: Tuple[float, ...] = METRICAS_BUCKETS_S):
+        self.limites = tuple(sorted(limites))
+        self._tipos: Dict[str, Tuple[str, str]] = {}
+        self._valores: Dict[Tuple[str, Etiquetas], float] = {}
+        self._histogramas: Dict[Tuple[str, Etiquetas], Histograma] = {}
+        self._recolectores: List[Callable[[], Iterable[MuestraRecolectada]]] = []
+        self._lock = threading.Lock()
+
+    def _clave(self, nombre: str, tipo: str, ayuda: str, etiquetas: Dict[str, str]) -> Tuple[str, Etiquetas]:
+        self._tipos.setdefault(nombre, (tipo, ayuda))
+        return nombre, tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+    def incrementar(self, nombre: str, valor: float = 1, ayuda: str = "", **etiquetas):
+        """Suma a un contador (nombres terminados en _total)"""
+        with self._lock:
+            clave = self._clave(nombre, "counter", ayuda, etiquetas)
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def fijar(self, nombre: str, valor: float, ayuda: str = "", **etiquetas):
+        """Fija un valor actual, como el tamaño de la última construcción"""
+        with self._lock:
+            self._valores[self._clave(nombre, "gauge", ayuda, etiquetas)] = valor
+
+    def observar(self, nombre: str, valor: float, ayuda: str = "", **etiquetas):
+        """Agrega una observación (en segundos) a un histograma"""
+        with self._lock:
+            clave = self._clave(nombre, "histogram", ayuda, etiquetas)
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = Histograma(self.limites)
+            histograma.observar(valor)
+
+    def valor(self, nombre: str, **etiquetas) -> Optional[float]:
+        """Valor actual de un contador o gauge (None si aún no se registró)"""
+        with self._lock:
+            return self._valores.get((nombre, tuple(sorted((k, str(v)) for k, v in etiquetas.items()))))
+
+    def registrar_recolector(self, recolector: Callable[[], Iterable[MuestraRecolectada]]):
+        with self._lock:
+            self._recolectores.append(recolector)
+
+    def exportar(self) -> str:
+        """Métricas en el formato de texto de Prometheus (versión 0.0.4)"""
+        with self._lock:
+            tipos = dict(self._tipos)
+            muestras: Dict[str, List[Tuple[str, Etiquetas, float]]] = {}
+            for (nombre, etiquetas), valor in self._valores.items():
+                muestras.setdefault(nombre, []).append((nombre, etiquetas, valor))
+            for (nombre, etiquetas), histograma in self._histogramas.items():
+                series = muestras.setdefault(nombre, [])
+                acumulado = 0
+                for limite, conteo in zip(histograma.limites, histograma.conteos):
+                    acumulado += conteo
+                    series.append((nombre + "_bucket", etiquetas + (("le", _formato_valor(limite)),), acumulado))
+                series.append((nombre + "_bucket", etiquetas + (("le", "+Inf"),), histograma.total))
+                series.append((nombre + "_sum", etiquetas, histograma.suma))
+                series.append((nombre + "_count", etiquetas, histograma.total))
+            recolectores = list(self._recolectores)
+
+        for recolector in recolectores:
+            try:
+                for nombre, tipo, ayuda, etiquetas, valor in recolector():
+                    tipos.setdefault(nombre, (tipo, ayuda))
+                    muestras.setdefault(nombre, []).append(
+                        (nombre, tuple(sorted((k, str(v)) for k, v in etiquetas.items())), valor)
+                    )
+            except Exception as e:
+                logger.error(f"Error en un recolector de métricas: {e}")
+
+        lineas = []
+        for nombre in sorted(muestras):
+            tipo, ayuda = tipos[nombre]
+            if ayuda:
+                lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for serie, etiquetas, valor in muestras[nombre]:
+                lineas.append(f"{serie}{_formato_etiquetas(etiquetas)} {_formato_valor(valor)}")
+        return "\n".join(lineas) + "\n"
+
+# Registro compartido por el proceso
+metricas = RegistroMetricas()
+
+# Etapas de la construcción en curso en este hilo (None: no se está midiendo una construcción)
+_etapas_actuales: ContextVar[Optional[Dict[str, float]]] = ContextVar("etapas_actuales", default=None)
+
+@contextmanager
+def medir_etapas() -> Iterator[Dict[str, float]]:
+    """Acumula en el diccionario entregado los segundos de cada etapa ejecutada dentro del bloque"""
+    etapas: Dict[str, float] = {}
+    token = _etapas_actuales.set(etapas)
+    try:
+        yield etapas
+    finally:
+        _etapas_actuales.reset(token)
+
+@contextmanager
+def etapa(nombre: str):
+    """
+    Mide una etapa de la construcción del mapa: la agrega al histograma
+    mapa_etapa_segundos y a las etapas de la construcción en curso
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        metricas.observar("mapa_etapa_segundos", duracion, "Duración de cada etapa de la construcción del mapa",
+                          etapa=nombre)
+        etapas = _etapas_actuales.get()
+        if etapas is not None:
+            etapas[nombre] = etapas.get(nombre, 0.0) + duracion
+
+def server_timing(etapas: Dict[str, float], **descripciones: str) -> str:
+    """Encabezado Server-Timing con la duración (ms) de cada etapa y métricas sin duración"""
+    partes = [f"{nombre};dur={segundos * 1000:.1f}" for nombre, segundos in etapas.items()]
+    partes.extend(f'{nombre};desc="{_escapar(desc)}"' for nombre, desc in descripciones.items())
+    return ", ".join(partes)
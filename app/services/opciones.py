@@ -0,0 +1,10 @@
+import os
+
+# Constantes
+# Opciones del mapa, separadas de mapa_rutas para que los routers y el gestor
+# no importen numpy, googlemaps ni requests al iniciar la aplicación
+DISTANCIA_AGRUPAMIENTO_KM = 0.5
+OPTIMIZADOR_RUTAS = os.getenv("OPTIMIZADOR_RUTAS", "google")  # google, local o hibrido
+OPTIMIZADORES = ("google", "local", "hibrido")
+PLANES = ("grupos", "flota")  # Un viaje por grupo cercano o reparto entre los vehículos de la flota
+MAPA_INCREMENTAL = os.getenv("MAPA_INCREMENTAL", "true").lower() in ("1", "true", "si", "yes")
@@ -0,0 +1,362 @@
+import logging
+import math
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.services.distancias import EARTH_RADIUS_KM, haversine_km, matriz_distancias
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+PRESUPUESTO_S = 1.0  # Tiempo máximo de mejora local por grupo
+MAX_SEGMENTO_OR_OPT = 3
+MAX_PUNTOS_MATRIZ = 1500  # Sobre esta cantidad no se arma la matriz completa: se usan listas de vecinos
+VECINOS_CANDIDATOS = 8  # Vecinos más cercanos evaluados por punto en los grupos grandes
+PUNTOS_POR_CELDA = 2  # Ocupación media de la grilla de puntos libres al construir el recorrido
+PASOS_POR_CONTROL = 256  # Cada cuántos pasos se revisa el presupuesto de tiempo
+
+def _costo(matriz: np.ndarray, recorrido: np.ndarray) -> float:
+    return float(matriz[recorrido[:-1], recorrido[1:]].sum())
+
+def _vecino_mas_cercano(matriz: np.ndarray, limite: float) -> np.ndarray:
+    """
+    Construye un recorrido desde el nodo 0 visitando siempre el nodo libre más cercano.
+    El último nodo de la matriz es el cierre ficticio y queda al final.
+    Si se agota el presupuesto, los nodos libres se agregan en su orden original.
+    """
+    n = len(matriz)
+    visitado = np.zeros(n, dtype=bool)
+    visitado[[0, n - 1]] = True
+    recorrido = [0]
+    actual = 0
+    for paso in range(n - 2):
+        if paso % PASOS_POR_CONTROL == 0 and time.monotonic() > limite:
+            recorrido.extend(np.flatnonzero(~visitado).tolist())
+            return np.array(recorrido, dtype=np.int64)
+        distancias = np.where(visitado, np.inf, matriz[actual])
+        actual = int(distancias.argmin())
+        visitado[actual] = True
+        recorrido.append(actual)
+    recorrido.append(n - 1)
+    return np.array(recorrido, dtype=np.int64)
+
+def _mejorar_2opt(matriz: np.ndarray, recorrido: np.ndarray, limite: float) -> Tuple[np.ndarray, bool]:
+    """
+    Una pasada de 2-opt con extremos fijos: invierte el tramo [i, j] cuando acorta el recorrido.
+    Para cada i se evalúan todos los j a la vez.
+    """
+    mejorado = False
+    n = len(recorrido)
+    for i in range(1, n - 2):
+        if time.monotonic() > limite:
+            break
+        a, b = recorrido[i - 1], recorrido[i]
+        c = recorrido[i + 1:n - 1]
+        d = recorrido[i + 2:n]
+        delta = matriz[a, c] + matriz[b, d] - matriz[a, b] - matriz[c, d]
+        k = int(delta.argmin())
+        if delta[k] < -1e-9:
+            j = i + 1 + k
+            recorrido[i:j + 1] = recorrido[i:j + 1][::-1]
+            mejorado = True
+    return recorrido, mejorado
+
+def _mejorar_or_opt(matriz: np.ndarray, recorrido: np.ndarray, limite: float) -> Tuple[np.ndarray, bool]:
+    """
+    Una pasada de Or-opt: mueve tramos de 1 a 3 nodos (opcionalmente invertidos)
+    a la posición donde más acortan el recorrido
+    """
+    mejorado = False
+    for largo in range(1, MAX_SEGMENTO_OR_OPT + 1):
+        i = 1
+        while i + largo < len(recorrido):
+            if time.monotonic() > limite:
+                return recorrido, mejorado
+            previo, primero = recorrido[i - 1], recorrido[i]
+            ultimo, siguiente = recorrido[i + largo - 1], recorrido[i + largo]
+            ganancia = matriz[previo, primero] + matriz[ultimo, siguiente] - matriz[previo, siguiente]
+
+            resto = np.concatenate([recorrido[:i], recorrido[i + largo:]])
+            a, b = resto[:-1], resto[1:]
+            directo = matriz[a, primero] + matriz[ultimo, b] - matriz[a, b]
+            invertido = matriz[a, ultimo] + matriz[primero, b] - matriz[a, b]
+            costos = np.minimum(directo, invertido)
+            k = int(costos.argmin())
+
+            if costos[k] < ganancia - 1e-9 and k != i - 1:
+                segmento = recorrido[i:i + largo]
+                if invertido[k] < directo[k]:
+                    segmento = segmento[::-1]
+                recorrido = np.concatenate([resto[:k + 1], segmento, resto[k + 1:]])
+                mejorado = True
+            else:
+                i += 1
+    return recorrido, mejorado
+
+class _Vecindario:
+    """
+    Puntos de un grupo grande (nodo 0: origen) con sus VECINOS_CANDIDATOS más cercanos:
+    la construcción y la mejora solo miran esos candidatos, en memoria O(n) en lugar
+    de la matriz completa. Los candidatos se buscan con un KD-tree sobre una proyección
+    equirectangular (km), que a escala de ciudad ordena igual que haversine; los
+    costos de los movimientos sí usan haversine.
+    """
+    def __init__(self, lats: np.ndarray, lons: np.ndarray):
+        from scipy.spatial import cKDTree
+
+        self.n = len(lats)
+        lat_r, lon_r = np.radians(lats), np.radians(lons)
+        self.lat, self.lon, self.cos_lat = lat_r.tolist(), lon_r.tolist(), np.cos(lat_r).tolist()
+        self.x = lon_r * (EARTH_RADIUS_KM * math.cos(float(lat_r.mean())))
+        self.y = lat_r * EARTH_RADIUS_KM
+        k = min(VECINOS_CANDIDATOS + 1, self.n)
+        _, indices = cKDTree(np.column_stack((self.x, self.y))).query(np.column_stack((self.x, self.y)), k=k)
+        # De más cercano a más lejano, sin el propio punto (con puntos repetidos puede quedar
+        # en la lista, lo que no cambia nada: un nodo nunca se une consigo mismo)
+        self.vecinos = indices[:, 1:].tolist()
+
+    def distancia(self, u: int, v: int) -> float:
+        a = (math.sin((self.lat[v] - self.lat[u]) * 0.5) ** 2
+             + self.cos_lat[u] * self.cos_lat[v] * math.sin((self.lon[v] - self.lon[u]) * 0.5) ** 2)
+        return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+def _construir_por_vecinos(vecindario: _Vecindario, limite: float) -> List[int]:
+    """
+    Vecino más cercano desde el nodo 0: primero entre los candidatos del nodo actual y,
+    si todos fueron visitados, buscando en anillos de una grilla de puntos libres.
+    Si se agota el presupuesto, los nodos libres se agregan recorriendo la grilla en serpentina.
+    """
+    n = vecindario.n
+    x, y = vecindario.x, vecindario.y
+    lado = max(math.sqrt(max(float(np.ptp(x) * np.ptp(y)), 1e-12) * PUNTOS_POR_CELDA / n), 1e-6)
+    celda_x = np.floor((x - x.min()) / lado).astype(np.int64)
+    celda_y = np.floor((y - y.min()) / lado).astype(np.int64)
+    max_anillo = int(max(celda_x.max(), celda_y.max())) + 1
+    libres: dict = {}
+    for nodo, celda in enumerate(zip(celda_x.tolist(), celda_y.tolist())):
+        if nodo:
+            libres.setdefault(celda, set()).add(nodo)
+    celdas = list(zip(celda_x.tolist(), celda_y.tolist()))
+    xs, ys = x.tolist(), y.tolist()
+    visitado = np.zeros(n, dtype=bool)
+    visitado[0] = True
+    recorrido = [0]
+    actual = 0
+
+    def _tomar(nodo: int):
+        visitado[nodo] = True
+        libres[celdas[nodo]].discard(nodo)
+        recorrido.append(nodo)
+
+    for paso in range(1, n):
+        if paso % PASOS_POR_CONTROL == 0 and time.monotonic() > limite:
+            restantes = np.flatnonzero(~visitado)
+            serpentina = np.where(celda_y[restantes] % 2 == 0, celda_x[restantes], -celda_x[restantes])
+            recorrido.extend(restantes[np.lexsort((serpentina, celda_y[restantes]))].tolist())
+            logger.warning(f"Presupuesto agotado al construir la ruta local: {len(restantes)} de {n - 1} "
+                           "puntos quedan en orden de grilla")
+            return recorrido
+
+        siguiente = next((v for v in vecindario.vecinos[actual] if not visitado[v]), None)
+        if siguiente is None:
+            siguiente = _libre_mas_cercano(xs[actual], ys[actual], celdas[actual], libres, xs, ys,
+                                           lado, max_anillo, n - paso, visitado, x, y)
+        _tomar(siguiente)
+        actual = siguiente
+    return recorrido
+
+def _libre_mas_cercano(px: float, py: float, celda: Tuple[int, int], libres: dict, xs: list, ys: list,
+                       lado: float, max_anillo: int, restantes: int, visitado: np.ndarray,
+                       x: np.ndarray, y: np.ndarray) -> int:
+    """
+    Nodo libre más cercano (distancia proyectada) buscando en anillos de celdas alrededor
+    del punto; si los anillos ya cubren más celdas que puntos libres, compara contra todos
+    """
+    cx, cy = celda
+    mejor, mejor_d2 = -1, math.inf
+    for r in range(max_anillo + 1):
+        # Los puntos del anillo r están al menos a (r - 1) * lado del punto
+        if mejor >= 0 and mejor_d2 <= ((r - 1) * lado) ** 2:
+            return mejor
+        if 8 * r > restantes:
+            break
+        for gx in range(cx - r, cx + r + 1):
+            paso_y = 2 * r if r and gx not in (cx - r, cx + r) else 1
+            for gy in range(cy - r, cy + r + 1, paso_y):
+                for nodo in libres.get((gx, gy), ()):
+                    d2 = (xs[nodo] - px) ** 2 + (ys[nodo] - py) ** 2
+                    if d2 < mejor_d2:
+                        mejor, mejor_d2 = nodo, d2
+        if mejor >= 0 and r == max_anillo:
+            return mejor
+    candidatos = np.flatnonzero(~visitado)
+    return int(candidatos[((x[candidatos] - px) ** 2 + (y[candidatos] - py) ** 2).argmin()])
+
+def _mejorar_2opt_vecinos(vecindario: _Vecindario, recorrido: List[int], posicion: List[int],
+                          limite: float) -> bool:
+    """
+    Una pasada de 2-opt sobre una ruta abierta (el nodo 0 queda primero) que solo
+    prueba unir cada nodo con sus vecinos candidatos, antes o después de él
+    """
+    d = vecindario.distancia
+    m = len(recorrido)
+    mejorado = False
+    for i in range(m):
+        if i % PASOS_POR_CONTROL == 0 and time.monotonic() > limite:
+            break
+        a = recorrido[i]
+        siguiente = recorrido[i + 1] if i + 1 < m else None
+        previo = recorrido[i - 1] if i > 0 else None
+        d_siguiente = d(a, siguiente) if siguiente is not None else math.inf
+        d_previo = d(previo, a) if previo is not None else math.inf
+        for c in vecindario.vecinos[a]:
+            d_ac = d(a, c)
+            if d_ac >= d_siguiente and d_ac >= d_previo:
+                break
+            j = posicion[c]
+            if j > i + 1 and d_ac < d_siguiente:
+                # a, [siguiente .. c], c_sig  ->  a, [c .. siguiente], c_sig
+                c_sig = recorrido[j + 1] if j + 1 < m else None
+                delta = d_ac - d_siguiente
+                if c_sig is not None:
+                    delta += d(siguiente, c_sig) - d(c, c_sig)
+                lo, hi = i + 1, j
+            elif 1 <= j < i - 1 and d_ac < d_previo:
+                # c_ant, [c .. previo], a  ->  c_ant, [previo .. c], a
+                c_ant = recorrido[j - 1]
+                delta = d_ac + d(c_ant, previo) - d(c_ant, c) - d_previo
+                lo, hi = j, i - 1
+            else:
+                continue
+            if delta < -1e-9:
+                recorrido[lo:hi + 1] = recorrido[lo:hi + 1][::-1]
+                for k in range(lo, hi + 1):
+                    posicion[recorrido[k]] = k
+                mejorado = True
+                break
+    return mejorado
+
+def _mejorar_or_opt_vecinos(vecindario: _Vecindario, recorrido: List[int], posicion: List[int],
+                            limite: float) -> bool:
+    """
+    Una pasada de Or-opt que mueve tramos de 1 a 3 nodos (opcionalmente invertidos)
+    a continuación de algún vecino candidato de sus extremos
+    """
+    d = vecindario.distancia
+    mejorado = False
+    intentos = 0
+    for largo in range(1, MAX_SEGMENTO_OR_OPT + 1):
+        i = 1
+        while i + largo <= len(recorrido):
+            intentos += 1
+            if intentos % PASOS_POR_CONTROL == 0 and time.monotonic() > limite:
+                return mejorado
+            m = len(recorrido)
+            previo, primero, ultimo = recorrido[i - 1], recorrido[i], recorrido[i + largo - 1]
+            siguiente = recorrido[i + largo] if i + largo < m else None
+            ganancia = d(previo, primero)
+            if siguiente is not None:
+                ganancia += d(ultimo, siguiente) - d(previo, siguiente)
+
+            mejor = None
+            for c in set(vecindario.vecinos[primero]) | set(vecindario.vecinos[ultimo]):
+                j = posicion[c]
+                if i - 1 <= j < i + largo:
+                    continue
+                c_sig = recorrido[j + 1] if j + 1 < m else None
+                cierre = d(c, c_sig) if c_sig is not None else 0.0
+                directo = d(c, primero) - cierre + (d(ultimo, c_sig) if c_sig is not None else 0.0)
+                invertido = d(c, ultimo) - cierre + (d(primero, c_sig) if c_sig is not None else 0.0)
+                costo = min(directo, invertido)
+                if costo < ganancia - 1e-9 and (mejor is None or costo < mejor[0]):
+                    mejor = (costo, c, invertido < directo)
+
+            if mejor is None:
+                i += 1
+                continue
+            _, c, invertir = mejor
+            segmento = recorrido[i:i + largo]
+            if invertir:
+                segmento.reverse()
+            del recorrido[i:i + largo]
+            j = posicion[c] - (largo if posicion[c] > i else 0)
+            recorrido[j + 1:j + 1] = segmento
+            for k in range(min(i, j + 1), max(i + largo, j + 1 + largo)):
+                posicion[recorrido[k]] = k
+            mejorado = True
+    return mejorado
+
+def _ordenar_por_vecinos(todos_lat: np.ndarray, todos_lon: np.ndarray, limite: float,
+                         max_pasadas: Optional[int] = None) -> Tuple[List[int], float]:
+    """Recorrido abierto desde el nodo 0 para grupos grandes; retorna también su largo inicial en km"""
+    vecindario = _Vecindario(todos_lat, todos_lon)
+    recorrido = _construir_por_vecinos(vecindario, limite)
+    costo_inicial = _largo(todos_lat, todos_lon, recorrido)
+    posicion = [0] * len(recorrido)
+    for k, nodo in enumerate(recorrido):
+        posicion[nodo] = k
+
+    mejorado, pasadas = True, 0
+    while mejorado and time.monotonic() < limite and (max_pasadas is None or pasadas < max_pasadas):
+        mejorado_2opt = _mejorar_2opt_vecinos(vecindario, recorrido, posicion, limite)
+        mejorado_or = _mejorar_or_opt_vecinos(vecindario, recorrido, posicion, limite)
+        mejorado = mejorado_2opt or mejorado_or
+        pasadas += 1
+    return recorrido, costo_inicial
+
+def _largo(lats: np.ndarray, lons: np.ndarray, recorrido: List[int]) -> float:
+    orden = np.asarray(recorrido)
+    return float(haversine_km(lats[orden[:-1]], lons[orden[:-1]], lats[orden[1:]], lons[orden[1:]]).sum())
+
+def ordenar_ruta_local(origen: Tuple[float, float], lats, lons,
+                       presupuesto_s: Optional[float] = PRESUPUESTO_S,
+                       max_pasadas: Optional[int] = None) -> List[int]:
+    """
+    Ordena los puntos como un recorrido abierto que parte del origen y termina en cualquier punto:
+    construcción por vecino más cercano y mejora con 2-opt y Or-opt dentro del presupuesto de tiempo.
+    Con max_pasadas no hay límite de tiempo sino de pasadas de mejora, y el orden solo depende
+    de los puntos (se repite igual en cada construcción).
+    Sobre MAX_PUNTOS_MATRIZ puntos solo se evalúan los vecinos candidatos de cada punto.
+    Retorna los índices de los puntos en el orden de visita.
+    """
+    n = len(lats)
+    if n <= 1:
+        return list(range(n))
+
+    inicio = time.monotonic()
+    sin_limite = presupuesto_s is None or max_pasadas is not None
+    limite = float("inf") if sin_limite else inicio + presupuesto_s
+
+    # Nodo 0: origen; nodos 1..n: puntos; nodo n+1: cierre ficticio a distancia cero de todos,
+    # para que el recorrido con extremos fijos equivalga a una ruta abierta
+    todos_lat = np.concatenate([[origen[0]], np.asarray(lats, dtype=np.float64)])
+    todos_lon = np.concatenate([[origen[1]], np.asarray(lons, dtype=np.float64)])
+    if n > MAX_PUNTOS_MATRIZ:
+        recorrido, costo_inicial = _ordenar_por_vecinos(todos_lat, todos_lon, limite, max_pasadas)
+        logger.debug(
+            f"Ruta local de {n} puntos (vecinos candidatos): {costo_inicial:.2f} km -> "
+            f"{_largo(todos_lat, todos_lon, recorrido):.2f} km en {time.monotonic() - inicio:.3f}s"
+        )
+        return [nodo - 1 for nodo in recorrido[1:]]
+
+    matriz = np.zeros((n + 2, n + 2))
+    matriz[:n + 1, :n + 1] = matriz_distancias(todos_lat, todos_lon)
+
+    recorrido = _vecino_mas_cercano(matriz, limite)
+    costo_inicial = _costo(matriz, recorrido)
+
+    mejorado, pasadas = True, 0
+    while mejorado and time.monotonic() < limite and (max_pasadas is None or pasadas < max_pasadas):
+        recorrido, mejorado_2opt = _mejorar_2opt(matriz, recorrido, limite)
+        recorrido, mejorado_or = _mejorar_or_opt(matriz, recorrido, limite)
+        mejorado = mejorado_2opt or mejorado_or
+        pasadas += 1
+
+    logger.debug(
+        f"Ruta local de {n} puntos: {costo_inicial:.2f} km -> {_costo(matriz, recorrido):.2f} km "
+        f"en {time.monotonic() - inicio:.3f}s"
+    )
+    return [int(nodo) - 1 for nodo in recorrido[1:-1]]
@@ -0,0 +1,263 @@
+import json
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.distancias import distancias_desde, haversine_km, matriz_distancias
+from app.services.optimizador_rutas import ordenar_ruta_local
+from app.services.puntos import GrupoPuntos, PuntosArray
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+PLAN_FLOTA = os.getenv("PLAN_FLOTA", "")  # JSON (o ruta a un archivo JSON) con depósitos y vehículos
+PLAN_VEHICULOS = int(os.getenv("PLAN_VEHICULOS", "3"))  # Vehículos en el origen si PLAN_FLOTA no está definido
+PLAN_VELOCIDAD_KMH = float(os.getenv("PLAN_VELOCIDAD_KMH", "25"))  # Velocidad media para estimar tiempos
+PLAN_MINUTOS_PARADA = float(os.getenv("PLAN_MINUTOS_PARADA", "10"))  # Tiempo de servicio por parada
+PLAN_PRESUPUESTO_S = float(os.getenv("PLAN_PRESUPUESTO_S", "5"))  # Búsqueda local de todos los vehículos
+
+@dataclass
+class Deposito:
+    """Punto de salida de uno o más vehículos"""
+    nombre: str
+    lat: float
+    lon: float
+    direccion: Optional[str] = None
+
+@dataclass
+class Vehiculo:
+    """Vehículo (o cuadrilla) con límite de paradas y/o de minutos de jornada"""
+    nombre: str
+    deposito: int = 0
+    capacidad: Optional[int] = None
+    max_minutos: Optional[float] = None
+
+@dataclass
+class Flota:
+    depositos: List[Deposito]
+    vehiculos: List[Vehiculo]
+
+    @classmethod
+    def desde_json(cls, texto: str) -> "Flota":
+        """
+        Flota desde JSON: {"depositos": [{"nombre", "lat", "lon"}],
+        "vehiculos": [{"nombre", "deposito", "capacidad", "max_minutos"}]}
+        """
+        contenido = json.loads(texto)
+        flota = cls(
+            depositos=[Deposito(**d) for d in contenido["depositos"]],
+            vehiculos=[Vehiculo(**v) for v in contenido["vehiculos"]],
+        )
+        flota.validar()
+        return flota
+
+    def validar(self):
+        if not self.depositos or not self.vehiculos:
+            raise ValueError("La flota necesita al menos un depósito y un vehículo")
+        for vehiculo in self.vehiculos:
+            if not 0 <= vehiculo.deposito < len(self.depositos):
+                raise ValueError(f"Depósito inválido para el vehículo {vehiculo.nombre}: {vehiculo.deposito}")
+
+@dataclass
+class RutaVehiculo:
+    """Paradas de un vehículo en orden de visita, con su recorrido estimado"""
+    vehiculo: Vehiculo
+    deposito: Deposito
+    puntos: GrupoPuntos
+    distancia_km: float
+    duracion_min: float
+
+@dataclass
+class PlanRutas:
+    rutas: List[RutaVehiculo]
+    sin_asignar: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.intp))
+    duracion_s: float = 0.0
+
+    def resumen(self) -> Dict:
+        return {
+            "vehiculos": [
+                {
+                    "vehiculo": r.vehiculo.nombre,
+                    "deposito": r.deposito.nombre,
+                    "paradas": len(r.puntos),
+                    "distancia_km": round(r.distancia_km, 2),
+                    "duracion_min": round(r.duracion_min, 1),
+                }
+                for r in self.rutas
+            ],
+            "sin_asignar": int(len(self.sin_asignar)),
+            "duracion_s": round(self.duracion_s, 3),
+        }
+
+def cargar_flota(origen: Tuple[float, float], configuracion: str = PLAN_FLOTA) -> Flota:
+    """
+    Flota configurada en PLAN_FLOTA (JSON o ruta a un archivo JSON); si no está
+    definida, PLAN_VEHICULOS vehículos sin límites que salen del origen
+    """
+    if configuracion:
+        if os.path.isfile(configuracion):
+            with open(configuracion, encoding="utf-8") as f:
+                configuracion = f.read()
+        return Flota.desde_json(configuracion)
+    return Flota(
+        depositos=[Deposito("Origen", origen[0], origen[1])],
+        vehiculos=[Vehiculo(f"Vehículo {i + 1}") for i in range(max(1, PLAN_VEHICULOS))],
+    )
+
+def _minutos(distancia_km: float, paradas: int) -> float:
+    return distancia_km / PLAN_VELOCIDAD_KMH * 60 + paradas * PLAN_MINUTOS_PARADA
+
+def _largo_recorrido(origen: Tuple[float, float], lat: np.ndarray, lon: np.ndarray) -> float:
+    """Kilómetros del recorrido abierto desde el origen pasando por los puntos en orden"""
+    if not len(lat):
+        return 0.0
+    todos_lat = np.concatenate([[origen[0]], lat])
+    todos_lon = np.concatenate([[origen[1]], lon])
+    return float(haversine_km(todos_lat[:-1], todos_lon[:-1], todos_lat[1:], todos_lon[1:]).sum())
+
+def asignar_depositos(lat: np.ndarray, lon: np.ndarray, flota: Flota) -> np.ndarray:
+    """
+    Depósito de cada punto: el más cercano con capacidad disponible. Los puntos con
+    más que perder si no van a su depósito más cercano (mayor regret) eligen primero.
+    -1 para los puntos que no caben en ningún depósito.
+    """
+    dist = matriz_distancias(lat, lon, [d.lat for d in flota.depositos], [d.lon for d in flota.depositos])
+    cercano = dist.argmin(axis=1)
+
+    capacidad = np.zeros(len(flota.depositos))
+    for vehiculo in flota.vehiculos:
+        capacidad[vehiculo.deposito] += math.inf if vehiculo.capacidad is None else vehiculo.capacidad
+    if np.all(np.bincount(cercano, minlength=len(capacidad)) <= capacidad):
+        return cercano
+
+    preferencias = np.argsort(dist, axis=1)
+    ordenadas = np.take_along_axis(dist, preferencias, axis=1)
+    regret = ordenadas[:, 1] - ordenadas[:, 0] if dist.shape[1] > 1 else np.zeros(len(lat))
+    asignacion = np.full(len(lat), -1, dtype=np.intp)
+    for i in np.argsort(-regret, kind="stable"):
+        for d in preferencias[i]:
+            if capacidad[d] >= 1:
+                asignacion[i] = d
+                capacidad[d] -= 1
+                break
+    return asignacion
+
+def _orden_barrido(deposito: Deposito, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    Posiciones de los puntos ordenados por ángulo alrededor del depósito,
+    empezando después del mayor hueco angular para no partir un sector poblado
+    """
+    angulos = np.arctan2(lat - deposito.lat, (lon - deposito.lon) * math.cos(math.radians(deposito.lat)))
+    orden = np.argsort(angulos, kind="stable")
+    if len(orden) < 2:
+        return orden
+    ordenados = angulos[orden]
+    huecos = np.diff(np.append(ordenados, ordenados[0] + 2 * math.pi))
+    return np.roll(orden, -((int(huecos.argmax()) + 1) % len(orden)))
+
+def _llenar_vehiculo(deposito: Deposito, vehiculo: Vehiculo, lat: np.ndarray, lon: np.ndarray,
+                     cola: List[int], cupo: int) -> List[int]:
+    """
+    Toma de la cola (en orden de barrido) las paradas que caben en el vehículo,
+    estimando el recorrido por inserción más barata
+    """
+    ruta_lat = [deposito.lat]
+    ruta_lon = [deposito.lon]
+    tramos: List[float] = []
+    largo = 0.0
+    tomados: List[int] = []
+    for p in cola:
+        if len(tomados) >= cupo:
+            break
+        d = distancias_desde(lat[p], lon[p], ruta_lat, ruta_lon)
+        # Insertar entre dos paradas consecutivas o al final del recorrido abierto
+        posicion, delta = len(ruta_lat), float(d[-1])
+        if tramos:
+            costos = d[:-1] + d[1:] - np.asarray(tramos)
+            k = int(costos.argmin())
+            if costos[k] < delta:
+                posicion, delta = k + 1, float(costos[k])
+        if vehiculo.max_minutos is not None and _minutos(largo + delta, len(tomados) + 1) > vehiculo.max_minutos:
+            break
+        if posicion == len(ruta_lat):
+            tramos.append(float(d[-1]))
+        else:
+            tramos[posicion - 1:posicion] = [float(d[posicion - 1]), float(d[posicion])]
+        ruta_lat.insert(posicion, lat[p])
+        ruta_lon.insert(posicion, lon[p])
+        largo += delta
+        tomados.append(p)
+    return tomados
+
+def _planificar_deposito(indice: int, puntos: PuntosArray, posiciones: np.ndarray, flota: Flota,
+                         presupuesto_s: float) -> Tuple[List[RutaVehiculo], List[int]]:
+    """Barrido angular del depósito, un vehículo tras otro, y búsqueda local de cada ruta"""
+    deposito = flota.depositos[indice]
+    vehiculos = [v for v in flota.vehiculos if v.deposito == indice]
+    origen = (deposito.lat, deposito.lon)
+    lat, lon = puntos.lat, puntos.lon
+    cola = [int(p) for p in posiciones[_orden_barrido(deposito, lat[posiciones], lon[posiciones])]]
+    rutas: List[RutaVehiculo] = []
+
+    for k, vehiculo in enumerate(vehiculos):
+        if not cola:
+            break
+        # Carga pareja: cada vehículo toma a lo sumo su parte de lo que queda
+        cupo = math.ceil(len(cola) / (len(vehiculos) - k))
+        if vehiculo.capacidad is not None:
+            cupo = min(cupo, vehiculo.capacidad)
+        tomados = _llenar_vehiculo(deposito, vehiculo, lat, lon, cola, cupo)
+        if not tomados:
+            continue
+
+        orden = ordenar_ruta_local(origen, lat[tomados], lon[tomados], presupuesto_s=presupuesto_s)
+        paradas = np.asarray(tomados, dtype=np.intp)[orden]
+        largo = _largo_recorrido(origen, lat[paradas], lon[paradas])
+
+        # Si el orden final excede la jornada, las últimas paradas vuelven a la cola
+        while vehiculo.max_minutos is not None and len(paradas) and _minutos(largo, len(paradas)) > vehiculo.max_minutos:
+            paradas = paradas[:-1]
+            largo = _largo_recorrido(origen, lat[paradas], lon[paradas])
+        asignados = set(paradas.tolist())
+        cola = [p for p in cola if p not in asignados]
+
+        rutas.append(RutaVehiculo(vehiculo, deposito, puntos.vista(paradas), largo, _minutos(largo, len(paradas))))
+    return rutas, cola
+
+def planificar_rutas(puntos: PuntosArray, flota: Flota, presupuesto_s: float = PLAN_PRESUPUESTO_S) -> PlanRutas:
+    """
+    Reparte los puntos entre los vehículos de varios depósitos y ordena la ruta de cada uno:
+    asignación al depósito más cercano con capacidad, barrido angular con inserción más
+    barata para llenar cada vehículo (límites de paradas y de minutos), y búsqueda local
+    (2-opt y Or-opt) de cada ruta. Las rutas son abiertas: terminan en la última parada.
+    """
+    inicio = time.monotonic()
+    flota.validar()
+    if not len(puntos):
+        return PlanRutas(rutas=[])
+
+    asignacion = asignar_depositos(puntos.lat, puntos.lon, flota)
+    presupuesto_vehiculo = presupuesto_s / len(flota.vehiculos)
+    rutas: List[RutaVehiculo] = []
+    sin_asignar: List[int] = np.flatnonzero(asignacion < 0).tolist()
+    for indice in range(len(flota.depositos)):
+        posiciones = np.flatnonzero(asignacion == indice)
+        if not len(posiciones):
+            continue
+        rutas_deposito, restantes = _planificar_deposito(indice, puntos, posiciones, flota, presupuesto_vehiculo)
+        rutas.extend(rutas_deposito)
+        sin_asignar.extend(restantes)
+
+    plan = PlanRutas(rutas=rutas, sin_asignar=np.asarray(sorted(sin_asignar), dtype=np.intp),
+                     duracion_s=time.monotonic() - inicio)
+    logger.info(
+        f"Plan de flota: {len(puntos)} puntos en {len(rutas)} vehículos de {len(flota.depositos)} depósitos "
+        f"({len(plan.sin_asignar)} sin asignar) en {plan.duracion_s:.2f}s"
+    )
+    return plan
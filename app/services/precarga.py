@@ -0,0 +1,49 @@
+import importlib
+import logging
+import os
+import threading
+import time
+
+from app.services.metricas import metricas
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+PRECARGAR_DEPENDENCIAS = os.getenv("PRECARGAR_DEPENDENCIAS", "true").lower() in ("1", "true", "si", "yes")  # Importar al iniciar, en segundo plano
+MODULOS_PESADOS = (
+    "app.services.mapa_rutas",
+    "sklearn.cluster",
+    "sklearn.neighbors",
+    "scipy.sparse.csgraph",
+    "scipy.spatial",
+    "folium",
+    "app.services.capas_folium",
+)  # Se importan recién al construir, agrupar o dibujar el primer mapa (mapa_rutas trae numpy, googlemaps y requests)
+
+_precargadas = threading.Event()
+
+def precargar_dependencias():
+    """
+    Importa las dependencias pesadas para que la primera construcción del mapa
+    no pague su carga. Un módulo que falle se registra y se vuelve a intentar al usarlo.
+    """
+    inicio = time.perf_counter()
+    for modulo in MODULOS_PESADOS:
+        try:
+            importlib.import_module(modulo)
+        except Exception as e:
+            logger.warning(f"No se pudo precargar {modulo}: {e}")
+    duracion = time.perf_counter() - inicio
+    metricas.fijar("precarga_dependencias_segundos", duracion, "Duración de la importación de las dependencias pesadas")
+    _precargadas.set()
+    logger.info(f"Dependencias pesadas cargadas en {duracion:.2f}s")
+
+def iniciar_precarga():
+    """Lanza la precarga en un hilo de fondo (no retrasa el arranque ni el health check)"""
+    if not PRECARGAR_DEPENDENCIAS:
+        return
+    threading.Thread(target=precargar_dependencias, name="precarga-dependencias", daemon=True).start()
+
+def dependencias_cargadas() -> bool:
+    return _precargadas.is_set()
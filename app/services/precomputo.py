@@ -0,0 +1,406 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.services.bloqueo import BloqueoArchivo
+from app.services.cache import CACHE_DB_PATH
+from app.services.fechas import VENTANA_HORAS, VENTANA_TIEMPO, VENTANAS
+from app.services.metricas import etapa, medir_etapas, metricas
+from app.services.opciones import MAPA_INCREMENTAL, OPTIMIZADOR_RUTAS, PLANES
+
+try:
+    import brotli
+except ImportError:  # Dependencia opcional: sin ella solo se precomprime con gzip
+    brotli = None
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+MAPA_REFRESCO_S = float(os.getenv("MAPA_REFRESCO_S", "300"))  # Intervalo del refresco en segundo plano (0 lo desactiva)
+MAPA_MAX_EDAD_S = float(os.getenv("MAPA_MAX_EDAD_S", "60"))  # Edad a partir de la cual se revalida al servir
+FORMATOS = ("html", "geojson")
+MAX_CONSTRUCCIONES = 2  # Construcciones simultáneas de opciones distintas
+NIVEL_GZIP = 9
+CALIDAD_BROTLI = 9
+MAPA_PRECALCULAR = os.getenv("MAPA_PRECALCULAR", "true").lower() in ("1", "true", "si", "yes")
+MAPA_BLOQUEO_TIMEOUT_S = float(os.getenv("MAPA_BLOQUEO_TIMEOUT_S", "600"))  # Espera máxima a la construcción de otro worker
+
+# Los renders guardados por un proceso anterior (otro despliegue) no se reutilizan
+INICIO_PROCESO = time.time()
+
+@dataclass(frozen=True)
+class OpcionesMapa:
+    """Parámetros que determinan el contenido de un mapa"""
+    incremental: bool = MAPA_INCREMENTAL
+    optimizador: str = OPTIMIZADOR_RUTAS
+    formato: str = "html"
+    plan: str = "grupos"
+    ventana: str = "ninguna"
+    horas: float = 0.0  # Largo de la ventana, solo con ventana="horas"
+
+    @classmethod
+    def desde_parametros(cls, incremental: Optional[bool] = None, optimizador: Optional[str] = None,
+                         formato: str = "html", plan: str = "grupos", ventana: Optional[str] = None,
+                         horas: Optional[float] = None) -> "OpcionesMapa":
+        """
+        Opciones normalizadas: la ventana de tiempo no aplica al plan de flota
+        y, con ventana, el mapa se calcula completo (no incremental)
+        """
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato inválido: {formato}. Opciones: {', '.join(FORMATOS)}")
+        if plan not in PLANES:
+            raise ValueError(f"Plan inválido: {plan}. Opciones: {', '.join(PLANES)}")
+        ventana = "ninguna" if plan == "flota" else (ventana or VENTANA_TIEMPO)
+        if ventana not in VENTANAS:
+            raise ValueError(f"Ventana de tiempo inválida: {ventana}. Opciones: {', '.join(VENTANAS)}")
+        incremental = MAPA_INCREMENTAL if incremental is None else incremental
+        return cls(
+            incremental=incremental and ventana == "ninguna",
+            optimizador=optimizador or OPTIMIZADOR_RUTAS,
+            formato=formato,
+            plan=plan,
+            ventana=ventana,
+            horas=float(horas or VENTANA_HORAS) if ventana == "horas" else 0.0
+        )
+
+    @property
+    def clave(self) -> str:
+        """Identificador estable entre procesos"""
+        ventana = f"{self.ventana}{self.horas:g}" if self.ventana == "horas" else self.ventana
+        return (f"{self.formato}:{self.plan}:{self.optimizador}:"
+                f"{'incremental' if self.incremental else 'completo'}:{ventana}")
+
+@dataclass
+class RenderMapa:
+    """Último mapa construido para unas opciones, con sus versiones precomprimidas"""
+    contenido: bytes
+    etag: str
+    generado_en: float
+    verificado_en: float
+    duracion_s: float
+    huella_datos: str
+    gzip: bytes
+    brotli: Optional[bytes] = None
+    etapas: Dict[str, float] = field(default_factory=dict)  # Segundos de cada etapa de la construcción
+
+    @classmethod
+    def desde_texto(cls, texto: str, duracion_s: float, huella_datos: str) -> "RenderMapa":
+        contenido = texto.encode("utf-8")
+        ahora = time.time()
+        return cls(
+            contenido=contenido,
+            etag='W/"' + hashlib.sha256(contenido).hexdigest()[:32] + '"',
+            generado_en=ahora,
+            verificado_en=ahora,
+            duracion_s=duracion_s,
+            huella_datos=huella_datos,
+            gzip=gzip.compress(contenido, compresslevel=NIVEL_GZIP, mtime=0),
+            brotli=brotli.compress(contenido, quality=CALIDAD_BROTLI) if brotli is not None else None,
+        )
+
+    def edad_s(self) -> float:
+        return time.time() - self.verificado_en
+
+    def cuerpo(self, accept_encoding: str = "") -> Tuple[bytes, Optional[str]]:
+        """Elige la versión a enviar según Accept-Encoding: (contenido, Content-Encoding)"""
+        aceptadas = {c.split(";")[0].strip().lower() for c in accept_encoding.split(",")}
+        if self.brotli is not None and "br" in aceptadas:
+            return self.brotli, "br"
+        if "gzip" in aceptadas:
+            return self.gzip, "gzip"
+        return self.contenido, None
+
+class AlmacenRenders:
+    """
+    Último render de cada opción en la base SQLite de las caches (CACHE_DB_PATH),
+    compartido por los workers: uno construye el mapa y los demás sirven el mismo
+    contenido y ETag. Sin ruta solo se usa el render en memoria de cada proceso.
+    """
+    def __init__(self, ruta_db: Optional[str] = CACHE_DB_PATH):
+        self.ruta_db = ruta_db or None
+        self._lock = threading.Lock()
+        self._conexion: Optional[sqlite3.Connection] = None
+        if self.ruta_db:
+            self._abrir_disco()
+
+    def _abrir_disco(self):
+        try:
+            conexion = sqlite3.connect(self.ruta_db, timeout=10, check_same_thread=False)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS renders_mapa (clave TEXT PRIMARY KEY, etag TEXT NOT NULL, "
+                "generado_en REAL NOT NULL, duracion_s REAL NOT NULL, huella_datos TEXT NOT NULL, "
+                "contenido BLOB NOT NULL, gzip BLOB NOT NULL, brotli BLOB)"
+            )
+            conexion.commit()
+            self._conexion = conexion
+        except sqlite3.Error as e:
+            logger.warning(f"Renders sin compartir entre workers ({self.ruta_db}): {e}")
+            self._conexion = None
+
+    @property
+    def disco(self) -> Optional[str]:
+        return self.ruta_db if self._conexion is not None else None
+
+    def obtener(self, clave: str) -> Optional[RenderMapa]:
+        if self._conexion is None:
+            return None
+        with self._lock:
+            try:
+                fila = self._conexion.execute(
+                    "SELECT etag, generado_en, duracion_s, huella_datos, contenido, gzip, brotli "
+                    "FROM renders_mapa WHERE clave = ?", (clave,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Error al leer render compartido '{clave}': {e}")
+                return None
+        if fila is None:
+            return None
+        etag, generado_en, duracion_s, huella, contenido, comprimido_gzip, comprimido_brotli = fila
+        return RenderMapa(contenido=contenido, etag=etag, generado_en=generado_en, verificado_en=time.time(),
+                          duracion_s=duracion_s, huella_datos=huella, gzip=comprimido_gzip, brotli=comprimido_brotli)
+
+    def guardar(self, clave: str, render: RenderMapa):
+        if self._conexion is None:
+            return
+        with self._lock:
+            try:
+                self._conexion.execute(
+                    "INSERT OR REPLACE INTO renders_mapa "
+                    "(clave, etag, generado_en, duracion_s, huella_datos, contenido, gzip, brotli) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (clave, render.etag, render.generado_en, render.duracion_s, render.huella_datos,
+                     render.contenido, render.gzip, render.brotli)
+                )
+                self._conexion.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Error al guardar render compartido '{clave}': {e}")
+
+def huella_datos(datos: List[Dict]) -> str:
+    """Huella del contenido completo de la hoja, para detectar cambios"""
+    serializado = json.dumps(datos, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+class GestorMapa:
+    """
+    Mantiene el último mapa construido por opciones y lo sirve al instante
+    (stale-while-revalidate). Las construcciones simultáneas de unas mismas
+    opciones se agrupan en una sola y un hilo en segundo plano refresca los
+    mapas cuando cambia la hoja. Con varios workers, la construcción de unas
+    opciones se serializa con un bloqueo de archivo y el resultado se comparte
+    por el almacén de renders.
+    """
+    def __init__(self, intervalo_s: float = MAPA_REFRESCO_S, max_edad_s: float = MAPA_MAX_EDAD_S,
+                 almacen: Optional[AlmacenRenders] = None):
+        self.intervalo_s = intervalo_s
+        self.max_edad_s = max_edad_s
+        self.almacen = almacen if almacen is not None else AlmacenRenders()
+        self._renders: Dict[OpcionesMapa, RenderMapa] = {}
+        # Por (opciones, forzar): una solicitud fresca no se une a una revalidación normal ya iniciada
+        self._en_curso: Dict[Tuple[OpcionesMapa, bool], Future] = {}
+        self._lock = threading.RLock()
+        self._ejecutor = ThreadPoolExecutor(max_workers=MAX_CONSTRUCCIONES, thread_name_prefix="mapa-build")
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self.construcciones = 0
+
+    def obtener(self, opciones: OpcionesMapa, fresco: bool = False) -> RenderMapa:
+        """
+        Retorna el mapa para las opciones dadas.
+        Sin mapa previo, o con fresco=True, espera una construcción (compartida con
+        otras solicitudes simultáneas). Con un mapa viejo lo sirve y revalida en segundo plano.
+        """
+        with self._lock:
+            render = self._renders.get(opciones)
+
+        if render is None or fresco:
+            return self._refrescar(opciones, forzar=fresco).result()
+
+        if render.edad_s() > self.max_edad_s:
+            self._refrescar(opciones)
+        return render
+
+    async def obtener_async(self, opciones: OpcionesMapa, fresco: bool = False) -> RenderMapa:
+        """
+        Versión asíncrona de obtener: espera la construcción sin ocupar el event loop
+        """
+        with self._lock:
+            render = self._renders.get(opciones)
+
+        if render is None or fresco:
+            return await asyncio.wrap_future(self._refrescar(opciones, forzar=fresco))
+
+        if render.edad_s() > self.max_edad_s:
+            self._refrescar(opciones)
+        return render
+
+    def _refrescar(self, opciones: OpcionesMapa, forzar: bool = False) -> Future:
+        """
+        Inicia (o reutiliza si ya está en curso) la revalidación de unas opciones
+        """
+        clave = (opciones, forzar)
+        with self._lock:
+            futuro = self._en_curso.get(clave)
+            if futuro is None:
+                futuro = self._ejecutor.submit(self._construir, opciones, forzar)
+                self._en_curso[clave] = futuro
+                futuro.add_done_callback(lambda _: self._terminar(clave, futuro))
+            return futuro
+
+    def _terminar(self, clave: Tuple[OpcionesMapa, bool], futuro: Future):
+        opciones = clave[0]
+        with self._lock:
+            if self._en_curso.get(clave) is futuro:
+                del self._en_curso[clave]
+        if futuro.exception() is not None:
+            metricas.incrementar("mapa_construcciones_fallidas_total", 1, "Construcciones del mapa con error",
+                                 formato=opciones.formato, plan=opciones.plan)
+            logger.error(f"Error al refrescar mapa {opciones}: {futuro.exception()}")
+
+    def _construir(self, opciones: OpcionesMapa, forzar: bool) -> RenderMapa:
+        """
+        Descarga la hoja y reconstruye el mapa solo si los datos cambiaron (o si se fuerza).
+        Si otro worker ya lo construyó para los mismos datos, se usa su render.
+        """
+        from app.services.mapa_rutas import obtener_datos_google_sheets
+
+        solicitado_en = time.time()
+        with medir_etapas() as etapas:
+            datos = obtener_datos_google_sheets()
+            with etapa("huella"):
+                huella = huella_datos(datos)
+
+            with self._lock:
+                anterior = self._renders.get(opciones)
+            if anterior is not None and not forzar and anterior.huella_datos == huella:
+                anterior.verificado_en = time.time()
+                logger.info(f"Hoja sin cambios, se conserva el mapa {opciones}")
+                return anterior
+
+            compartido = self._compartido(opciones, huella, forzar, solicitado_en)
+            if compartido is not None:
+                return compartido
+
+            # Un solo worker construye unas mismas opciones; los demás esperan y toman su render
+            bloqueo = BloqueoArchivo(opciones.clave)
+            if not bloqueo.adquirir(timeout_s=MAPA_BLOQUEO_TIMEOUT_S):
+                logger.warning(f"Otro worker sigue construyendo {opciones}; se construye sin esperar más")
+            try:
+                compartido = self._compartido(opciones, huella, forzar, solicitado_en)
+                if compartido is not None:
+                    return compartido
+                render = self._generar(opciones, datos, huella)
+            finally:
+                bloqueo.liberar()
+        render.etapas = etapas
+        metricas.incrementar("mapa_construcciones_total", 1, "Construcciones del mapa",
+                             formato=opciones.formato, plan=opciones.plan)
+        metricas.incrementar("mapa_bytes_generados_total", len(render.contenido), "Bytes de los mapas construidos",
+                             formato=opciones.formato)
+        with self._lock:
+            self._renders[opciones] = render
+            self.construcciones += 1
+        logger.info(f"Mapa {opciones} construido en {render.duracion_s:.2f}s")
+        return render
+
+    def _generar(self, opciones: OpcionesMapa, datos: List[Dict], huella: str) -> RenderMapa:
+        """Construye, comprime y publica en el almacén compartido el mapa de las opciones"""
+        from app.services.mapa_rutas import generar_geojson_rutas, generar_mapa_rutas
+
+        inicio = time.time()
+        if opciones.formato == "geojson":
+            geojson = generar_geojson_rutas(opciones.incremental, opciones.optimizador, datos=datos,
+                                            plan=opciones.plan, ventana=opciones.ventana, horas=opciones.horas)
+            with etapa("serializacion"):
+                texto = json.dumps(geojson, ensure_ascii=False, separators=(",", ":"))
+        else:
+            texto = generar_mapa_rutas(opciones.incremental, opciones.optimizador, datos=datos, plan=opciones.plan,
+                                       ventana=opciones.ventana, horas=opciones.horas)
+        with etapa("compresion"):
+            render = RenderMapa.desde_texto(texto, duracion_s=time.time() - inicio, huella_datos=huella)
+        self.almacen.guardar(opciones.clave, render)
+        return render
+
+    def _compartido(self, opciones: OpcionesMapa, huella: str, forzar: bool,
+                    solicitado_en: float) -> Optional[RenderMapa]:
+        """
+        Render de otro worker para los mismos datos, construido en este despliegue
+        (y, si se fuerza la reconstrucción, después de la solicitud)
+        """
+        render = self.almacen.obtener(opciones.clave)
+        if render is None or render.huella_datos != huella:
+            return None
+        if render.generado_en < (solicitado_en if forzar else INICIO_PROCESO):
+            return None
+        with self._lock:
+            self._renders[opciones] = render
+        metricas.incrementar("mapa_renders_compartidos_total", 1, "Mapas tomados del almacén compartido por los workers",
+                             formato=opciones.formato, plan=opciones.plan)
+        logger.info(f"Mapa {opciones} tomado del almacén compartido (ETag {render.etag})")
+        return render
+
+    def _ciclo(self):
+        """Refresca periódicamente todos los mapas servidos (y el de opciones por defecto)"""
+        while not self._detener.wait(self.intervalo_s):
+            with self._lock:
+                opciones = set(self._renders) | {OpcionesMapa.desde_parametros()}
+            for o in opciones:
+                try:
+                    self._refrescar(o).result()
+                except Exception:
+                    pass  # Ya registrado en _terminar; se sigue sirviendo el último mapa
+
+    def iniciar(self, precalcular: bool = MAPA_PRECALCULAR):
+        """Inicia el refresco en segundo plano y, opcionalmente, construye el mapa por defecto"""
+        if precalcular:
+            self._refrescar(OpcionesMapa.desde_parametros())
+        if self.intervalo_s > 0 and self._hilo is None:
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._ciclo, name="mapa-refresco", daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=1)
+            self._hilo = None
+
+    def estado(self) -> Dict:
+        """Resumen de los mapas en memoria para el endpoint de estado"""
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "almacen_compartido": self.almacen.disco,
+                "construcciones": self.construcciones,
+                "en_curso": len(self._en_curso),
+                "mapas": [
+                    {
+                        "incremental": o.incremental,
+                        "optimizador": o.optimizador,
+                        "formato": o.formato,
+                        "plan": o.plan,
+                        "ventana": o.ventana,
+                        "horas": o.horas or None,
+                        "edad_s": round(r.edad_s(), 1),
+                        "duracion_s": round(r.duracion_s, 2),
+                        "etag": r.etag,
+                        "bytes": len(r.contenido),
+                        "bytes_gzip": len(r.gzip),
+                        "bytes_brotli": len(r.brotli) if r.brotli is not None else None,
+                    }
+                    for o, r in self._renders.items()
+                ],
+            }
+
+# Gestor compartido por el router
+gestor_mapa = GestorMapa()
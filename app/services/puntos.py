@@ -0,0 +1,104 @@
+import sys
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+class PuntoVisita:
+    """Clase para representar un punto de visita"""
+    __slots__ = ("lat", "lon", "direccion", "fecha")
+
+    def __init__(self, lat: float, lon: float, direccion: str, fecha: str):
+        self.lat = lat
+        self.lon = lon
+        self.direccion = direccion
+        self.fecha = fecha
+
+def internar(valores: list) -> list:
+    """Comparte una sola copia de los textos repetidos (direcciones y fechas)"""
+    intern = sys.intern
+    return [intern(v) if type(v) is str else v for v in valores]
+
+@dataclass
+class PuntosArray:
+    """
+    Puntos en columnas: coordenadas float64, textos internados y etiqueta de grupo.
+    indices es la posición de cada punto en los datos originales; etiquetas queda
+    en None hasta que se agrupan. fecha_s es FechaHora en segundos epoch (NaN si no
+    se pudo interpretar), calculada en la ingesta.
+    """
+    lat: np.ndarray
+    lon: np.ndarray
+    direccion: List[str]
+    fecha: List[str]
+    indices: np.ndarray
+    etiquetas: Optional[np.ndarray] = None
+    fecha_s: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    @classmethod
+    def desde_puntos(cls, puntos: Sequence[PuntoVisita]) -> "PuntosArray":
+        n = len(puntos)
+        return cls(
+            lat=np.fromiter((p.lat for p in puntos), dtype=np.float64, count=n),
+            lon=np.fromiter((p.lon for p in puntos), dtype=np.float64, count=n),
+            direccion=internar([p.direccion for p in puntos]),
+            fecha=internar([p.fecha for p in puntos]),
+            indices=np.arange(n),
+        )
+
+    def punto(self, i: int) -> PuntoVisita:
+        return PuntoVisita(float(self.lat[i]), float(self.lon[i]), self.direccion[i], self.fecha[i])
+
+    def vista(self, indices: Optional[np.ndarray] = None) -> "GrupoPuntos":
+        """Vista de las filas indicadas (todas si no se indican), sin copiar los puntos"""
+        if indices is None:
+            indices = np.arange(len(self))
+        return GrupoPuntos(self, np.asarray(indices, dtype=np.intp))
+
+class GrupoPuntos(Sequence):
+    """
+    Grupo de puntos como vista de índices sobre un PuntosArray. Se recorre e indexa
+    como una lista de PuntoVisita (creados al acceder); los cortes y reordenamientos
+    retornan otra vista sin copiar los datos.
+    """
+    __slots__ = ("puntos", "indices")
+
+    def __init__(self, puntos: PuntosArray, indices: np.ndarray):
+        self.puntos = puntos
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, clave: Union[int, slice]):
+        if isinstance(clave, slice):
+            return GrupoPuntos(self.puntos, self.indices[clave])
+        return self.puntos.punto(self.indices[clave])
+
+    def __iter__(self) -> Iterator[PuntoVisita]:
+        base = self.puntos
+        lat = base.lat[self.indices].tolist()
+        lon = base.lon[self.indices].tolist()
+        for i, la, lo in zip(self.indices.tolist(), lat, lon):
+            yield PuntoVisita(la, lo, base.direccion[i], base.fecha[i])
+
+    @property
+    def lat(self) -> np.ndarray:
+        return self.puntos.lat[self.indices]
+
+    @property
+    def lon(self) -> np.ndarray:
+        return self.puntos.lon[self.indices]
+
+    def reordenar(self, orden: Sequence[int]) -> "GrupoPuntos":
+        """Vista con los puntos en el orden indicado (posiciones dentro del grupo)"""
+        return GrupoPuntos(self.puntos, self.indices[np.asarray(orden, dtype=np.intp)])
+
+def como_grupo(puntos: Sequence[PuntoVisita]) -> GrupoPuntos:
+    """Vista sobre los puntos; las listas de PuntoVisita se pasan a columnas una vez"""
+    if isinstance(puntos, GrupoPuntos):
+        return puntos
+    return PuntosArray.desde_puntos(puntos).vista()
@@ -0,0 +1,68 @@
+import logging
+import math
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Constantes
+MODOS_RENDER = ("auto", "marcadores", "cluster", "canvas")
+MAPA_MODO_RENDER = os.getenv("MAPA_MODO_RENDER", "auto")  # Cómo se dibujan los puntos de visita
+MAPA_UMBRAL_CLUSTER = int(os.getenv("MAPA_UMBRAL_CLUSTER", "500"))  # Desde estos puntos, auto usa cluster
+MAPA_SIMPLIFICAR_ZOOM = int(os.getenv("MAPA_SIMPLIFICAR_ZOOM", "17"))  # Zoom de referencia (0 no simplifica)
+METROS_POR_PIXEL_ECUADOR = 156543.03392  # Web Mercator en zoom 0
+
+def resolver_modo_render(modo: Optional[str], cantidad_puntos: int) -> str:
+    """Traduce el modo configurado (o auto) al modo efectivo según la cantidad de puntos"""
+    modo = modo or MAPA_MODO_RENDER
+    if modo not in MODOS_RENDER:
+        raise ValueError(f"Modo de render inválido: {modo}. Opciones: {', '.join(MODOS_RENDER)}")
+    if modo == "auto":
+        return "cluster" if cantidad_puntos >= MAPA_UMBRAL_CLUSTER else "marcadores"
+    return modo
+
+def tolerancia_para_zoom(lat: float, zoom: int, pixeles: float = 1.0) -> float:
+    """Metros que ocupa un número de píxeles en el zoom dado a esa latitud (Web Mercator)"""
+    return METROS_POR_PIXEL_ECUADOR * math.cos(math.radians(lat)) / (2 ** zoom) * pixeles
+
+def simplificar_polilinea(coords: Sequence[Tuple[float, float]], tolerancia_m: float) -> List[Tuple[float, float]]:
+    """
+    Douglas-Peucker sobre coordenadas (lat, lon): descarta los vértices que se desvían
+    menos de tolerancia_m metros del tramo simplificado. Conserva los extremos.
+    """
+    n = len(coords)
+    if n <= 2 or tolerancia_m <= 0:
+        return list(coords)
+
+    # Proyección equirectangular local en metros (suficiente a escala de ciudad)
+    puntos = np.asarray(coords, dtype=np.float64)
+    lat0 = np.radians(puntos[:, 0].mean())
+    escala = 6371000.0 * np.pi / 180.0
+    xy = np.column_stack([puntos[:, 1] * escala * np.cos(lat0), puntos[:, 0] * escala])
+
+    conservar = np.zeros(n, dtype=bool)
+    conservar[[0, n - 1]] = True
+    pendientes = [(0, n - 1)]
+    while pendientes:
+        inicio, fin = pendientes.pop()
+        if fin - inicio < 2:
+            continue
+        a, b = xy[inicio], xy[fin]
+        intermedios = xy[inicio + 1:fin]
+        ab = b - a
+        largo = np.hypot(ab[0], ab[1])
+        if largo == 0:
+            distancias = np.hypot(*(intermedios - a).T)
+        else:
+            distancias = np.abs(ab[0] * (intermedios[:, 1] - a[1]) - ab[1] * (intermedios[:, 0] - a[0])) / largo
+        k = int(distancias.argmax())
+        if distancias[k] > tolerancia_m:
+            medio = inicio + 1 + k
+            conservar[medio] = True
+            pendientes.append((inicio, medio))
+            pendientes.append((medio, fin))
+
+    return [tuple(c) for c in puntos[conservar].tolist()]
@@ -1,21 +1,12 @@
-import math
 from datetime import datetime
+from app.services.distancias import haversine_km
 
 def haversine(lat1, lon1, lat2, lon2):
     """
     Calcula la distancia en kilómetros entre dos puntos geográficos usando la fórmula de Haversine.
+    Para muchos puntos a la vez usar app.services.distancias.
     """
-    R = 6371  # Radio de la Tierra en km
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-
-    a = math.sin(delta_phi / 2) ** 2 + \
-        math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-    return R * c
+    return float(haversine_km(lat1, lon1, lat2, lon2))
 
 def validar_lista_no_vacia(lista, nombre="lista"):
     """
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Compara el agrupamiento original (DBSCAN euclidiano con eps en grados) con el
+motor haversine (BallTree) y la grilla, sobre datos sintéticos de Lima.
+
+Uso:
+    python -m benchmarks.bench_agrupamiento --tamanos 1000 10000 100000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.cluster import DBSCAN
+
+from app.services.agrupamiento import agrupar_balltree, agrupar_grilla
+from benchmarks.generadores import GENERADORES
+
+RADIO_KM = 0.5
+LIMITE_DBSCAN = 50000  # Por encima, los DBSCAN tardan demasiado para un benchmark
+
+
+def agrupar_original(lat, lon, radio_km):
+    """Implementación previa: eps en grados (radio / 111) sobre lat/lon crudos"""
+    return DBSCAN(eps=radio_km / 111.0, min_samples=1).fit(np.column_stack([lat, lon])).labels_
+
+
+def medir(funcion, *args):
+    inicio = time.perf_counter()
+    etiquetas = funcion(*args)
+    return time.perf_counter() - inicio, len(np.unique(etiquetas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--radio", type=float, default=RADIO_KM)
+    args = parser.parse_args()
+
+    print(f"{'datos':<15}{'n':>8}  {'motor':<10}{'segundos':>10}{'grupos':>9}")
+    for nombre, generador in GENERADORES.items():
+        for n in args.tamanos:
+            lat, lon = generador(n)
+            motores = [("grilla", agrupar_grilla)]
+            if n <= LIMITE_DBSCAN:
+                motores = [("original", agrupar_original), ("balltree", agrupar_balltree)] + motores
+            for motor, funcion in motores:
+                segundos, grupos = medir(funcion, lat, lon, args.radio)
+                print(f"{nombre:<15}{n:>8}  {motor:<10}{segundos:>10.3f}{grupos:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga en proceso: mientras se reconstruyen mapas (?fresh=1) se lanzan
+solicitudes livianas a / y /mapa/status, y se reportan latencias p50/p99.
+Compara el router actual con un endpoint que ejecuta el pipeline dentro del
+event loop (como un `async def` que llama código bloqueante).
+
+Uso (requiere httpx, de requirements-dev.txt):
+    python -m benchmarks.bench_carga --puntos 300 --builds 4 --sondas 200
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("HOTEL_MELIA_LIMA_COORDS", "-12.0926987,-77.0552319")
+os.environ.setdefault("CACHE_DB_PATH", "")
+os.environ.setdefault("CORS_ORIGINS", "http://localhost")
+os.environ.setdefault("GOOGLE_MAPS_API_KEY", "clave-falsa")
+os.environ.setdefault("MAPA_PRECALCULAR", "false")
+os.environ.setdefault("MAPA_REFRESCO_S", "0")
+
+import googlemaps  # noqa: E402
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+
+from benchmarks.fakes import FakeGoogleMapsClient  # noqa: E402
+from benchmarks.generadores import a_registros, multi_distrito  # noqa: E402
+
+
+def percentiles(latencias):
+    valores = np.array(latencias) * 1000
+    return np.percentile(valores, 50), np.percentile(valores, 99), valores.max()
+
+
+async def medir(app, ruta_build: str, builds: int, sondas: int, intervalo_s: float):
+    """
+    Lanza las reconstrucciones y, en paralelo, sondas a intervalos fijos (carga abierta).
+    La latencia de cada sonda se mide desde el momento en que debía enviarse, así
+    los bloqueos del event loop se reflejan aunque retrasen el envío.
+    """
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=None) as cliente:
+        latencias = {"build": [], "sonda": []}
+
+        async def solicitar(tipo, ruta, programada):
+            respuesta = await cliente.get(ruta)
+            latencias[tipo].append(time.perf_counter() - programada)
+            assert respuesta.status_code in (200, 304), f"{ruta}: {respuesta.status_code}"
+
+        async def programar(tipo, ruta, programada):
+            await asyncio.sleep(max(0.0, programada - time.perf_counter()))
+            await solicitar(tipo, ruta, programada)
+
+        inicio = time.perf_counter()
+        rutas_sonda = ["/", "/mapa/status"]
+        tareas = [
+            programar("sonda", rutas_sonda[i % 2], inicio + i * intervalo_s)
+            for i in range(sondas)
+        ]
+        tareas += [programar("build", f"{ruta_build}&b={i}", inicio + 0.05) for i in range(builds)]
+        await asyncio.gather(*tareas)
+        total = time.perf_counter() - inicio
+    return latencias, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--puntos", type=int, default=300)
+    parser.add_argument("--builds", type=int, default=4, help="Reconstrucciones simultáneas del mapa")
+    parser.add_argument("--sondas", type=int, default=200, help="Solicitudes livianas en total")
+    parser.add_argument("--intervalo", type=float, default=0.01, help="Segundos entre sondas")
+    parser.add_argument("--latencia", type=float, default=0.05, help="Latencia falsa de Google y SheetDB")
+    args = parser.parse_args()
+
+    lat, lon = multi_distrito(args.puntos, semilla=1)
+    datos = a_registros(lat, lon)
+    cliente_falso = FakeGoogleMapsClient(latencia_s=args.latencia)
+    googlemaps.Client = lambda *a, **k: cliente_falso
+
+    def hoja_falsa():
+        time.sleep(args.latencia)
+        return datos
+
+    def sonda_falsa(timeout_s: float = 10) -> str:
+        time.sleep(args.latencia)
+        return "conectado"
+
+    sys.path.insert(0, os.getcwd())
+    from fastapi.responses import HTMLResponse
+
+    import app.services.mapa_rutas as mapa_rutas
+    from app.main import app
+    from app.services.precomputo import OpcionesMapa, gestor_mapa
+
+    # El gestor y el router importan estas funciones de mapa_rutas al usarlas
+    mapa_rutas.obtener_datos_google_sheets = hoja_falsa
+    mapa_rutas.verificar_sheetdb = sonda_falsa
+
+    # Endpoint de referencia: el pipeline bloquea el event loop
+    @app.get("/bench/bloqueante", response_class=HTMLResponse)
+    async def bloqueante(b: int = 0):
+        render = gestor_mapa.obtener(OpcionesMapa.desde_parametros(optimizador="google"), fresco=True)
+        return HTMLResponse(render.contenido)
+
+    # El pipeline escribe el HTML en el directorio actual
+    os.chdir(tempfile.mkdtemp(prefix="bench_carga_"))
+
+    print(f"Puntos: {args.puntos}  builds: {args.builds}  sondas: {args.sondas}  latencia: {args.latencia}s")
+    escenarios = [
+        ("bloqueante", "/bench/bloqueante?x=0"),
+        ("actual", "/mapa/rutas?optimizador=google&fresh=1"),
+    ]
+    for nombre, ruta in escenarios:
+        latencias, total = asyncio.run(medir(app, ruta, args.builds, args.sondas, args.intervalo))
+        p50_s, p99_s, max_s = percentiles(latencias["sonda"])
+        p50_b, p99_b, _ = percentiles(latencias["build"])
+        print(
+            f"{nombre:>10}: total {total:.2f}s | sondas p50 {p50_s:.1f} ms  p99 {p99_s:.1f} ms  max {max_s:.1f} ms"
+            f" | builds p50 {p50_b:.0f} ms  p99 {p99_b:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
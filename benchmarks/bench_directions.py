@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Compara la obtención secuencial y concurrente de rutas por grupo usando un
+cliente de Google Maps falso con latencia configurable.
+
+Uso:
+    python -m benchmarks.bench_directions --grupos 40 --latencia 0.2
+"""
+
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault("HOTEL_MELIA_LIMA_COORDS", "-12.0926987,-77.0552319")
+os.environ.setdefault("CACHE_DB_PATH", "")
+
+from app.services.mapa_rutas import (  # noqa: E402
+    PuntoVisita,
+    obtener_ruta_optimizada_grupo,
+    obtener_rutas_grupos,
+)
+from benchmarks.fakes import FakeGoogleMapsClient  # noqa: E402
+
+
+def generar_grupos(cantidad: int, puntos_por_grupo: int):
+    rnd = random.Random(42)
+    grupos = []
+    for g in range(cantidad):
+        lat0 = -12.05 - rnd.random() * 0.15
+        lon0 = -77.10 + rnd.random() * 0.15
+        grupos.append([
+            PuntoVisita(lat0 + rnd.random() * 0.003, lon0 + rnd.random() * 0.003, f"Dirección {g}-{i}", "")
+            for i in range(puntos_por_grupo)
+        ])
+    return grupos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--grupos", type=int, default=40)
+    parser.add_argument("--puntos", type=int, default=5)
+    parser.add_argument("--latencia", type=float, default=0.2)
+    parser.add_argument("--concurrencia", type=int, default=8)
+    args = parser.parse_args()
+
+    grupos = generar_grupos(args.grupos, args.puntos)
+
+    cliente = FakeGoogleMapsClient(latencia_s=args.latencia)
+    inicio = time.perf_counter()
+    secuencial = [(g, obtener_ruta_optimizada_grupo(cliente, g, cache=None)) for g in grupos]
+    t_secuencial = time.perf_counter() - inicio
+
+    cliente = FakeGoogleMapsClient(latencia_s=args.latencia)
+    inicio = time.perf_counter()
+    concurrente = obtener_rutas_grupos(cliente, grupos, max_concurrentes=args.concurrencia, cache=None)
+    t_concurrente = time.perf_counter() - inicio
+
+    assert [g for g, _ in secuencial] == [g for g, _ in concurrente], "El orden de los grupos no coincide"
+
+    print(f"Grupos: {args.grupos}  latencia: {args.latencia}s  concurrencia: {args.concurrencia}")
+    print(f"Secuencial: {t_secuencial:.2f}s")
+    print(f"Concurrente: {t_concurrente:.2f}s  (x{t_secuencial / t_concurrente:.1f})")
+
+
+if __name__ == "__main__":
+    main()
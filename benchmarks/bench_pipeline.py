@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Suite reproducible y sin red del pipeline completo (generar_mapa_rutas): la hoja
+se sirve desde un SheetDB falso por HTTP local y Directions desde un cliente de
+Google falso con latencia configurable. Para cada generador de puntos y tamaño
+mide cada etapa (sheetdb, ingesta, agrupamiento, rutas, render) con la cache de
+rutas vacía (frío) y, con --caliente, otra vez con la hoja y la cache ya cargadas.
+Guarda los resultados en JSON y, con --comparar, marca las etapas que empeoraron
+respecto de una corrida anterior (sale con código 1 si alguna supera la tolerancia).
+
+Uso:
+    python -m benchmarks.bench_pipeline --tamanos 100 1000 10000 100000 --caliente --salida resultados.json
+    python -m benchmarks.bench_pipeline --tamanos 1000 10000 --comparar resultados.json --tolerancia 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks.fakes import FakeGoogleMapsClient, ServidorSheetDBFalso
+from benchmarks.generadores import GENERADORES, a_registros
+
+# El servidor falso debe existir antes de importar la aplicación (API_SHEET_URL se lee al importar)
+servidor_hoja = ServidorSheetDBFalso()
+os.environ["API_SHEET_URL"] = servidor_hoja.iniciar()
+os.environ.setdefault("HOTEL_MELIA_LIMA_COORDS", "-12.0926987,-77.0552319")
+os.environ.setdefault("GOOGLE_MAPS_API_KEY", "clave-falsa")
+os.environ["CACHE_DB_PATH"] = ""
+os.environ.pop("HOTEL_MELIA_LIMA_DIRECCION", None)
+
+import googlemaps  # noqa: E402
+import numpy as np  # noqa: E402
+
+cliente_falso = FakeGoogleMapsClient()
+googlemaps.Client = lambda *a, **k: cliente_falso
+
+import app.services.mapa_rutas as mapa_rutas  # noqa: E402
+from app.services.hoja_sheetdb import SincronizadorHoja  # noqa: E402
+from app.services.mapa_rutas import cache_rutas, generar_mapa_rutas  # noqa: E402
+from app.services.opciones import OPTIMIZADORES, PLANES  # noqa: E402
+from app.services.metricas import medir_etapas, metricas  # noqa: E402
+from app.services.precarga import precargar_dependencias  # noqa: E402
+
+UMBRAL_RUIDO_S = 0.02  # Diferencias menores (en segundos) no cuentan como regresión
+
+
+def construir(optimizador: str, plan: str):
+    """Una construcción completa del mapa, con el tiempo de cada etapa"""
+    llamadas = cliente_falso.llamadas
+    inicio = time.perf_counter()
+    with medir_etapas() as etapas:
+        html = generar_mapa_rutas(incremental=False, optimizador=optimizador, plan=plan)
+    return {
+        "etapas": dict(etapas),
+        "total_s": time.perf_counter() - inicio,
+        "rutas": int(metricas.valor("mapa_rutas") or 0),
+        "llamadas_google": cliente_falso.llamadas - llamadas,
+        "bytes": len(html.encode("utf-8")),
+    }
+
+
+def medir(generador: str, n: int, args) -> list:
+    """Mediana de las repeticiones de cada fase (frío y, opcionalmente, caliente)"""
+    lat, lon = GENERADORES[generador](n, semilla=n)
+    servidor_hoja.cargar(a_registros(lat, lon))
+    fases = {"frio": [], "caliente": []}
+    for _ in range(args.repeticiones):
+        # Snapshot y cache vacíos: la hoja se descarga completa y todas las rutas se piden
+        mapa_rutas.sincronizador_hoja = SincronizadorHoja(url=os.environ["API_SHEET_URL"])
+        cache_rutas.vaciar()
+        fases["frio"].append(construir(args.optimizador, args.plan))
+        if args.caliente:
+            fases["caliente"].append(construir(args.optimizador, args.plan))
+
+    resultados = []
+    for fase, corridas in fases.items():
+        if not corridas:
+            continue
+        nombres = list(dict.fromkeys(nombre for corrida in corridas for nombre in corrida["etapas"]))
+        resultados.append({
+            "generador": generador,
+            "puntos": n,
+            "fase": fase,
+            "optimizador": args.optimizador,
+            "plan": args.plan,
+            "etapas_s": {
+                nombre: round(statistics.median(c["etapas"].get(nombre, 0.0) for c in corridas), 4)
+                for nombre in nombres
+            },
+            "total_s": round(statistics.median(c["total_s"] for c in corridas), 4),
+            "rutas": corridas[-1]["rutas"],
+            "llamadas_google": corridas[-1]["llamadas_google"],
+            "bytes_html": corridas[-1]["bytes"],
+        })
+    return resultados
+
+
+def comparar(resultados: list, base: dict, tolerancia: float) -> list:
+    """Etapas más lentas que en la corrida base por encima de la tolerancia relativa"""
+    anteriores = {
+        (r["generador"], r["puntos"], r["fase"], r["optimizador"], r["plan"]): r for r in base["resultados"]
+    }
+    regresiones = []
+    for r in resultados:
+        anterior = anteriores.get((r["generador"], r["puntos"], r["fase"], r["optimizador"], r["plan"]))
+        if anterior is None:
+            continue
+        for nombre, segundos in list(r["etapas_s"].items()) + [("total", r["total_s"])]:
+            previo = anterior["total_s"] if nombre == "total" else anterior["etapas_s"].get(nombre)
+            if previo is None:
+                continue
+            if segundos > previo * (1 + tolerancia) and segundos - previo > UMBRAL_RUIDO_S:
+                regresiones.append(
+                    f"{r['generador']} {r['puntos']} {r['fase']} {nombre}: {previo:.3f}s -> {segundos:.3f}s "
+                    f"(+{(segundos / previo - 1) * 100:.0f}%)"
+                )
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--generadores", nargs="+", choices=list(GENERADORES), default=list(GENERADORES))
+    parser.add_argument("--optimizador", choices=OPTIMIZADORES, default="google")
+    parser.add_argument("--plan", choices=PLANES, default="grupos")
+    parser.add_argument("--latencia", type=float, default=0.01, help="Latencia falsa de Google Directions (s)")
+    parser.add_argument("--latencia-hoja", type=float, default=0.0, help="Latencia falsa por solicitud a SheetDB (s)")
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--caliente", action="store_true", help="Medir también una segunda construcción con cache")
+    parser.add_argument("--salida", default="bench_pipeline.json", help="Archivo JSON de resultados")
+    parser.add_argument("--comparar", default=None, help="Resultados anteriores con los que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Empeoramiento relativo tolerado")
+    args = parser.parse_args()
+
+    cliente_falso.latencia_s = args.latencia
+    servidor_hoja.latencia_s = args.latencia_hoja
+    precargar_dependencias()  # Como el arranque de la aplicación: la primera medición no paga los imports
+
+    resultados = []
+    print(f"{'generador':>15} {'puntos':>7} {'fase':>8} {'total':>8}  etapas")
+    for n in args.tamanos:
+        for generador in args.generadores:
+            for r in medir(generador, n, args):
+                resultados.append(r)
+                etapas = "  ".join(f"{nombre} {segundos:.3f}" for nombre, segundos in r["etapas_s"].items())
+                print(f"{generador:>15} {n:>7} {r['fase']:>8} {r['total_s']:>7.2f}s  {etapas}")
+
+    informe = {
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar")},
+        "resultados": resultados,
+    }
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados en {args.salida}")
+    servidor_hoja.detener()
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia)
+        if regresiones:
+            print(f"\n{len(regresiones)} etapas más lentas que en {args.comparar}:")
+            print("\n".join(f"  {linea}" for linea in regresiones))
+            sys.exit(1)
+        print(f"Sin regresiones respecto de {args.comparar} (tolerancia {args.tolerancia:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Mide el planificador de flota (varios depósitos y vehículos con capacidad o jornada)
+sobre datos sintéticos de Lima: tiempo total, kilómetros y carga por vehículo,
+con y sin la búsqueda local de cada ruta.
+
+Uso:
+    python -m benchmarks.bench_planificador --tamanos 1000 3000 5000 --depositos 3 --vehiculos 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("HOTEL_MELIA_LIMA_COORDS", "-12.0926987,-77.0552319")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np  # noqa: E402
+
+from app.services.planificador import Deposito, Flota, Vehiculo, planificar_rutas  # noqa: E402
+from app.services.puntos import PuntosArray  # noqa: E402
+from benchmarks.generadores import multi_distrito  # noqa: E402
+
+# Depósitos de ejemplo: San Isidro, Surco, Los Olivos, Chorrillos, Ate
+DEPOSITOS = [
+    ("San Isidro", -12.0927, -77.0552),
+    ("Surco", -12.1400, -76.9900),
+    ("Los Olivos", -11.9900, -77.0700),
+    ("Chorrillos", -12.1700, -77.0200),
+    ("Ate", -12.0400, -76.9300),
+]
+
+
+def flota_ejemplo(depositos: int, vehiculos: int, max_minutos: float) -> Flota:
+    return Flota(
+        depositos=[Deposito(nombre, lat, lon) for nombre, lat, lon in DEPOSITOS[:depositos]],
+        vehiculos=[
+            Vehiculo(f"{DEPOSITOS[d][0]} {v + 1}", deposito=d, max_minutos=max_minutos or None)
+            for d in range(depositos) for v in range(vehiculos)
+        ],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 3000, 5000])
+    parser.add_argument("--depositos", type=int, default=3, choices=range(1, len(DEPOSITOS) + 1))
+    parser.add_argument("--vehiculos", type=int, default=4, help="Vehículos por depósito")
+    parser.add_argument("--max-minutos", type=float, default=0, help="Jornada por vehículo (0: sin límite)")
+    parser.add_argument("--presupuesto", type=float, default=5.0, help="Segundos de búsqueda local en total")
+    args = parser.parse_args()
+
+    flota = flota_ejemplo(args.depositos, args.vehiculos, args.max_minutos)
+    print(f"{'puntos':>7} {'búsqueda':>9} {'tiempo':>8} {'km':>9} {'paradas min-max':>16} {'sin asignar':>12}")
+    for n in args.tamanos:
+        lat, lon = multi_distrito(n, semilla=n)
+        puntos = PuntosArray(np.asarray(lat), np.asarray(lon), [f"Dirección {i}" for i in range(n)],
+                             ["2025-07-01 10:00"] * n, np.arange(n))
+        for presupuesto in (0.0, args.presupuesto):
+            inicio = time.perf_counter()
+            plan = planificar_rutas(puntos, flota, presupuesto_s=presupuesto)
+            duracion = time.perf_counter() - inicio
+            km = sum(r.distancia_km for r in plan.rutas)
+            paradas = [len(r.puntos) for r in plan.rutas]
+            busqueda = f"{presupuesto:.0f}s" if presupuesto else "no"
+            print(f"{n:>7} {busqueda:>9} {duracion:>7.2f}s {km:>9.1f} "
+                  f"{f'{min(paradas)}-{max(paradas)}':>16} {len(plan.sin_asignar):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Mide el tamaño del HTML y el tiempo de construcción del mapa según la cantidad
+de puntos, para cada modo de render y con o sin simplificación de polilíneas.
+Las rutas son sintéticas: recorridos tipo calle con un vértice cada 10 m,
+que la simplificación reduce a sus esquinas.
+
+Uso:
+    python -m benchmarks.bench_render --tamanos 500 2000 5000
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("HOTEL_MELIA_LIMA_COORDS", "-12.0926987,-77.0552319")
+os.environ.setdefault("CACHE_DB_PATH", "")
+os.environ.pop("HOTEL_MELIA_LIMA_DIRECCION", None)
+
+import numpy as np  # noqa: E402
+import polyline  # noqa: E402
+
+import app.services.mapa_rutas as mapa_rutas  # noqa: E402
+from app.services.mapa_rutas import (  # noqa: E402
+    PuntoVisita,
+    agrupar_puntos_geograficamente,
+    crear_mapa_interactivo,
+    obtener_coordenadas_origen,
+)
+from app.services.precarga import precargar_dependencias  # noqa: E402
+from benchmarks.generadores import multi_distrito  # noqa: E402
+
+
+def ruta_densa(grupo, paso_m: float = 10.0):
+    """
+    Polilínea tipo calle: une el origen y los puntos del grupo con tramos en "L"
+    (primero en latitud, luego en longitud) y un vértice cada paso_m metros
+    """
+    paradas = [obtener_coordenadas_origen()] + [(p.lat, p.lon) for p in grupo]
+    coords = [paradas[0]]
+    for (lat_a, lon_a), (lat_b, lon_b) in zip(paradas[:-1], paradas[1:]):
+        for inicio, fin in (((lat_a, lon_a), (lat_b, lon_a)), ((lat_b, lon_a), (lat_b, lon_b))):
+            metros = max(abs(fin[0] - inicio[0]), abs(fin[1] - inicio[1])) * 111_000
+            t = np.linspace(0, 1, max(int(metros / paso_m), 1) + 1)[1:, None]
+            coords.extend(map(tuple, np.array(inicio) + (np.array(fin) - np.array(inicio)) * t))
+    return {"overview_polyline": {"points": polyline.encode(coords)}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[500, 2000, 5000])
+    parser.add_argument("--modos", nargs="+", default=["marcadores", "cluster", "canvas"])
+    args = parser.parse_args()
+    precargar_dependencias()  # Como el arranque de la aplicación: la primera medición no paga los imports
+
+    zoom_simplificacion = mapa_rutas.MAPA_SIMPLIFICAR_ZOOM or 17
+    print(f"{'puntos':>7} {'modo':>10} {'simplif.':>8} {'tiempo':>8} {'HTML':>10}")
+    for n in args.tamanos:
+        lat, lon = multi_distrito(n, semilla=n)
+        puntos = [PuntoVisita(la, lo, f"Dirección {i}", "2025-07-01 10:00") for i, (la, lo) in enumerate(zip(lat, lon))]
+        grupos = agrupar_puntos_geograficamente(puntos)
+        grupos_rutas = [(g, ruta_densa(g)) for g in grupos]
+
+        for modo in args.modos:
+            for zoom in (0, zoom_simplificacion):
+                mapa_rutas.MAPA_SIMPLIFICAR_ZOOM = zoom
+                inicio = time.perf_counter()
+                html = crear_mapa_interactivo(grupos_rutas, modo_render=modo)
+                duracion = time.perf_counter() - inicio
+                simplificado = f"z{zoom}" if zoom else "no"
+                print(f"{n:>7} {modo:>10} {simplificado:>8} {duracion:>7.2f}s {len(html) / 1024:>8.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Dobles locales de los servicios externos para medir el pipeline sin red ni API keys
+"""
+
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import polyline
+
+
+class FakeGoogleMapsClient:
+    """
+    Sustituto de googlemaps.Client que responde Directions con una latencia fija.
+    La ruta devuelta es la línea recta entre origen, waypoints y destino.
+    """
+    def __init__(self, latencia_s: float = 0.2):
+        self.latencia_s = latencia_s
+        self.llamadas = 0
+        self._lock = threading.Lock()
+
+    def directions(self, origin, destination, waypoints=None, optimize_waypoints=False, mode="driving", **kwargs):
+        with self._lock:
+            self.llamadas += 1
+        time.sleep(self.latencia_s)
+
+        paradas = [origin] + list(waypoints or []) + [destination]
+        coords = []
+        for parada in paradas:
+            try:
+                lat, lon = map(float, str(parada).split(","))
+                coords.append((lat, lon))
+            except ValueError:
+                continue
+
+        return [{
+            "overview_polyline": {"points": polyline.encode(coords)},
+            "waypoint_order": list(range(len(waypoints or []))),
+            "legs": [],
+        }]
+
+    def geocode(self, address, **kwargs):
+        with self._lock:
+            self.llamadas += 1
+        time.sleep(self.latencia_s)
+        return []
+
+
+class ServidorSheetDBFalso:
+    """
+    API de SheetDB local sobre http.server, en un hilo: filas en JSON, /count,
+    paginación limit/offset y ETag/If-None-Match, con una latencia fija por solicitud.
+    Con error_conteo, /count responde ese código de estado.
+    """
+    def __init__(self, datos=None, latencia_s: float = 0.0, con_conteo: bool = True, error_conteo: int = 0):
+        self.latencia_s = latencia_s
+        self.con_conteo = con_conteo
+        self.error_conteo = error_conteo
+        self.solicitudes = 0
+        self._lock = threading.Lock()
+        self._servidor = None
+        self._hilo = None
+        self.cargar(datos or [])
+
+    def cargar(self, datos):
+        """Reemplaza el contenido de la hoja"""
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self.datos = list(datos)
+            self._cuerpo = cuerpo
+            self._etag = '"' + hashlib.sha1(cuerpo).hexdigest() + '"'
+
+    @property
+    def url(self) -> str:
+        host, puerto = self._servidor.server_address[:2]
+        return f"http://{host}:{puerto}/api/v1/falsa"
+
+    def _responder(self, handler):
+        with self._lock:
+            self.solicitudes += 1
+            datos, cuerpo, etag = self.datos, self._cuerpo, self._etag
+        time.sleep(self.latencia_s)
+
+        partes = urlsplit(handler.path)
+        consulta = dict(parse_qsl(partes.query))
+        encabezados = {}
+        if partes.path.rstrip("/").endswith("/count"):
+            if not self.con_conteo or self.error_conteo:
+                handler.send_error(self.error_conteo or 404)
+                return
+            cuerpo = json.dumps({"rows": len(datos)}).encode("utf-8")
+        elif "limit" in consulta or "offset" in consulta:
+            inicio = int(consulta.get("offset", 0))
+            fin = inicio + int(consulta["limit"]) if "limit" in consulta else len(datos)
+            cuerpo = json.dumps(datos[inicio:fin], ensure_ascii=False).encode("utf-8")
+        else:
+            encabezados["ETag"] = etag
+            if handler.headers.get("If-None-Match") == etag:
+                handler.send_response(304)
+                handler.send_header("ETag", etag)
+                handler.end_headers()
+                return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json; charset=utf-8")
+        handler.send_header("Content-Length", str(len(cuerpo)))
+        for nombre, valor in encabezados.items():
+            handler.send_header(nombre, valor)
+        handler.end_headers()
+        handler.wfile.write(cuerpo)
+
+    def iniciar(self) -> str:
+        """Levanta el servidor en un puerto libre de localhost y retorna la URL de la API"""
+        servidor_falso = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                servidor_falso._responder(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._servidor.daemon_threads = True
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, name="sheetdb-falso", daemon=True)
+        self._hilo.start()
+        return self.url
+
+    def detener(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *args):
+        self.detener()
@@ -0,0 +1,71 @@
+"""
+Generadores de puntos de visita sintéticos con la extensión de Lima Metropolitana
+"""
+
+import numpy as np
+
+# Rectángulo aproximado de Lima Metropolitana
+LAT_MIN, LAT_MAX = -12.25, -11.90
+LON_MIN, LON_MAX = -77.15, -76.85
+CENTRO_LIMA = (-12.0464, -77.0428)
+
+DISTRITOS_LIMA = {
+    "San Isidro": (-12.0977, -77.0365),
+    "Miraflores": (-12.1211, -77.0297),
+    "Cercado de Lima": (-12.0464, -77.0428),
+    "Surco": (-12.1450, -76.9910),
+    "La Molina": (-12.0870, -76.9360),
+    "San Miguel": (-12.0770, -77.0830),
+    "Los Olivos": (-11.9680, -77.0700),
+    "San Juan de Lurigancho": (-11.9820, -77.0040),
+    "Chorrillos": (-12.1700, -77.0150),
+    "Ate": (-12.0250, -76.9200),
+}
+
+
+def uniforme(n: int, semilla: int = 0):
+    """Puntos distribuidos uniformemente en el rectángulo de Lima"""
+    rng = np.random.default_rng(semilla)
+    return rng.uniform(LAT_MIN, LAT_MAX, n), rng.uniform(LON_MIN, LON_MAX, n)
+
+
+def centro_denso(n: int, semilla: int = 0, desviacion_km: float = 1.5):
+    """Puntos concentrados alrededor del centro de Lima"""
+    rng = np.random.default_rng(semilla)
+    sigma = desviacion_km / 111.0
+    return (
+        rng.normal(CENTRO_LIMA[0], sigma, n),
+        rng.normal(CENTRO_LIMA[1], sigma, n),
+    )
+
+
+def multi_distrito(n: int, semilla: int = 0, desviacion_km: float = 1.0):
+    """Puntos repartidos entre varios distritos de Lima"""
+    rng = np.random.default_rng(semilla)
+    centros = np.array(list(DISTRITOS_LIMA.values()))
+    elegidos = centros[rng.integers(0, len(centros), n)]
+    sigma = desviacion_km / 111.0
+    return (
+        elegidos[:, 0] + rng.normal(0, sigma, n),
+        elegidos[:, 1] + rng.normal(0, sigma, n),
+    )
+
+
+GENERADORES = {
+    "uniforme": uniforme,
+    "centro_denso": centro_denso,
+    "multi_distrito": multi_distrito,
+}
+
+
+def a_registros(lat, lon):
+    """Convierte coordenadas en filas con el formato que devuelve SheetDB"""
+    return [
+        {
+            "Latitud": f"{la:.7f}",
+            "Longitud": f"{lo:.7f}",
+            "Dirección": f"Punto {i}",
+            "FechaHora": "2025-07-01 10:00",
+        }
+        for i, (la, lo) in enumerate(zip(lat, lon))
+    ]
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Genera por lotes los mapas de rutas de cada día (y opcionalmente de cada región)
+de la hoja, procesando las particiones en paralelo. Deja un archivo por partición
+y resumen_lote.json (tiempos, llamadas a Google y caches) en el directorio de salida.
+
+Uso:
+    python generar_lote.py --salida mapas --procesos 4 --formatos html geojson
+    python generar_lote.py --desde 2025-07-01 --hasta 2025-07-07 --region deposito
+"""
+
+import argparse
+import json
+import logging
+import os
+
+from dotenv import load_dotenv
+
+# Las constantes de los servicios se leen del entorno al importarlos
+load_dotenv()
+
+from app.services.lote import FORMATOS_LOTE, LOTE_PROCESOS, REGIONES, ejecutar_lote  # noqa: E402
+from app.services.mapa_rutas import OPTIMIZADORES, PLANES, obtener_datos_google_sheets  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--salida", default="mapas_lote", help="Directorio de salida")
+    parser.add_argument("--procesos", type=int, default=LOTE_PROCESOS, help="Procesos en paralelo (0: uno por núcleo)")
+    parser.add_argument("--optimizador", choices=OPTIMIZADORES, default=None)
+    parser.add_argument("--plan", choices=PLANES, default="grupos")
+    parser.add_argument("--formatos", nargs="+", choices=FORMATOS_LOTE, default=["html"])
+    parser.add_argument("--region", choices=REGIONES, default="ninguna",
+                        help="Partición además del día: ninguna o depósito más cercano (PLAN_FLOTA)")
+    parser.add_argument("--columna-region", default=None, help="Columna de la hoja que define la región")
+    parser.add_argument("--desde", default=None, help="Primer día a generar (AAAA-MM-DD)")
+    parser.add_argument("--hasta", default=None, help="Último día a generar (AAAA-MM-DD)")
+    parser.add_argument("--entrada", default=None, help="Archivo JSON con las filas (en lugar de SheetDB)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.entrada:
+        with open(args.entrada, encoding="utf-8") as f:
+            datos = json.load(f)
+    else:
+        datos = obtener_datos_google_sheets()
+
+    resumen = ejecutar_lote(
+        datos, args.salida, procesos=args.procesos, optimizador=args.optimizador, plan=args.plan,
+        formatos=tuple(args.formatos), region=args.region, columna_region=args.columna_region,
+        desde=args.desde, hasta=args.hasta,
+    )
+
+    print(f"\n{'día':<12} {'región':<20} {'filas':>6} {'rutas':>6} {'tiempo':>8}  estado")
+    for detalle in resumen["detalle"]:
+        estado = f"error: {detalle['error']}" if detalle["error"] else "ok"
+        print(f"{detalle['dia']:<12} {detalle['region'][:20]:<20} {detalle['filas']:>6} "
+              f"{detalle['rutas']:>6} {detalle['duracion_s']:>7.2f}s  {estado}")
+    print(f"\n📦 {resumen['particiones']} particiones con {resumen['procesos']} procesos "
+          f"en {resumen['duracion_s']:.2f}s (suma {resumen['suma_duraciones_s']:.2f}s)")
+    print(f"📡 Llamadas a Google: {resumen['llamadas_api'] or 'ninguna'}")
+    print(f"🗂️  Cache de rutas: {resumen['cache_rutas']}")
+    print(f"📁 Resumen: {os.path.join(args.salida, 'resumen_lote.json')}")
+    if resumen["errores"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
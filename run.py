@@ -14,17 +14,21 @@ if __name__ == "__main__":
         port = int(os.getenv("PORT", "8000"))
         reload = False
         log_level = "info"
+        # Procesos uvicorn; comparten las caches, los mapas y los bloqueos de construcción
+        workers = int(os.getenv("WEB_CONCURRENCY", "2"))
     else:
         # Configuración para desarrollo local
         host = os.getenv("HOST", "127.0.0.1")  # Solo conexiones locales
         port = int(os.getenv("PORT", "8000"))
         reload = True
         log_level = "debug"
+        workers = 1  # El auto-reload solo admite un proceso
     
     print(f"🚀 Iniciando servidor en modo: {environment}")
     print(f"📍 Host: {host}")
     print(f"🔌 Puerto: {port}")
     print(f"🔄 Auto-reload: {'Activado' if reload else 'Desactivado'}")
+    print(f"👷 Workers: {workers}")
     print(f"📝 Nivel de log: {log_level}")
     
     uvicorn.run(
@@ -32,6 +36,6 @@ if __name__ == "__main__":
         host=host, 
         port=port, 
         reload=reload,
-        workers=1,
+        workers=workers,
         log_level=log_level
     )
\ No newline at end of file
@@ -0,0 +1,7 @@
+import os
+
+# Entorno de prueba antes de importar la aplicación: sin disco, sin API keys reales ni reintentos HTTP
+os.environ["CACHE_DB_PATH"] = ""
+os.environ.setdefault("GOOGLE_MAPS_API_KEY", "AIza-clave-de-prueba")
+os.environ.setdefault("PRECARGAR_DEPENDENCIAS", "false")
+os.environ.setdefault("HTTP_REINTENTOS", "0")
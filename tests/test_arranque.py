@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+PESADOS = ("numpy", "googlemaps", "requests", "polyline", "sklearn", "scipy", "folium", "app.services.mapa_rutas")
+
+
+def test_importar_la_aplicacion_no_carga_dependencias_pesadas():
+    codigo = (
+        "import sys, app.main; "
+        f"print(','.join(m for m in {PESADOS!r} if m in sys.modules))"
+    )
+    entorno = dict(os.environ, CORS_ORIGINS="http://localhost", PRECARGAR_DEPENDENCIAS="false")
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, env=entorno,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True)
+    assert salida.stdout.splitlines()[-1] == ""
@@ -0,0 +1,19 @@
+from app.services.hoja_sheetdb import SincronizadorHoja
+from benchmarks.fakes import ServidorSheetDBFalso
+
+FILAS = [{"Direccion": f"Calle {i}", "Latitud": "-12.1", "Longitud": "-77.0"} for i in range(5)]
+
+
+def test_error_en_count_usa_la_descarga_completa_condicional():
+    with ServidorSheetDBFalso(FILAS, error_conteo=500) as servidor:
+        hoja = SincronizadorHoja(url=servidor.url, pagina=2)
+
+        assert hoja.contar_filas() is None
+        assert hoja.obtener() == FILAS
+        assert hoja.obtener() == FILAS
+        assert hoja.estado()["descargas_completas"] == 1
+        assert hoja.estado()["sin_cambios"] == 1
+
+        # El error es transitorio: /count se sigue consultando y, al volver, se usa
+        servidor.error_conteo = 0
+        assert hoja.contar_filas() == len(FILAS)
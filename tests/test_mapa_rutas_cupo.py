@@ -0,0 +1,25 @@
+from app.services import mapa_rutas
+from app.services.mapa_rutas import DIRECTIONS_MAX_CONCURRENTES, obtener_ruta_optimizada_grupo
+from app.services.puntos import PuntoVisita
+from benchmarks.fakes import FakeGoogleMapsClient
+
+
+def test_sin_cupo_de_directions_el_grupo_se_dibuja_recto(monkeypatch):
+    monkeypatch.setattr(mapa_rutas, "DIRECTIONS_TIMEOUT_S", 0.05)
+    grupo = [PuntoVisita(-12.09 + i * 0.001, -77.05 + i * 0.001, f"Calle {i}", None) for i in range(5)]
+    cliente = FakeGoogleMapsClient(latencia_s=0)
+
+    # Llamadas abandonadas de una construcción anterior ocupan todo el cupo
+    for _ in range(DIRECTIONS_MAX_CONCURRENTES):
+        assert mapa_rutas._cupo_directions.acquire(blocking=False)
+    try:
+        resultado = obtener_ruta_optimizada_grupo(cliente, grupo, cache=None, optimizador="google")
+    finally:
+        for _ in range(DIRECTIONS_MAX_CONCURRENTES):
+            mapa_rutas._cupo_directions.release()
+
+    assert cliente.llamadas == 0
+    assert resultado is not None
+    assert resultado["ruta"]["optimizador"] == "local"
+    assert resultado["ruta"]["overview_polyline"]["points"]
+    assert len(resultado["grupo_ordenado"]) == len(grupo)
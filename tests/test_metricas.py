@@ -0,0 +1,20 @@
+from app.routers.metricas import _muestras_servicios
+from app.services.metricas import metricas
+from app.services.precomputo import OpcionesMapa, RenderMapa, gestor_mapa
+
+
+def test_mapas_que_solo_difieren_en_ventana_exportan_series_distintas(monkeypatch):
+    render = RenderMapa.desde_texto("<html></html>", duracion_s=0.1, huella_datos="h")
+    monkeypatch.setattr(gestor_mapa, "_renders", {
+        OpcionesMapa(incremental=False, optimizador="local", ventana="ninguna"): render,
+        OpcionesMapa(incremental=False, optimizador="local", ventana="dia"): render,
+    })
+
+    edades = [m for m in _muestras_servicios() if m[0] == "mapa_edad_segundos"]
+    assert len(edades) == 2
+    assert {m[3]["ventana"] for m in edades} == {"ninguna", "dia"}
+
+    series = [linea.split(" ")[0] for linea in metricas.exportar().splitlines()
+              if linea.startswith("mapa_edad_segundos{")]
+    assert len(series) == 2
+    assert len(set(series)) == 2
@@ -0,0 +1,28 @@
+import threading
+
+from app.services.precomputo import GestorMapa, OpcionesMapa, RenderMapa
+
+
+def test_solicitud_fresca_no_se_une_a_una_revalidacion_normal(monkeypatch):
+    gestor = GestorMapa(intervalo_s=0)
+    liberar = threading.Event()
+    llamadas = []
+
+    def construir(opciones, forzar):
+        llamadas.append(forzar)
+        liberar.wait(5)
+        return RenderMapa.desde_texto("<html></html>", duracion_s=0, huella_datos=str(forzar))
+
+    monkeypatch.setattr(gestor, "_construir", construir)
+    opciones = OpcionesMapa(incremental=False, optimizador="local")
+    try:
+        normal = gestor._refrescar(opciones)
+        fresca = gestor._refrescar(opciones, forzar=True)
+        assert fresca is not normal
+        assert gestor._refrescar(opciones, forzar=True) is fresca
+        liberar.set()
+        assert fresca.result(5).huella_datos == "True"
+        assert sorted(llamadas) == [False, True]
+    finally:
+        liberar.set()
+        gestor.detener()